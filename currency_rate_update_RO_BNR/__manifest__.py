@@ -3,9 +3,9 @@
     "name": "Currency Rate Update - BNR",
     "category": "Financial Management/Configuration",
     "summary": "Currency Rate Update National Bank of Romania service",
-    "depends": ["base", "currency_rate_update"],
+    "depends": ["base", "currency_rate_update", "l10n_ro_config"],
     "license": "AGPL-3",
-    "version": "14.0.1.4.0",
+    "version": "14.0.1.5.0",
     "author": "NextERP Romania,"
     "Forest and Biomass Romania,"
     "Odoo Community Association (OCA)",
@@ -2,12 +2,27 @@
 # Copyright 2020 NextERP Romania SRL
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
 
+import json
+import logging
+import os
 import xml.sax
 from collections import defaultdict
-from datetime import timedelta
-from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import BytesIO
 
-from odoo import api, fields, models
+from lxml import etree
+
+from odoo import _, api, fields, models, tools
+from odoo.exceptions import UserError
+
+from odoo.addons.l10n_ro_config.tools import http_client
+
+_logger = logging.getLogger(__name__)
+
+BNR_YEAR_URL = "http://www.bnr.ro/files/xml/years/nbrfxrates%s.xml"
+MAX_WORKERS = 4
+CUBE_TAGS = ("{http://www.bnr.ro/xsd}Cube", "Cube")
 
 
 class ResCurrencyRate(models.Model):
@@ -73,6 +88,110 @@ class ResCurrencyRateProviderROBNR(models.Model):
             "ZAR",
         ]
 
+    def _update(self, date_from, date_to, newest_only=False):
+        bnr_providers = self.filtered(lambda p: p.service == "RO_BNR")
+        res = super(ResCurrencyRateProviderROBNR, self - bnr_providers)._update(
+            date_from, date_to, newest_only=newest_only
+        )
+        is_scheduled = self.env.context.get("scheduled")
+        for provider in bnr_providers:
+            try:
+                data = provider._obtain_rates(
+                    provider.company_id.currency_id.name,
+                    provider.currency_ids.mapped("name"),
+                    date_from,
+                    date_to,
+                )
+            except BaseException as e:
+                _logger.warning(
+                    'Currency Rate Provider "%s" failed to obtain data since'
+                    " %s until %s" % (provider.name, date_from, date_to),
+                    exc_info=True,
+                )
+                provider.message_post(
+                    subject=_("Currency Rate Provider Failure"),
+                    body=_(
+                        'Currency Rate Provider "%(name)s" failed to obtain data'
+                        " since %(date_from)s until %(date_to)s:\n%(error)s",
+                        name=provider.name,
+                        date_from=date_from,
+                        date_to=date_to,
+                        error=str(e) if e else _("N/A"),
+                    ),
+                )
+                continue
+            if not data:
+                # Try again if there is no data yet
+                continue
+            newest_date = max(fields.Date.from_string(day) for day in data)
+            if newest_only:
+                data = {
+                    day: rates
+                    for day, rates in data.items()
+                    if fields.Date.from_string(day) == newest_date
+                }
+            provider._l10n_ro_store_rates(data)
+            if is_scheduled:
+                provider._schedule_last_successful_run(newest_date)
+                provider._schedule_next_run(newest_date)
+        return res
+
+    def _l10n_ro_store_rates(self, data):
+        """Write the rates for all the dates and currencies in one pass:
+        the existing rates are read with a single search and the missing
+        ones are created with a single create."""
+        self.ensure_one()
+        company = self.company_id
+        currency_names = {name for rates in data.values() for name in rates}
+        currency_names.discard(company.currency_id.name)
+        if not currency_names:
+            return
+        currencies = {
+            currency.name: currency
+            for currency in self.env["res.currency"].search(
+                [("name", "in", list(currency_names))]
+            )
+        }
+        unknown = currency_names - set(currencies)
+        if unknown:
+            raise UserError(
+                _("Unknown currency from %(provider)s: %(rate)s")
+                % {"provider": self.name, "rate": ", ".join(sorted(unknown))}
+            )
+        CurrencyRate = self.env["res.currency.rate"]
+        existing = CurrencyRate.search(
+            [
+                ("company_id", "=", company.id),
+                ("currency_id", "in", [c.id for c in currencies.values()]),
+                ("name", ">=", min(data)),
+                ("name", "<=", max(data)),
+            ]
+        )
+        existing_rates = {(rec.currency_id.id, rec.name): rec for rec in existing}
+        vals_list = []
+        for content_date, rates in sorted(data.items()):
+            timestamp = fields.Date.from_string(content_date)
+            for currency_name, rate in rates.items():
+                currency = currencies.get(currency_name)
+                if not currency:
+                    continue
+                rate = self._process_rate(currency, rate)
+                record = existing_rates.get((currency.id, timestamp))
+                if record:
+                    if record.rate != rate or record.provider_id != self:
+                        record.write({"rate": rate, "provider_id": self.id})
+                else:
+                    vals_list.append(
+                        {
+                            "company_id": company.id,
+                            "currency_id": currency.id,
+                            "name": timestamp,
+                            "rate": rate,
+                            "provider_id": self.id,
+                        }
+                    )
+        CurrencyRate.create(vals_list)
+
     def _obtain_rates(self, base_currency, currencies, date_from, date_to):
         self.ensure_one()
         if self.service != "RO_BNR":
@@ -80,26 +199,96 @@ class ResCurrencyRateProviderROBNR(models.Model):
                 base_currency, currencies, date_from, date_to
             )  # pragma: no cover
 
+        content = defaultdict(dict)
         if date_from == date_to:
             url = "https://www.bnr.ro/nbrfxrates.xml"
-        else:
-            year = date_from.year
-            url = "http://www.bnr.ro/files/xml/years/nbrfxrates" + str(year) + ".xml"
-
-        handler = ROBNRRatesHandler(currencies, date_from, date_to)
-        with urlopen(url) as response:
-            xml.sax.parse(response, handler)
-        if handler.content:
-            return handler.content
-        elif date_from == date_to:
-            # date_from can be in past and first url is giving only one date
-            # we must try to take the date from whole year list
-            year = date_from.year
-            url = "http://www.bnr.ro/files/xml/years/nbrfxrates" + str(year) + ".xml"
-            handler = ROBNRRatesHandler(currencies, date_from, date_to)
-            with urlopen(url) as response:
-                xml.sax.parse(response, handler)
-        return handler.content or {}
+            response = http_client.get(url)
+            response.raise_for_status()
+            for rate_date, currency, rate in parse_bnr_rates(
+                response.content, currencies, date_from, date_to
+            ):
+                content[rate_date.isoformat()][currency] = rate
+            if content:
+                return content
+        # date_from can be in past and first url is giving only one date
+        # we must take the dates from the yearly lists; the rates published
+        # in the last day of a year are applied in the next day
+        years = range((date_from - timedelta(days=1)).year, date_to.year + 1)
+        for xml_content in self._l10n_ro_get_yearly_files(years):
+            for rate_date, currency, rate in parse_bnr_rates(
+                xml_content, currencies, date_from, date_to
+            ):
+                content[rate_date.isoformat()][currency] = rate
+        return content
+
+    @api.model
+    def _l10n_ro_get_yearly_files(self, years):
+        """Download concurrently the yearly rate files, using a local cache
+        validated with the ETag / Last-Modified headers."""
+        cache_dir = os.path.join(tools.config["data_dir"], "currency_rate_RO_BNR")
+        os.makedirs(cache_dir, exist_ok=True)
+        years = list(years)
+        with ThreadPoolExecutor(max_workers=min(len(years), MAX_WORKERS)) as pool:
+            return list(pool.map(lambda year: _get_yearly_file(cache_dir, year), years))
+
+
+def _get_yearly_file(cache_dir, year):
+    url = BNR_YEAR_URL % year
+    path = os.path.join(cache_dir, "nbrfxrates%s.xml" % year)
+    meta_path = path + ".json"
+    headers = {}
+    meta = {}
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    response = http_client.get(url, headers=headers)
+    if response.status_code == 304:
+        with open(path, "rb") as xml_file:
+            return xml_file.read()
+    response.raise_for_status()
+    with open(path, "wb") as xml_file:
+        xml_file.write(response.content)
+    with open(meta_path, "w") as meta_file:
+        json.dump(
+            {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            },
+            meta_file,
+        )
+    return response.content
+
+
+def parse_bnr_rates(xml_content, currencies, date_from=None, date_to=None):
+    """Parse a BNR rates file and yield (date, currency, rate) tuples.
+
+    The date is the day when the rate is applied (the day after the
+    publication) and the rate is the inverse of the RON value of one unit.
+    Cubes outside the date interval and the currencies not requested are
+    skipped before any conversion, and the processed elements are cleared
+    to keep the memory low for the yearly files.
+    """
+    currencies = set(currencies)
+    context = etree.iterparse(BytesIO(xml_content), events=("end",), tag=CUBE_TAGS)
+    for _event, cube in context:
+        cube_date = cube.get("date")
+        if cube_date:
+            rate_date = date.fromisoformat(cube_date) + timedelta(days=1)
+            if (date_from is None or rate_date >= date_from) and (
+                date_to is None or rate_date <= date_to
+            ):
+                for rate in cube:
+                    currency = rate.get("currency")
+                    if currency in currencies:
+                        multiplier = float(rate.get("multiplier", 1))
+                        yield rate_date, currency, 1 / (float(rate.text) / multiplier)
+        cube.clear()
+        while cube.getprevious() is not None:
+            del cube.getparent()[0]
 
 
 class ROBNRRatesHandler(xml.sax.ContentHandler):
@@ -2,6 +2,9 @@
 # Copyright 2020 NextERP Romania SRL
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import logging
+import time
+import xml.sax
 from datetime import date, timedelta
 from unittest import mock
 
@@ -10,10 +13,33 @@ from dateutil.relativedelta import relativedelta
 from odoo import fields
 from odoo.tests.common import SavepointCase
 
+from odoo.addons.currency_rate_update_RO_BNR.models import (
+    res_currency_rate_provider_RO_BNR as bnr_provider,
+)
+
+_logger = logging.getLogger(__name__)
+
 _module_ns = "odoo.addons.currency_rate_update_RO_BNR"
 _file_ns = _module_ns + ".models.res_currency_rate_provider_RO_BNR"
 _RO_BNR_provider_class = _file_ns + ".ResCurrencyRateProviderROBNR"
 
+BNR_YEAR_XML = """<?xml version="1.0" encoding="utf-8"?>
+<DataSet xmlns="http://www.bnr.ro/xsd">
+<Body>
+<OrigCurrency>RON</OrigCurrency>
+<Cube date="%(year)s-12-30">
+<Rate currency="EUR">4.9000</Rate>
+<Rate currency="USD">4.%(year)s</Rate>
+</Cube>
+<Cube date="%(year)s-12-31">
+<Rate currency="EUR">4.9500</Rate>
+<Rate currency="HUF" multiplier="100">1.3400</Rate>
+<Rate currency="USD">4.4000</Rate>
+</Cube>
+</Body>
+</DataSet>
+"""
+
 
 class TestCurrencyRateUpdateRoBnr(SavepointCase):
     @classmethod
@@ -52,6 +78,78 @@ class TestCurrencyRateUpdateRoBnr(SavepointCase):
         with mock.patch(_RO_BNR_provider_class + "._obtain_rates", return_value=None):
             self.bnr_provider._update(self.today, self.today)
 
+    def test_update_RO_BNR_years(self):
+        """Several years are imported in one pass from the yearly files"""
+
+        def get_yearly_files(provider, years):
+            return [(BNR_YEAR_XML % {"year": year}).encode() for year in years]
+
+        with mock.patch(
+            _RO_BNR_provider_class + "._l10n_ro_get_yearly_files",
+            new=get_yearly_files,
+        ):
+            self.bnr_provider._update(date(2019, 12, 31), date(2022, 1, 1))
+            rates = self.CurrencyRate.search(
+                [("currency_id", "=", self.usd_currency.id)]
+            )
+            self.assertEqual(len(rates), 6)
+            rate = rates.filtered(lambda r: r.name == date(2020, 12, 31))
+            self.assertAlmostEqual(rate.inverse_rate, 4.2020)
+            # Importing again doesn't duplicate the rates
+            self.bnr_provider._update(date(2019, 12, 31), date(2022, 1, 1))
+            self.assertEqual(
+                self.CurrencyRate.search_count(
+                    [("currency_id", "=", self.usd_currency.id)]
+                ),
+                6,
+            )
+        rates.unlink()
+
+    def test_parse_RO_BNR_benchmark(self):
+        """Compare the iterparse parser with the SAX handler on a yearly file"""
+        currencies = ["CHF", "EUR", "GBP", "HUF", "USD"]
+        all_currencies = self.bnr_provider._get_supported_currencies()
+        cubes = []
+        start = date(2021, 1, 4)
+        for day in range(250):
+            rates = "".join(
+                '<Rate currency="%s" multiplier="100">%.4f</Rate>'
+                % (name, 1 + index + day / 1000)
+                if name == "HUF"
+                else '<Rate currency="%s">%.4f</Rate>' % (name, 1 + index + day / 1000)
+                for index, name in enumerate(all_currencies)
+            )
+            cubes.append(
+                '<Cube date="%s">%s</Cube>'
+                % ((start + timedelta(days=day)).isoformat(), rates)
+            )
+        xml_content = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<DataSet xmlns="http://www.bnr.ro/xsd"><Body>'
+            "<OrigCurrency>RON</OrigCurrency>%s</Body></DataSet>" % "".join(cubes)
+        ).encode()
+        date_from, date_to = date(2021, 3, 1), date(2021, 9, 30)
+
+        start_time = time.perf_counter()
+        handler = bnr_provider.ROBNRRatesHandler(currencies, date_from, date_to)
+        xml.sax.parseString(xml_content, handler)
+        sax_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        content = {}
+        for rate_date, currency, rate in bnr_provider.parse_bnr_rates(
+            xml_content, currencies, date_from, date_to
+        ):
+            content.setdefault(rate_date.isoformat(), {})[currency] = rate
+        iterparse_time = time.perf_counter() - start_time
+
+        _logger.info(
+            "BNR yearly file parsing: SAX handler %.4fs, iterparse %.4fs",
+            sax_time,
+            iterparse_time,
+        )
+        self.assertEqual(content, dict(handler.content))
+
     def test_update_RO_BNR_today(self):
         """No checks are made since today may not be a banking day"""
         self.bnr_provider._update(self.today, self.today)
@@ -93,3 +191,27 @@ class TestCurrencyRateUpdateRoBnr(SavepointCase):
         self.assertTrue(rates)
 
         self.CurrencyRate.search([("currency_id", "=", self.usd_currency.id)]).unlink()
+
+    def test_update_RO_BNR_scheduled_bookkeeping(self):
+        """The scheduled runs are recorded on the newest rate date, and a
+        run without data is not rescheduled"""
+        self.bnr_provider.interval_type = "days"
+        self.bnr_provider.interval_number = 1
+        next_run = date(2021, 12, 1)
+        self.bnr_provider.next_run = next_run
+        provider = self.bnr_provider.with_context(scheduled=True)
+        with mock.patch(_RO_BNR_provider_class + "._obtain_rates", return_value={}):
+            provider._update(date(2021, 12, 1), date(2021, 12, 2))
+        self.assertEqual(self.bnr_provider.next_run, next_run)
+
+        def get_yearly_files(provider, years):
+            return [(BNR_YEAR_XML % {"year": year}).encode() for year in years]
+
+        with mock.patch(
+            _RO_BNR_provider_class + "._l10n_ro_get_yearly_files",
+            new=get_yearly_files,
+        ):
+            provider._update(date(2021, 12, 1), date(2022, 1, 10))
+        self.assertEqual(self.bnr_provider.last_successful_run, date(2022, 1, 1))
+        self.assertEqual(self.bnr_provider.next_run, date(2022, 1, 2))
+        self.CurrencyRate.search([("currency_id", "=", self.usd_currency.id)]).unlink()
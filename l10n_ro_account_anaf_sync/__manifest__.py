@@ -9,12 +9,13 @@
     "data": [
         "security/account_security.xml",
         "security/ir.model.access.csv",
+        "data/ir_cron.xml",
         "views/l10n_ro_account_anaf_sync_view.xml",
         "views/res_config_view.xml",
         "views/template.xml",
     ],
     "license": "AGPL-3",
-    "version": "14.0.1.10.0",
+    "version": "14.0.1.14.0",
     "author": "NextERP Romania," "Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/l10n-romania",
     "installable": True,
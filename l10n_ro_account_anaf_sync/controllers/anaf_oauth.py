@@ -4,7 +4,6 @@
 import secrets
 from datetime import datetime, timedelta
 
-import requests
 import werkzeug
 import werkzeug.urls as urls
 from werkzeug.wrappers import Response
@@ -12,6 +11,8 @@ from werkzeug.wrappers import Response
 from odoo import _, http
 from odoo.http import request
 
+from odoo.addons.l10n_ro_config.tools import http_client
+
 # Authorization Endpoint https://logincert.anaf.ro/anaf-oauth2/v1/authorize
 # Token Issuance Endpoint https://logincert.anaf.ro/anaf-oauth2/v1/token
 # Token Revocation Endpoint https://logincert.anaf.ro/anaf-oauth2/v1/revoke
@@ -141,7 +142,7 @@ class AccountANAFSyncWeb(http.Controller):
                 "access_key": "{}".format(code),
                 "redirect_uri": "{}".format(redirect_uri),
             }
-            response = requests.post(
+            response = http_client.post(
                 anaf_config.anaf_oauth_url + "/token",
                 data=data,
                 headers=headers,
@@ -150,14 +151,9 @@ class AccountANAFSyncWeb(http.Controller):
             response_json = response.json()
 
             message = _("The response was finished.\nResponse was: %s") % response_json
-            anaf_config.write(
-                {
-                    "code": code,
-                    "client_token_valability": now + timedelta(days=89),
-                    "access_token": response_json.get("access_token", ""),
-                    "refresh_token": response_json.get("refresh_token", ""),
-                }
-            )
+            values = anaf_config._l10n_ro_get_token_values(response_json)
+            values["code"] = code
+            anaf_config.write(values)
         else:
             message = _("No code was found in the response.\nResponse was: %s") % kw
 
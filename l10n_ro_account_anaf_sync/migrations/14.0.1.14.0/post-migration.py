@@ -0,0 +1,18 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    # the tokens received before the expiry was stored are refreshed from
+    # the validity date of the token
+    cr.execute(
+        """
+        UPDATE l10n_ro_account_anaf_sync
+        SET access_token_expiry = client_token_valability::timestamp
+        WHERE access_token_expiry IS NULL
+            AND client_token_valability IS NOT NULL
+        """
+    )
@@ -1,14 +1,25 @@
 # Copyright (C) 2022 NextERP Romania
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+import logging
 from datetime import timedelta
 
-import requests
+import psycopg2
+from requests.exceptions import RequestException
 from werkzeug.urls import url_encode
 
-from odoo import _, api, fields, models
+from odoo import _, api, fields, models, tools
 from odoo.exceptions import UserError
 
+from odoo.addons.l10n_ro_config.tools import http_client
+
+_logger = logging.getLogger(__name__)
+
+# Validity of the ANAF access tokens, when the token response has no expires_in
+TOKEN_VALIDITY = timedelta(days=90)
+# The access token is refreshed by the cron when it expires in less than this
+TOKEN_REFRESH_MARGIN = timedelta(days=10)
+
 
 class AccountANAFSync(models.Model):
     _name = "l10n.ro.account.anaf.sync"
@@ -69,6 +80,22 @@ class AccountANAFSync(models.Model):
         [("test", "Test"), ("manual", "Manual"), ("automatic", "Automatic")],
         default="test",
     )
+    upload_workers = fields.Integer(
+        default=4, help="Number of e-invoices uploaded at the same time"
+    )
+    upload_rate_limit = fields.Float(
+        default=5.0, help="Maximum number of upload requests per second, 0 for none"
+    )
+    status_check_interval = fields.Integer(
+        readonly=True,
+        help="Minutes between the checks of the e-invoices waiting for ANAF, "
+        "longer while ANAF is still processing the same invoices",
+    )
+    next_status_check = fields.Datetime(readonly=True)
+    access_token_expiry = fields.Datetime(
+        readonly=True,
+        help="The access token is refreshed automatically before this time",
+    )
 
     def write(self, values):
         if values.get("company_id"):
@@ -83,7 +110,10 @@ class AccountANAFSync(models.Model):
                     )
             if company and len(self) == 1:
                 company.l10n_ro_account_anaf_sync_id = self
-        return super().write(values)
+        res = super().write(values)
+        if "access_token" in values:
+            self._l10n_ro_clear_token_cache()
+        return res
 
     def _compute_anaf_callback_url(self):
         for anaf_sync in self:
@@ -116,34 +146,125 @@ class AccountANAFSync(models.Model):
 
     def handle_anaf_callback(self, authorization_code):
         # Folosește codul de autorizare pentru a obține token-ul de acces
+        self._l10n_ro_request_token(
+            {
+                "grant_type": "authorization_code",
+                "code": authorization_code,
+                "redirect_uri": self.anaf_callback_url,
+            }
+        )
+
+    def _l10n_ro_request_token(self, data):
+        """Get a token from the ANAF token endpoint with the grant of data,
+        write it and return True when it was received"""
+        self.ensure_one()
         token_url = f"{self.anaf_oauth_url}/token"
-        data = {
-            "grant_type": "authorization_code",
-            "code": authorization_code,
-            "client_id": self.client_id,
-            "client_secret": self.client_secret,
-            "redirect_uri": self.anaf_callback_url,
+        data = dict(data, client_id=self.client_id, client_secret=self.client_secret)
+        try:
+            response = http_client.post(
+                token_url,
+                data=data,
+                timeout=80,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+            )
+        except RequestException as e:
+            _logger.warning("ANAF token request %s failed: %s", data["grant_type"], e)
+            return False
+        if response.status_code != 200:
+            _logger.warning(
+                "ANAF token request %s failed: %s", data["grant_type"], response.reason
+            )
+            return False
+        # Extrage token-ul de acces din răspunsul JSON
+        values = self._l10n_ro_get_token_values(response.json())
+        values["last_request_datetime"] = fields.Datetime.now()
+        self.write(values)
+        return True
+
+    @api.model
+    def _l10n_ro_get_token_values(self, token_data):
+        """Return the values to write from the JSON response of the token
+        endpoint"""
+        now = fields.Datetime.now()
+        expires_in = token_data.get("expires_in")
+        validity = timedelta(seconds=int(expires_in)) if expires_in else TOKEN_VALIDITY
+        values = {
+            "access_token": token_data.get("access_token", ""),
+            "access_token_expiry": now + validity,
+            "client_token_valability": (now + validity).date(),
         }
+        if token_data.get("refresh_token"):
+            values["refresh_token"] = token_data["refresh_token"]
+        return values
 
-        response = requests.post(
-            token_url,
-            data=data,
-            timeout=80,
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
+    def _l10n_ro_clear_token_cache(self):
+        """Evict the cached access tokens, in all the workers"""
+        self.clear_caches()
+
+    @tools.ormcache("self.id")
+    def _l10n_ro_get_cached_access_token(self):
+        return self.sudo().access_token
+
+    def _l10n_ro_get_access_token(self):
+        """Return the access token to use for the ANAF web services.
+
+        The token is kept in the ormcache, so the calls don't read it from
+        the database. The cache is cleared when the token is written, in
+        all the workers, and when ANAF rejects it. The token is only
+        refreshed by the cron, in its own transaction, never by the
+        transactions calling the web services.
+        """
+        self.ensure_one()
+        return self._l10n_ro_get_cached_access_token()
+
+    def _l10n_ro_refresh_access_token(self):
+        """Lock the config row and refresh the access token if it expires
+        in less than TOKEN_REFRESH_MARGIN, return True when it was
+        refreshed. A config locked by another transaction is not waited
+        for, the next run of the cron refreshes it."""
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                self.env.cr.execute(
+                    "SELECT id FROM l10n_ro_account_anaf_sync "
+                    "WHERE id = %s FOR UPDATE NOWAIT",
+                    (self.id,),
+                    log_exceptions=False,
+                )
+        except psycopg2.OperationalError as e:
+            if e.pgcode != "55P03":
+                raise
+            _logger.info("The ANAF config %s is locked, not refreshed", self.id)
+            return False
+        self.invalidate_cache(
+            ["access_token", "refresh_token", "access_token_expiry"], self.ids
+        )
+        expiry = self.access_token_expiry
+        if not (
+            self.refresh_token
+            and expiry
+            and expiry - TOKEN_REFRESH_MARGIN <= fields.Datetime.now()
+        ):
+            return False
+        return self._l10n_ro_request_token(
+            {"grant_type": "refresh_token", "refresh_token": self.refresh_token}
         )
 
-        if response.status_code == 200:
-            # Extrage token-ul de acces din răspunsul JSON
-            token_data = response.json()
-            self.write(
-                {
-                    "access_token": token_data.get("access_token"),
-                    "refresh_token": token_data.get("refresh_token"),
-                    "client_token_valability": fields.Date.today()
-                    + timedelta(days=90),  # Valabilitate de 90 de zile
-                    "last_request_datetime": fields.Datetime.now(),
-                }
-            )
+    @api.model
+    def _l10n_ro_cron_refresh_access_tokens(self):
+        """Refresh the access tokens which expire soon"""
+        anaf_syncs = self.search(
+            [
+                ("refresh_token", "!=", False),
+                (
+                    "access_token_expiry",
+                    "<=",
+                    fields.Datetime.now() + TOKEN_REFRESH_MARGIN,
+                ),
+            ]
+        )
+        for anaf_sync in anaf_syncs:
+            anaf_sync._l10n_ro_refresh_access_token()
 
     # def get_token_from_anaf_website(self):
     #     self.ensure_one()
@@ -170,7 +291,7 @@ class AccountANAFSync(models.Model):
             "token_type_hint": "access_token",  # refresh_token  (should work without)
         }
         url = self.anaf_oauth_url + "/revoke"
-        response = requests.post(
+        response = http_client.post(
             url,
             data=param,
             timeout=80,
@@ -191,6 +312,7 @@ class AccountANAFSync(models.Model):
                     "refresh_token": "",
                     "last_request_datetime": False,
                     "client_token_valability": False,
+                    "access_token_expiry": False,
                 }
             )
 
@@ -198,7 +320,7 @@ class AccountANAFSync(models.Model):
         self.ensure_one()
         url = "https://api.anaf.ro/TestOauth/jaxrs/hello?name=test_from_odoo"
 
-        response = requests.get(
+        response = http_client.get(
             url,
             data={"name": "test_anaf"},
             headers={
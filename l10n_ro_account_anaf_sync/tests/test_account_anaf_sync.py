@@ -1,14 +1,64 @@
 # Copyright (C) 2023 Terrabit
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
 
-
+from odoo import fields
 from odoo.tests.common import TransactionCase
 
 
+class FakeTokenHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the ANAF OAuth token endpoint"""
+
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.requests.append(parse_qs(data.decode()))
+        index = len(self.requests)
+        body = json.dumps(
+            {
+                "access_token": "access%s" % index,
+                "refresh_token": "refresh%s" % index,
+                "expires_in": 7776000,
+                "token_type": "Bearer",
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
 class TestAccountANAFSync(TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTokenHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.oauth_url = "http://127.0.0.1:%s/anaf-oauth2/v1" % (
+            cls.server.server_address[1]
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
     def setUp(self):
         super(TestAccountANAFSync, self).setUp()
         self.test_company = self.env["res.company"].create({"name": "Test Sync"})
+        FakeTokenHandler.requests = []
 
     def test_anaf_api(self):
 
@@ -42,3 +92,83 @@ class TestAccountANAFSync(TransactionCase):
             }
         )
         sync.get_token_from_anaf_website()
+
+    def test_refresh_access_token(self):
+        now = fields.Datetime.now()
+        sync = self.env["l10n.ro.account.anaf.sync"].create(
+            {
+                "company_id": self.test_company.id,
+                "client_id": "123",
+                "client_secret": "456",
+                "anaf_oauth_url": self.oauth_url,
+                "access_token": "access0",
+                "refresh_token": "refresh0",
+            }
+        )
+        sync.write({"access_token_expiry": now + timedelta(days=30)})
+        cron = self.env["l10n.ro.account.anaf.sync"]._l10n_ro_cron_refresh_access_tokens
+        cron()
+        self.assertEqual(sync._l10n_ro_get_access_token(), "access0")
+        self.assertFalse(FakeTokenHandler.requests)
+
+        # only the cron refreshes the token, ahead of the expiry, once
+        sync.write({"access_token_expiry": now + timedelta(days=2)})
+        self.assertEqual(sync._l10n_ro_get_access_token(), "access0")
+        self.assertFalse(FakeTokenHandler.requests)
+        cron()
+        cron()
+        self.assertEqual(sync._l10n_ro_get_access_token(), "access1")
+        self.assertEqual(len(FakeTokenHandler.requests), 1)
+        self.assertEqual(
+            FakeTokenHandler.requests[0],
+            {
+                "grant_type": ["refresh_token"],
+                "refresh_token": ["refresh0"],
+                "client_id": ["123"],
+                "client_secret": ["456"],
+            },
+        )
+        self.assertEqual(sync.refresh_token, "refresh1")
+        self.assertGreater(sync.access_token_expiry, now + timedelta(days=80))
+
+    def test_refresh_access_token_error(self):
+        """The current token is kept when ANAF can't be reached"""
+        sync = self.env["l10n.ro.account.anaf.sync"].create(
+            {
+                "company_id": self.test_company.id,
+                "client_id": "123",
+                "client_secret": "456",
+                "anaf_oauth_url": "http://127.0.0.1:1/anaf-oauth2/v1",
+                "access_token": "access0",
+                "refresh_token": "refresh0",
+            }
+        )
+        sync.write({"access_token_expiry": fields.Datetime.now() + timedelta(days=2)})
+        self.assertFalse(sync._l10n_ro_refresh_access_token())
+        self.assertEqual(sync._l10n_ro_get_access_token(), "access0")
+        self.assertEqual(sync.refresh_token, "refresh0")
+
+    def test_access_token_cache(self):
+        """The cached token is read again once the cache is cleared"""
+        sync = self.env["l10n.ro.account.anaf.sync"].create(
+            {
+                "company_id": self.test_company.id,
+                "client_id": "123",
+                "client_secret": "456",
+                "access_token": "access0",
+            }
+        )
+        self.assertEqual(sync._l10n_ro_get_access_token(), "access0")
+        # written by another worker
+        sync.flush()
+        self.cr.execute(
+            "UPDATE l10n_ro_account_anaf_sync SET access_token = 'access1' "
+            "WHERE id = %s",
+            (sync.id,),
+        )
+        sync.invalidate_cache(["access_token"], sync.ids)
+        self.assertEqual(sync._l10n_ro_get_access_token(), "access0")
+        sync._l10n_ro_clear_token_cache()
+        self.assertEqual(sync._l10n_ro_get_access_token(), "access1")
+        sync.write({"access_token": "access2"})
+        self.assertEqual(sync._l10n_ro_get_access_token(), "access2")
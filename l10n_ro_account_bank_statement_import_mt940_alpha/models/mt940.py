@@ -9,10 +9,12 @@ from odoo import models
 class MT940Parser(models.AbstractModel):
     _inherit = "l10n.ro.account.bank.statement.import.mt940.parser"
 
-    def pre_process_data(self, data):
+    def get_pre_process_replacements(self, head):
+        replacements = super().get_pre_process_replacements(head)
         if self.get_mt940_type() == "mt940_ro_alpha":
-            data = data.replace(data[:55], "")
-        return super().pre_process_data(data)
+            # the message header, repeated before every statement
+            replacements.insert(0, (head[:55], ""))
+        return replacements
 
     def get_tag_61_regex(self):
         if self.get_mt940_type() == "mt940_ro_alpha":
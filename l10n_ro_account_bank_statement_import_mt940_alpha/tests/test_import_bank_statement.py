@@ -108,3 +108,19 @@ R  NEXTERP ROMANIA SRL BUCUROBU RO65BUCU078823522511RO01 DETALII
         self.assertTrue(line.date == fields.Date.from_string("2022-11-01"))
         self.assertTrue(line.payment_ref == transact["payment_ref"])
         self.assertTrue(line.ref == transact["ref"])
+
+    def test_parse(self):
+        """Alpha Bank puts every day in its own statement."""
+        transactions = self.assert_parsed_file(
+            "l10n_ro_account_bank_statement_import_mt940_alpha",
+            "test_alpha_940.txt",
+            "mt940_ro_alpha",
+            "RO87BUCU1052235283028",
+            [
+                ("115/01", 1000.0, 2000.0, [1000.0]),
+                ("116/01", 2000.0, 2998.0, [1000.0, -2.0]),
+            ],
+        )
+        self.assertEqual(transactions[1]["ref"], "   032EPOH223040543")
+        self.assertEqual(transactions[1]["partner_name"], "NEXTERP ROMANIA SRL")
+        self.assertEqual(transactions[1]["account_number"], "RO88BTRLRONCRT0301398801")
@@ -5,13 +5,17 @@
 {
     "name": "Romania - MT940 Bank Statements Import",
     "summary": "Romania - MT940 Bank Statements Import",
-    "version": "14.0.1.5.0",
+    "version": "14.0.1.6.0",
     "license": "AGPL-3",
     "author": "NextERP Romania," "Odoo Community Association (OCA)," "Therp BV",
     "website": "https://github.com/OCA/l10n-romania",
     "category": "Localization",
     "depends": ["account_statement_import", "l10n_ro_config"],
-    "data": ["views/res_bank_view.xml"],
+    "data": [
+        "security/ir.model.access.csv",
+        "views/res_bank_view.xml",
+        "wizard/mt940_batch_import_view.xml",
+    ],
     "installable": True,
     "development_status": "Mature",
     "maintainers": ["feketemihai", "dhongu"],
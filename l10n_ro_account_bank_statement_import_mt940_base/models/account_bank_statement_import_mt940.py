@@ -1,11 +1,27 @@
 # Copyright (C) 2022 NextERP Romania
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
-from odoo import models
+from itertools import chain
+
+from odoo import _, models
+from odoo.exceptions import UserError
+
+from .mt940_partner_index import MT940PartnerIndex
 
 
 class AccountBankStatementImport(models.TransientModel):
     _inherit = "account.statement.import"
 
+    def _l10n_ro_get_mt940_type(self):
+        """Return the MT940 type used to parse the file, the bank modules
+        override it for their journals"""
+        return self.env.context.get("type", "mt940_general")
+
+    def _l10n_ro_post_parse_statement(self, data, partner_index=None):
+        """Hook to adapt the (currency, account_number, statements) parsed
+        data before importing it, partner_index is the MT940PartnerIndex of
+        the import"""
+        return data
+
     def _parse_file(self, data_file):
         parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
         if "type" not in self.env.context:
@@ -14,3 +30,97 @@ class AccountBankStatementImport(models.TransientModel):
         if data:
             return data
         return super(AccountBankStatementImport, self)._parse_file(data_file)
+
+    def import_single_file(self, file_data, result):
+        """Import the MT940 statements one by one, as they are parsed."""
+        partner_index = MT940PartnerIndex(self.env)
+        parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
+        parser = parser.with_context(type=self._l10n_ro_get_mt940_type())
+        statements = parser.parse_statements(file_data, partner_index=partner_index)
+        first_statement = next(statements, None)
+        if not first_statement:
+            return super().import_single_file(file_data, result)
+        self._l10n_ro_import_statements(
+            chain([first_statement], statements), result, partner_index=partner_index
+        )
+
+    def _l10n_ro_import_statements(self, statements, result, partner_index=None):
+        """Import the parsed (currency, account_number, statement) MT940
+        statements.
+
+        Every statement is created with its lines as soon as it is read from
+        the file, and the cache is cleared after it, so that the files with
+        hundreds of statements are imported with a bounded memory. The
+        partner index is shared by the parser and the post parse hooks.
+        """
+        self = self.with_context(l10n_ro_mt940_import=True)
+        if not partner_index:
+            partner_index = MT940PartnerIndex(self.env)
+        has_transactions = False
+        for currency, account_number, statement in statements:
+            if not statement["transactions"]:
+                continue
+            has_transactions = True
+            data = self._l10n_ro_post_parse_statement(
+                (currency, account_number, [statement]), partner_index=partner_index
+            )
+            self.import_single_statement(data, result)
+            self.flush()
+            self.invalidate_cache()
+        if not has_transactions:
+            raise UserError(_("This file doesn't contain any transaction."))
+
+    def _create_bank_statements(self, stmts_vals, result):
+        """Skip the MT940 transactions already imported with one search for
+        all the unique import ids, and create the statements with their new
+        lines, instead of the search for every line of the standard method"""
+        if not self.env.context.get("l10n_ro_mt940_import"):
+            return super()._create_bank_statements(stmts_vals, result)
+        import_ids = [
+            lvals["unique_import_id"]
+            for st_vals in stmts_vals
+            for lvals in st_vals["transactions"]
+            if lvals.get("unique_import_id")
+        ]
+        existing_lines = self.env["account.bank.statement.line"].sudo()
+        if import_ids:
+            existing_lines = existing_lines.search(
+                [("unique_import_id", "in", import_ids)]
+            )
+        existing_ids = set(existing_lines.mapped("unique_import_id"))
+        statements_vals = []
+        for st_vals in stmts_vals:
+            st_lines_to_create = []
+            for lvals in st_vals["transactions"]:
+                if lvals.get("unique_import_id") in existing_ids:
+                    if "balance_start" in st_vals:
+                        st_vals["balance_start"] += float(lvals["amount"])
+                else:
+                    st_lines_to_create.append(lvals)
+            if not st_lines_to_create:
+                continue
+            if not st_lines_to_create[0].get("sequence"):
+                for sequence, lvals in enumerate(st_lines_to_create, start=1):
+                    lvals["sequence"] = sequence
+            st_vals.pop("transactions", None)
+            st_vals["line_ids"] = [(0, 0, lvals) for lvals in st_lines_to_create]
+            statements_vals.append(st_vals)
+        if existing_lines:
+            result["notifications"].append(
+                {
+                    "type": "warning",
+                    "message": _(
+                        "%d transactions had already been imported and were ignored."
+                    )
+                    % len(existing_lines),
+                    "details": {
+                        "name": _("Already imported items"),
+                        "model": "account.bank.statement.line",
+                        "ids": existing_lines.ids,
+                    },
+                }
+            )
+        if not statements_vals:
+            return False
+        statements = self.env["account.bank.statement"].create(statements_vals)
+        result["statement_ids"].extend(statements.ids)
@@ -3,16 +3,94 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 """Generic parser for MT940 files, base for customized versions per bank."""
 
+import hashlib
+import io
 import logging
 import re
 from datetime import datetime
-from itertools import repeat, zip_longest
+from itertools import chain
 from string import printable
 
-from odoo import models
+from odoo import models, tools
+
+from .mt940_partner_index import MT940PartnerIndex
 
 _logger = logging.getLogger(__name__)
 
+# ASCII characters not in string.printable, removed with str.translate
+NON_PRINTABLE = {i: None for i in range(128) if chr(i) not in printable}
+# Size of the blocks read from the statement files
+READ_CHUNK_SIZE = 64 * 1024
+# Size of the beginning of the file used to detect its format
+HEAD_SIZE = 1024
+STATEMENT_RE = re.compile(r"(\{4:[^{}]+\})")
+
+
+def _read_chunks(file_obj):
+    """Read the file by blocks, without the non ASCII and non printable
+    characters"""
+    while True:
+        chunk = file_obj.read(READ_CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk.decode("ascii", "ignore").translate(NON_PRINTABLE)
+
+
+def _replace_chunks(chunks, old, new):
+    """str.replace over a stream of text chunks. The end of every chunk
+    which could be the start of an occurrence is kept for the next one."""
+    if not old:
+        yield from chunks
+        return
+    buffer = ""
+    for chunk in chain(chunks, [None]):
+        if chunk is None:
+            yield buffer.replace(old, new)
+            return
+        buffer += chunk
+        limit = len(buffer) - len(old) + 1
+        parts = []
+        pos = 0
+        index = buffer.find(old)
+        while index != -1 and index < limit:
+            parts.append(buffer[pos:index])
+            parts.append(new)
+            pos = index + len(old)
+            index = buffer.find(old, pos)
+        end = max(pos, limit)
+        parts.append(buffer[pos:end])
+        buffer = buffer[end:]
+        yield "".join(parts)
+
+
+def _split_chunks(chunks, separator):
+    """str.split over a stream of text chunks, yield every part"""
+    buffer = ""
+    for chunk in chunks:
+        start = max(len(buffer) - len(separator) + 1, 0)
+        buffer += chunk
+        index = buffer.find(separator, start)
+        while index != -1:
+            yield buffer[:index]
+            buffer = buffer[index + len(separator) :]
+            index = buffer.find(separator)
+    yield buffer
+
+
+def _findall_chunks(chunks, regex):
+    """Yield the statements blocks matched by regex in a stream of text
+    chunks. A match can't contain "{", so only the text after the last
+    "{" is kept for the next chunk."""
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        end = 0
+        for match in regex.finditer(buffer):
+            yield match.group(1)
+            end = match.end()
+        start = buffer.rfind("{", end)
+        buffer = buffer[start:] if start != -1 else ""
+
 
 class MT940Parser(models.AbstractModel):
     _name = "l10n.ro.account.bank.statement.import.mt940.parser"
@@ -80,9 +158,29 @@ class MT940Parser(models.AbstractModel):
             r"\n?(?P<account_number>\w{1,34})?"
         )
 
+    @tools.ormcache("self.get_mt940_type()")
+    def _get_mt940_tokenizer(self):
+        """Compiled regexes and tag handlers of the current MT940 type.
+
+        Built once per type, the handlers are the handle_tag_* functions
+        of the parser class, keyed by tag.
+        """
+        parser_class = type(self)
+        handlers = {
+            name[len("handle_tag_") :]: getattr(parser_class, name)
+            for name in dir(parser_class)
+            if name.startswith("handle_tag_")
+        }
+        return {
+            "header": re.compile(self.get_header_regex()),
+            "footer": re.compile(self.get_footer_regex()),
+            "tag": re.compile(self.get_tag_regex()),
+            "handlers": handlers,
+        }
+
     def is_mt940(self, line):
         """determine if a line is the header of a statement"""
-        if not bool(re.match(self.get_header_regex(), line)):
+        if not self._get_mt940_tokenizer()["header"].match(line):
             return False
         return True
 
@@ -104,15 +202,27 @@ class MT940Parser(models.AbstractModel):
     def get_subfield_split_text(self):
         return "/"
 
-    def _clean_codewords(self, data, codewords):
-        for cw in codewords:
-            regex_spaces = list(repeat(r"[\s]?", len(cw) - 1))
-            pattern = ""
-            for item in zip_longest(cw, regex_spaces):
-                pattern += "".join([item[0], item[1] or ""])
-            data = re.sub(pattern, cw, data)
+    @tools.ormcache("tuple(codewords)")
+    def _get_codewords_regex(self, codewords):
+        """Compile one alternation matching any of the codewords, with
+        optional spaces between their characters.
+
+        The longest codewords are tried first, each alternative is a named
+        group so that the matched codeword is found by its position.
+        """
+        alternatives = []
+        for index, cw in sorted(enumerate(codewords), key=lambda x: -len(x[1])):
+            pattern = r"[\s]?".join(re.escape(char) for char in cw)
+            alternatives.append("(?P<cw%s>%s)" % (index, pattern))
+        return re.compile("|".join(alternatives))
 
-        return data
+    def _clean_codewords(self, data, codewords):
+        """Remove the spaces inside the codewords, in a single scan"""
+        if not codewords:
+            return data
+        codewords = list(codewords)
+        regex = self._get_codewords_regex(codewords)
+        return regex.sub(lambda match: codewords[int(match.lastgroup[2:])], data)
 
     def get_subfields(self, data, codewords):
         """Return dictionary with value array for each codeword in data.
@@ -164,8 +274,11 @@ class MT940Parser(models.AbstractModel):
             transaction.update({"partner_name": subfield[2]})
         return transaction
 
-    def handle_common_subfields(self, transaction, subfields):
-        """Deal with common functionality for tag 86 subfields."""
+    def handle_common_subfields(self, transaction, subfields, partner_index=None):
+        """Deal with common functionality for tag 86 subfields.
+
+        partner_index is the MT940PartnerIndex of the parsing, for the banks
+        which find the partners of the transactions."""
         # Get counterpart from CNTP, BENM or ORDP subfields:
         for counterpart_field in ["CNTP", "BENM", "ORDP"]:
             if counterpart_field in subfields:
@@ -193,70 +306,149 @@ class MT940Parser(models.AbstractModel):
         if transaction.get("ref") in subfields:
             transaction["ref"] = "".join(subfields[transaction["ref"]])
 
+    def get_pre_process_replacements(self, head):
+        """Return the (old, new) replacements done in order on the file
+        content before it is split in statements. head is the beginning of
+        the file, for the banks which remove a header repeated in it."""
+        return [("-}", "}"), ("}{", "}\r\n{"), ("\r\n", "\n")]
+
     def pre_process_data(self, data):
-        matches = []
-        if self.is_mt940(line=data):
-            data = data.replace("-}", "}").replace("}{", "}\r\n{").replace("\r\n", "\n")
-            header_regex = self.get_header_regex()
-            if data.startswith(header_regex):
-                if header_regex != ":20:":
-                    data = data.replace(header_regex, "")
-                for statement in data.split(":20:"):
-                    match = "{4:\n:20:" + statement + "}"
-                    matches.append(match)
-            else:
-                tag_re = re.compile(r"(\{4:[^{}]+\})", re.MULTILINE)
-                matches = tag_re.findall(data)
-            return matches
-        return []
-
-    def parse(self, data, header_lines=None):
+        """Return the list of the statement blocks of the file content"""
+        return list(self._iter_statement_blocks(iter([data])))
+
+    def _iter_statement_blocks(self, chunks):
+        """Yield the statement blocks of the file, read by chunks of text,
+        so that only a statement is kept in memory at a time"""
+        raw_head = ""
+        for chunk in chunks:
+            raw_head += chunk
+            if len(raw_head) >= HEAD_SIZE:
+                break
+        replacements = self.get_pre_process_replacements(raw_head)
+        head = raw_head
+        for old, new in replacements:
+            head = head.replace(old, new)
+        if not self.is_mt940(line=head):
+            return
+        chunks = chain([raw_head], chunks)
+        for old, new in replacements:
+            chunks = _replace_chunks(chunks, old, new)
+        header_regex = self.get_header_regex()
+        if head.startswith(header_regex):
+            if header_regex != ":20:":
+                chunks = _replace_chunks(chunks, header_regex, "")
+            for statement in _split_chunks(chunks, ":20:"):
+                yield "{4:\n:20:" + statement + "}"
+        else:
+            yield from _findall_chunks(chunks, STATEMENT_RE)
+
+    def parse(self, data, header_lines=None, partner_index=None):
         """Parse mt940 bank statement file contents."""
-        data = data.decode()
-        data = "".join([str(x) for x in data if str(x) in printable])
-
-        matches = self.pre_process_data(data)
-        if matches:
-            statements = []
-            result = {
-                "currency": None,
-                "account_number": None,
-                "statement": None,
-            }
-            if not header_lines:
-                header_lines = self.get_header_lines()
-            for match in matches:
-                self.is_mt940_statement(line=match)
-                iterator = "\n".join(match.split("\n")[1:]).split("\n").__iter__()
-                line = None
-                record_line = ""
-                try:
-                    while True:
-                        if not result["statement"]:
-                            result["statement"] = self.handle_header(
-                                iterator, header_lines
-                            )
-                        line = next(iterator)
-                        if not self.is_tag(line) and not self.is_footer(line):
-                            record_line = self.add_record_line(line, record_line)
-                            continue
-                        if record_line:
-                            self.handle_record(record_line, result)
-                        if self.is_footer(line):
-                            statements.append(result["statement"])
-                            result["statement"] = None
-                            record_line = ""
-                            continue
-                        record_line = line
-                except StopIteration:
-                    _logger.info("StopIteration: statement")
-                if result["statement"]:
+        statements = []
+        currency = account_number = None
+        for currency, account_number, statement in self.parse_statements(
+            data, header_lines=header_lines, partner_index=partner_index
+        ):
+            statements.append(statement)
+        if statements:
+            return currency, account_number, statements
+        return False
+
+    def parse_statements(self, data, header_lines=None, partner_index=None):
+        """Parse mt940 bank statement file contents, as a generator.
+
+        data can be the file content or a binary file-like object, which is
+        read by chunks. Every statement is yielded as soon as it is parsed,
+        together with the currency and the account number read until then:
+        (currency, account_number, statement).
+
+        partner_index is the MT940PartnerIndex used to find the partners of
+        the transactions, a new one is made when it's not given.
+        """
+        if not hasattr(data, "read"):
+            data = io.BytesIO(data)
+        matches = self._iter_statement_blocks(_read_chunks(data))
+        result = {
+            "currency": None,
+            "account_number": None,
+            "statement": None,
+            "tag86_payloads": {},
+            "import_id_occurrences": {},
+            "partner_index": partner_index or MT940PartnerIndex(self.env),
+        }
+        if not header_lines:
+            header_lines = self.get_header_lines()
+        for match in matches:
+            self.is_mt940_statement(line=match)
+            iterator = "\n".join(match.split("\n")[1:]).split("\n").__iter__()
+            line = None
+            record_line = ""
+            try:
+                while True:
+                    if not result["statement"]:
+                        result["statement"] = self.handle_header(iterator, header_lines)
+                    line = next(iterator)
+                    if not self.is_tag(line) and not self.is_footer(line):
+                        record_line = self.add_record_line(line, record_line)
+                        continue
                     if record_line:
                         self.handle_record(record_line, result)
-                    statements.append(result["statement"])
-                    result["statement"] = None
-            return result["currency"], result["account_number"], statements
-        return False
+                    if self.is_footer(line):
+                        yield self._get_parsed_statement(result)
+                        record_line = ""
+                        continue
+                    record_line = line
+            except StopIteration:
+                _logger.info("StopIteration: statement")
+            if result["statement"]:
+                if record_line:
+                    self.handle_record(record_line, result)
+                yield self._get_parsed_statement(result)
+
+    def _get_parsed_statement(self, result):
+        statement = result["statement"]
+        result["statement"] = None
+        if statement:
+            self._l10n_ro_set_unique_import_ids(
+                statement,
+                result["account_number"],
+                result["tag86_payloads"],
+                result.setdefault("import_id_occurrences", {}),
+            )
+        result["tag86_payloads"] = {}
+        return result["currency"], result["account_number"], statement
+
+    def _l10n_ro_set_unique_import_ids(
+        self, statement, account_number, payloads, occurrences=None
+    ):
+        """Set a hash of the account, date, amount, reference and tag 86
+        payload as unique import id of the transactions, used to skip the
+        transactions already imported.
+
+        The identical transactions get a sequence suffix. occurrences counts
+        the hashes seen in the file, so that the identical transactions of
+        two statements of the same file get different ids too."""
+        if occurrences is None:
+            occurrences = {}
+        for index, transaction in enumerate(statement["transactions"]):
+            if transaction.get("unique_import_id"):
+                continue
+            date = transaction.get("date")
+            key = "|".join(
+                [
+                    account_number or "",
+                    date.strftime("%Y-%m-%d") if date else "",
+                    "%.2f" % (transaction.get("amount") or 0.0),
+                    transaction.get("ref") or "",
+                    payloads.get(index) or transaction.get("payment_ref") or "",
+                ]
+            )
+            unique_import_id = hashlib.sha1(key.encode()).hexdigest()
+            occurrence = occurrences.get(unique_import_id, 0)
+            occurrences[unique_import_id] = occurrence + 1
+            if occurrence:
+                unique_import_id = "%s-%s" % (unique_import_id, occurrence)
+            transaction["unique_import_id"] = unique_import_id
 
     def add_record_line(self, line, record_line):
         record_line += line
@@ -264,11 +456,11 @@ class MT940Parser(models.AbstractModel):
 
     def is_footer(self, line):
         """determine if a line is the footer of a statement"""
-        return line and bool(re.match(self.get_footer_regex(), line))
+        return line and bool(self._get_mt940_tokenizer()["footer"].match(line))
 
     def is_tag(self, line):
         """determine if a line has a tag"""
-        return line and bool(re.match(self.get_tag_regex(), line))
+        return line and bool(self._get_mt940_tokenizer()["tag"].match(line))
 
     def handle_header(self, iterator, header_lines=None):
         """skip header lines, create current statement"""
@@ -287,15 +479,21 @@ class MT940Parser(models.AbstractModel):
 
     def handle_record(self, line, result):
         """find a function to handle the record represented by line"""
-        tag_match = re.match(self.get_tag_regex(), line)
+        tokenizer = self._get_mt940_tokenizer()
+        tag_match = tokenizer["tag"].match(line)
         if tag_match:
             tag = tag_match.group(0).strip(":")
-            if not hasattr(self, "handle_tag_%s" % tag):  # pragma: no cover
+            handler = tokenizer["handlers"].get(tag)
+            if not handler:  # pragma: no cover
                 logging.error("Unknown tag %s", tag)
                 logging.error(line)
                 return
-            handler = getattr(self, "handle_tag_%s" % tag)
-            result = handler(line[tag_match.end() :], result)
+            data = line[tag_match.end() :]
+            statement = result["statement"]
+            result = handler(self, data, result) or result
+            if tag == "86" and statement and statement["transactions"]:
+                index = len(statement["transactions"]) - 1
+                result.setdefault("tag86_payloads", {})[index] = data
         return result
 
     def handle_tag_20(self, data, result):
@@ -405,5 +603,7 @@ class MT940Parser(models.AbstractModel):
             transaction = result["statement"]["transactions"][-1]
             codewords = self.get_codewords()
             subfields = self.get_subfields(data, codewords)
-            self.handle_common_subfields(transaction, subfields)
+            self.handle_common_subfields(
+                transaction, subfields, partner_index=result["partner_index"]
+            )
         return result
@@ -0,0 +1,92 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""In memory partner lookups shared by the MT940 parsers during an import."""
+
+import re
+
+NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_name(name):
+    return " ".join((name or "").lower().split())
+
+
+def normalize_vat(vat):
+    return NON_DIGITS.sub("", vat or "")
+
+
+class MT940PartnerIndex(object):
+    """Partners of the import company by name and VAT number.
+
+    Every dictionary is loaded with a single query the first time it is
+    used, so a statement with thousands of lines does the same number of
+    queries as a statement with one line.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self._by_name = None
+        self._by_vat = None
+        self._by_company_vat = None
+
+    def _get_company_ids(self):
+        return tuple(self.env.companies.ids) or (self.env.company.id,)
+
+    def _load_names(self):
+        self.env["res.partner"].flush(["name", "display_name", "company_id"])
+        self.env.cr.execute(
+            """
+            SELECT id, name FROM res_partner
+            WHERE active AND name IS NOT NULL
+                AND (company_id IS NULL OR company_id IN %s)
+            ORDER BY display_name, id
+            """,
+            (self._get_company_ids(),),
+        )
+        by_name = {}
+        for partner_id, name in self.env.cr.fetchall():
+            by_name.setdefault(normalize_name(name), partner_id)
+        self._by_name = by_name
+
+    def _load_vats(self):
+        self.env["res.partner"].flush(["l10n_ro_vat_number", "is_company"])
+        self.env.cr.execute(
+            """
+            SELECT id, l10n_ro_vat_number, is_company FROM res_partner
+            WHERE active AND l10n_ro_vat_number IS NOT NULL
+                AND l10n_ro_vat_number != ''
+                AND (company_id IS NULL OR company_id IN %s)
+            ORDER BY display_name, id
+            """,
+            (self._get_company_ids(),),
+        )
+        by_vat = {}
+        by_company_vat = {}
+        for partner_id, vat, is_company in self.env.cr.fetchall():
+            vat = normalize_vat(vat)
+            by_vat.setdefault(vat, partner_id)
+            if is_company:
+                by_company_vat.setdefault(vat, partner_id)
+        self._by_vat = by_vat
+        self._by_company_vat = by_company_vat
+
+    def find_by_name(self, name):
+        """Return the id of the partner with the name, case insensitive"""
+        name = normalize_name(name)
+        if not name:
+            return False
+        if self._by_name is None:
+            self._load_names()
+        return self._by_name.get(name, False)
+
+    def find_by_vat(self, vat, company=False):
+        """Return the id of the partner with the VAT number, with or
+        without the country code"""
+        vat = normalize_vat(vat)
+        if not vat:
+            return False
+        if self._by_vat is None:
+            self._load_vats()
+        if company:
+            return self._by_company_vat.get(vat, False)
+        return self._by_vat.get(vat, False)
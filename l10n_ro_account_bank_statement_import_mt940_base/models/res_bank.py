@@ -1,7 +1,10 @@
 # Copyright 2018 NextERP Romania
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
-from odoo import fields, models
+import re
+
+from odoo import _, api, fields, models, tools
+from odoo.exceptions import ValidationError
 
 
 class ResPartnerBank(models.Model):
@@ -11,3 +14,32 @@ class ResPartnerBank(models.Model):
     l10n_ro_unstructured_tag86 = fields.Text(
         string="Romania - MT940 Unstructured Tag 86 Pattern"
     )
+
+    @api.model
+    @tools.ormcache("patterns")
+    def _l10n_ro_compile_tag86_patterns(self, patterns):
+        """Compile the patterns given one per line, the empty lines are
+        skipped. The cache is keyed on the patterns text, so a changed
+        pattern is compiled again in every worker."""
+        return tuple(
+            re.compile(pattern)
+            for pattern in (patterns or "").splitlines()
+            if pattern.strip()
+        )
+
+    @api.constrains("l10n_ro_unstructured_tag86")
+    def _check_l10n_ro_unstructured_tag86(self):
+        for bank in self:
+            try:
+                self._l10n_ro_compile_tag86_patterns(bank.l10n_ro_unstructured_tag86)
+            except re.error as e:
+                raise ValidationError(
+                    _("Invalid MT940 unstructured tag 86 pattern: %s") % e
+                )
+
+    def _l10n_ro_get_unstructured_tag86_patterns(self):
+        """Return the compiled unstructured tag 86 patterns of the account"""
+        self.ensure_one()
+        return self._l10n_ro_compile_tag86_patterns(
+            self.l10n_ro_unstructured_tag86 or ""
+        )
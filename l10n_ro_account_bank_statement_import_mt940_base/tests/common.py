@@ -3,6 +3,7 @@
 
 import base64
 
+from odoo.modules.module import get_module_resource
 from odoo.tests import tagged
 
 from odoo.addons.account.tests.common import AccountTestInvoicingCommon
@@ -52,3 +53,36 @@ class TestMT940BankStatementImport(AccountTestInvoicingCommon):
 
     def get_statements(self, journal):
         return self.env["account.bank.statement"].search([("journal_id", "=", journal)])
+
+    def assert_parsed_file(
+        self, module, filename, mt940_type, account_number, statements
+    ):
+        """Parse the test file of the module and check its currency (RON),
+        account number and, for the statements with transactions, the
+        (name, balance_start, balance_end_real, transaction amounts) tuples,
+        the name is not checked when it is None.
+
+        :returns: the transactions of all these statements
+        """
+        testfile = get_module_resource(module, "test_files", filename)
+        parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
+        with open(testfile, "rb") as datafile:
+            currency, parsed_account, parsed = parser.with_context(
+                type=mt940_type
+            ).parse(datafile.read(), header_lines=1)
+        self.assertEqual((currency, parsed_account), ("RON", account_number))
+        parsed = [st for st in parsed if st["transactions"]]
+        self.assertEqual(len(parsed), len(statements))
+        self.assertEqual(
+            [
+                (
+                    st["name"] if name is not None else None,
+                    st["balance_start"],
+                    st["balance_end_real"],
+                    [tr["amount"] for tr in st["transactions"]],
+                )
+                for st, (name, *_values) in zip(parsed, statements)
+            ],
+            statements,
+        )
+        return [tr for st in parsed for tr in st["transactions"]]
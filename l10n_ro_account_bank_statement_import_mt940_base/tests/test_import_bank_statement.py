@@ -1,12 +1,24 @@
 # Copyright 2017 Onestein (<http://www.onestein.eu>)
 # Copyright (C) 2022 NextERP Romania
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+import base64
+import io
+import logging
+import threading
+import time
+import zipfile
+from unittest import mock
+
 from odoo import fields
 from odoo.modules.module import get_module_resource
 from odoo.tests import tagged
 
+from ..models import mt940
+from ..wizard import mt940_batch_import
 from .common import TestMT940BankStatementImport
 
+_logger = logging.getLogger(__name__)
+
 
 @tagged("post_install", "-at_install")
 class TestImport(TestMT940BankStatementImport):
@@ -71,6 +83,16 @@ class TestImport(TestMT940BankStatementImport):
         }
         self.assertTrue(res == espected_res)
 
+    def test_clean_codewords(self):
+        """Unit Test function _clean_codewords()."""
+        parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
+        parser = parser.with_context(type="mt940_general")
+        data = "/B ENM//N AME/Cost/R E M I/Period 01-10-2013/IS DT/20"
+        res = parser._clean_codewords(data, self.codewords)
+        self.assertEqual(res, "/BENM//NAME/Cost/REMI/Period 01-10-2013/ISDT/20")
+        res = parser.get_subfields(data, self.codewords)
+        self.assertEqual(res, parser.get_subfields(res, self.codewords))
+
     def test_handle_common_subfields(self):
         """Unit Test function handle_common_subfields()."""
         parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
@@ -103,6 +125,46 @@ class TestImport(TestMT940BankStatementImport):
             self.assertTrue(line.payment_ref == transact["payment_ref"])
             self.assertTrue(line.ref == transact["ref"])
 
+    def test_parse_statements_stream(self):
+        """Test the statements are yielded one by one from a file object."""
+        testfile = get_module_resource(
+            "l10n_ro_account_bank_statement_import_mt940_base",
+            "test_files",
+            "test-rabo.swi",
+        )
+        parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
+        parser = parser.with_context(type="mt940_general")
+        with open(testfile, "rb") as datafile:
+            statements = parser.parse(datafile.read(), header_lines=1)
+        with open(testfile, "rb") as datafile:
+            stream = parser.parse_statements(datafile, header_lines=1)
+            self.assertEqual(next(stream)[2], statements[2][0])
+            parsed = list(stream)
+        self.assertEqual([st[2] for st in parsed], statements[2][1:])
+        self.assertEqual(parsed[-1][:2], statements[:2])
+
+    def test_parse_statements_chunks(self):
+        """Test the file is read by chunks, as the statements are parsed."""
+        testfile = get_module_resource(
+            "l10n_ro_account_bank_statement_import_mt940_base",
+            "test_files",
+            "test-rabo.swi",
+        )
+        parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
+        parser = parser.with_context(type="mt940_general")
+        with open(testfile, "rb") as datafile:
+            data = datafile.read()
+        statements = parser.parse(data, header_lines=1)
+        with mock.patch.object(mt940, "READ_CHUNK_SIZE", 7), mock.patch.object(
+            mt940, "HEAD_SIZE", 20
+        ):
+            datafile = io.BytesIO(data)
+            stream = parser.parse_statements(datafile, header_lines=1)
+            self.assertEqual(next(stream)[2], statements[2][0])
+            self.assertLess(datafile.tell(), len(data))
+            parsed = [statements[2][0]] + [st[2] for st in stream]
+        self.assertEqual(parsed, statements[2])
+
     def test_wrong_file_import(self):
         """Test wrong file import."""
         testfile = get_module_resource(
@@ -114,3 +176,156 @@ class TestImport(TestMT940BankStatementImport):
         parser = parser.with_context(type="mt940_general")
         datafile = open(testfile, "rb").read()
         self.assertFalse(parser.parse(datafile, header_lines=1))
+
+    def test_batch_import(self):
+        """Import a zip with several files, the duplicates are skipped."""
+        testfile = get_module_resource(
+            "l10n_ro_account_bank_statement_import_mt940_base",
+            "test_files",
+            "test-rabo.swi",
+        )
+        wrong_file = get_module_resource(
+            "l10n_ro_account_bank_statement_import_mt940_base",
+            "test_files",
+            "test-wrong-file.940",
+        )
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            zip_file.write(testfile, "rabo.swi")
+            zip_file.write(testfile, "rabo_copy.swi")
+            zip_file.write(wrong_file, "wrong.940")
+        wizard = self.env["l10n.ro.mt940.batch.import"].create({})
+        files = wizard._l10n_ro_read_files("statements.zip", archive.getvalue())
+        self.assertEqual(
+            [name for name, data in files], ["rabo.swi", "rabo_copy.swi", "wrong.940"]
+        )
+        wizard._l10n_ro_import_files(files)
+        self.assertEqual(
+            wizard.line_ids.mapped("state"), ["imported", "duplicate", "error"]
+        )
+        self.assertEqual(wizard.line_ids[0].journal_id, self.journal)
+        self.assertEqual(wizard.line_ids[0].mt940_type, "mt940_general")
+        statements = self.get_statements(self.journal.id)
+        self.assertEqual(len(statements), wizard.line_ids[0].statement_count)
+
+        wizard._l10n_ro_import_files(files[:1])
+        self.assertEqual(wizard.line_ids.mapped("state"), ["duplicate"])
+        self.assertEqual(self.get_statements(self.journal.id), statements)
+
+    def test_batch_import_threads(self):
+        """The files are parsed and imported by the thread pool, the files
+        of a journal in order by the same worker."""
+        testfile = get_module_resource(
+            "l10n_ro_account_bank_statement_import_mt940_base",
+            "test_files",
+            "test-rabo.swi",
+        )
+        with open(testfile, "rb") as datafile:
+            data = datafile.read()
+        # the cursors of the workers share the test transaction
+        self.registry.enter_test_mode(self.cr)
+        self.addCleanup(self.registry.leave_test_mode)
+        wizard = self.env["l10n.ro.mt940.batch.import"].create({})
+        with mock.patch.object(
+            threading.current_thread(), "testing", False, create=True
+        ), mock.patch.object(
+            mt940_batch_import,
+            "ThreadPoolExecutor",
+            wraps=mt940_batch_import.ThreadPoolExecutor,
+        ) as executor:
+            wizard._l10n_ro_import_files([("rabo.swi", data), ("rabo_copy.swi", data)])
+        executor.assert_called_once()
+        self.assertEqual(wizard.line_ids.mapped("state"), ["imported", "duplicate"])
+        statements = self.get_statements(self.journal.id)
+        self.assertEqual(len(statements), wizard.line_ids[0].statement_count)
+        self.assertEqual(len(statements.line_ids), wizard.line_ids[0].transaction_count)
+
+    def test_reimport_skips_imported_transactions(self):
+        """The transactions already imported are found by unique import id."""
+        testfile = get_module_resource(
+            "l10n_ro_account_bank_statement_import_mt940_base",
+            "test_files",
+            "test-rabo.swi",
+        )
+        self._load_statement(testfile)
+        lines = self.get_statements(self.journal.id).mapped("line_ids")
+        import_ids = lines.mapped("unique_import_id")
+        self.assertEqual(len(import_ids), len(lines))
+        self.assertEqual(len(set(import_ids)), len(lines))
+
+        with open(testfile, "rb") as datafile:
+            data = datafile.read()
+        wizard = (
+            self.env["account.statement.import"]
+            .with_context(type="mt940_general")
+            .create(
+                {
+                    "statement_filename": "test import",
+                    "statement_file": base64.b64encode(data),
+                }
+            )
+        )
+        result = {"statement_ids": [], "notifications": []}
+        wizard.import_single_file(data, result)
+        self.assertFalse(result["statement_ids"])
+        self.assertTrue(result["notifications"])
+        self.assertEqual(self.get_statements(self.journal.id).mapped("line_ids"), lines)
+
+    def test_identical_transactions_in_two_statements(self):
+        """The identical transactions of two statements of the same file get
+        different unique import ids, and are all imported."""
+        testfile = get_module_resource(
+            "l10n_ro_account_bank_statement_import_mt940_base",
+            "test_files",
+            "test-rabo.swi",
+        )
+        with open(testfile, "rb") as datafile:
+            data = datafile.read()
+        parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
+        parser = parser.with_context(type="mt940_general")
+        statements = parser.parse(data, header_lines=1)[2]
+        count = sum(len(st["transactions"]) for st in statements)
+
+        self.env["account.statement.import"].with_context(type="mt940_general").create(
+            {
+                "statement_filename": "test import",
+                "statement_file": base64.b64encode(data + data),
+            }
+        ).import_file_button()
+        lines = self.get_statements(self.journal.id).mapped("line_ids")
+        self.assertEqual(len(lines), 2 * count)
+        self.assertEqual(len(set(lines.mapped("unique_import_id"))), 2 * count)
+
+
+@tagged("post_install", "-at_install", "-standard", "mt940_benchmark")
+class TestParseBenchmark(TestMT940BankStatementImport):
+    """Parse timing of a large file, run with --test-tags mt940_benchmark"""
+
+    def test_parse_benchmark(self):
+        """Parse a large file, made of copies of the test file."""
+        copies = 200
+        testfile = get_module_resource(
+            "l10n_ro_account_bank_statement_import_mt940_base",
+            "test_files",
+            "test-rabo.swi",
+        )
+        parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
+        parser = parser.with_context(type="mt940_general")
+        with open(testfile, "rb") as datafile:
+            data = datafile.read()
+        if not data.endswith(b"\n"):
+            data += b"\r\n"
+        statements = parser.parse(data, header_lines=1)[2]
+        start_time = time.perf_counter()
+        big_statements = parser.parse(data * copies, header_lines=1)[2]
+        parse_time = time.perf_counter() - start_time
+        transactions = sum(len(st["transactions"]) for st in big_statements)
+        _logger.info(
+            "MT940: parsed %s transactions (%s bytes) in %.4fs",
+            transactions,
+            len(data) * copies,
+            parse_time,
+        )
+        self.assertEqual(
+            transactions, copies * sum(len(st["transactions"]) for st in statements)
+        )
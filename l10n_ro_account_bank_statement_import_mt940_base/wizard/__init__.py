@@ -0,0 +1 @@
+from . import mt940_batch_import
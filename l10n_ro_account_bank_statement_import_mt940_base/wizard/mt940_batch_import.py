@@ -0,0 +1,310 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import base64
+import io
+import logging
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+from ..models.mt940_partner_index import MT940PartnerIndex
+
+_logger = logging.getLogger(__name__)
+
+# Number of journals imported at the same time, each with its own cursor
+MAX_WORKERS = 4
+ACCOUNT_NUMBER_RE = re.compile(r"^:25:(.*)$", re.MULTILINE)
+
+
+class MT940BatchImport(models.TransientModel):
+    _name = "l10n.ro.mt940.batch.import"
+    _description = "MT940 Bank Statements Batch Import"
+
+    attachment_ids = fields.Many2many(
+        "ir.attachment",
+        string="Files",
+        help="MT940 files or zip archives with MT940 files, from any bank.",
+    )
+    line_ids = fields.One2many(
+        "l10n.ro.mt940.batch.import.line", "wizard_id", string="Summary", readonly=True
+    )
+    duration = fields.Float(string="Duration (s)", readonly=True)
+
+    def action_import(self):
+        self.ensure_one()
+        files = []
+        for attachment in self.attachment_ids:
+            files.extend(self._l10n_ro_read_files(attachment.name, attachment.raw))
+        if not files:
+            raise UserError(_("Please select the files to import."))
+        self._l10n_ro_import_files(files)
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": self._name,
+            "res_id": self.id,
+            "view_mode": "form",
+            "target": "new",
+        }
+
+    @api.model
+    def _l10n_ro_read_files(self, filename, data):
+        """Return the (filename, data) list of the file, or of the files of
+        the zip archive"""
+        if not zipfile.is_zipfile(io.BytesIO(data)):
+            return [(filename, data)]
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            return [
+                (info.filename, archive.read(info))
+                for info in archive.infolist()
+                if not info.is_dir()
+            ]
+
+    @api.model
+    def _l10n_ro_import_directory(self, path):
+        """Import all the files of a server directory, e.g. from a cron"""
+        files = []
+        for filename in sorted(os.listdir(path)):
+            file_path = os.path.join(path, filename)
+            if os.path.isfile(file_path):
+                with open(file_path, "rb") as statement_file:
+                    files.extend(
+                        self._l10n_ro_read_files(filename, statement_file.read())
+                    )
+        wizard = self.create({})
+        wizard._l10n_ro_import_files(files)
+        return wizard
+
+    def _l10n_ro_import_files(self, files):
+        """Detect the journal and the bank of every file, and import the
+        files of every journal in parallel, every file in its own
+        transaction. The files of a journal are parsed and imported in
+        order by the same worker, so that its duplicate statements are
+        found."""
+        start = time.perf_counter()
+        lines_vals = []
+        journal_files = {}
+        journals = self._l10n_ro_get_journals_by_account()
+        for filename, data in files:
+            vals = self._l10n_ro_prepare_file(filename, data, journals)
+            if vals["state"] != "error":
+                journal_files.setdefault(vals["journal_id"], []).append(
+                    (len(lines_vals), filename, data, vals)
+                )
+            lines_vals.append(vals)
+
+        for index, vals in self._l10n_ro_run_imports(list(journal_files.values())):
+            lines_vals[index].update(vals)
+        self.write(
+            {
+                "line_ids": [(5, 0, 0)] + [(0, 0, vals) for vals in lines_vals],
+                "duration": time.perf_counter() - start,
+            }
+        )
+
+    @api.model
+    def _l10n_ro_get_journals_by_account(self):
+        journals = self.env["account.journal"].search(
+            [
+                ("type", "=", "bank"),
+                ("bank_account_id", "!=", False),
+                ("company_id", "in", self.env.companies.ids),
+            ]
+        )
+        return {
+            journal.bank_account_id.sanitized_acc_number: journal
+            for journal in journals
+        }
+
+    @api.model
+    def _l10n_ro_prepare_file(self, filename, data, journals):
+        """Find the journal and the MT940 type of the file, from its account
+        number, the file is parsed later by the import worker"""
+        vals = {"filename": filename, "state": "error"}
+        text = data.decode("utf-8", "ignore")
+        account_match = ACCOUNT_NUMBER_RE.search(text)
+        account_number = account_match and re.sub(
+            r"\W", "", account_match.group(1).upper()
+        )
+        journal = account_number and next(
+            (
+                journal
+                for acc_number, journal in journals.items()
+                if acc_number and acc_number in account_number
+            ),
+            False,
+        )
+        if not journal:
+            vals["message"] = _("No bank journal found for the file account.")
+            return vals
+        import_wizard = self.env["account.statement.import"].with_context(
+            journal_id=journal.id
+        )
+        vals.update(
+            state="draft",
+            journal_id=journal.id,
+            mt940_type=import_wizard._l10n_ro_get_mt940_type(),
+        )
+        return vals
+
+    @api.model
+    def _l10n_ro_get_imported_statements(self, keys):
+        """Return the (journal_id, name, date) keys of the statements which
+        are already imported, with a single search"""
+        if not keys:
+            return set()
+        existing = self.env["account.bank.statement"].search_read(
+            [
+                ("journal_id", "in", list({key[0] for key in keys})),
+                ("name", "in", list({key[1] for key in keys})),
+            ],
+            ["journal_id", "name", "date"],
+        )
+        return keys & {
+            (statement["journal_id"][0], statement["name"], statement["date"])
+            for statement in existing
+        }
+
+    def _l10n_ro_run_imports(self, journal_files):
+        """Import the files of every journal with a worker of its own,
+        return (index, vals) with the result of each file"""
+        if getattr(threading.current_thread(), "testing", False):
+            # the tests can't commit, nor see their data from other cursors
+            return [
+                result
+                for files in journal_files
+                for result in self._l10n_ro_import_journal_files(files)
+            ]
+        uid, context = self.env.uid, self.env.context
+
+        def import_journal_files(files):
+            with api.Environment.manage(), self.pool.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                return env[self._name]._l10n_ro_import_journal_files(files, commit=True)
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = executor.map(import_journal_files, journal_files)
+            results = [result for files in results for result in files]
+        # the statements were created by other cursors
+        self.invalidate_cache()
+        return results
+
+    @api.model
+    def _l10n_ro_import_journal_files(self, files, commit=False):
+        """Import in order the (index, filename, data, vals) files of a
+        journal, with a partner index shared by the files, and commit
+        every file if asked"""
+        partner_index = MT940PartnerIndex(self.env)
+        results = []
+        for index, filename, data, vals in files:
+            results.append(
+                (
+                    index,
+                    self._l10n_ro_import_file(
+                        filename, data, vals, partner_index=partner_index
+                    ),
+                )
+            )
+            if commit:
+                self.env.cr.commit()
+        return results
+
+    @api.model
+    def _l10n_ro_import_file(self, filename, data, vals, partner_index=None):
+        """Parse and import the statements of a file, all or nothing.
+
+        The statements are imported as they are parsed, and the file is
+        rolled back as a duplicate when one of its statements is already
+        imported."""
+        start = time.perf_counter()
+        journal_id = vals["journal_id"]
+        result = {"statement_ids": [], "notifications": []}
+        counts = {"statement_count": 0, "transaction_count": 0}
+        duplicates = []
+        parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
+        parser = parser.with_context(type=vals["mt940_type"], journal_id=journal_id)
+        import_wizard = (
+            self.env["account.statement.import"]
+            .with_context(journal_id=journal_id, type=vals["mt940_type"])
+            .create(
+                {
+                    "statement_filename": filename,
+                    "statement_file": base64.b64encode(data),
+                }
+            )
+        )
+
+        def get_statements():
+            for currency, account_number, statement in parser.parse_statements(
+                data, partner_index=partner_index
+            ):
+                if not statement or not statement["transactions"]:
+                    continue
+                key = (
+                    journal_id,
+                    statement["name"],
+                    statement["date"] and statement["date"].date(),
+                )
+                if self._l10n_ro_get_imported_statements({key}):
+                    duplicates.append(statement["name"] or "")
+                    raise UserError(
+                        _("Statements already imported: %s") % ", ".join(duplicates)
+                    )
+                counts["statement_count"] += 1
+                counts["transaction_count"] += len(statement["transactions"])
+                yield currency, account_number, statement
+
+        try:
+            with self.env.cr.savepoint():
+                import_wizard._l10n_ro_import_statements(
+                    get_statements(), result, partner_index=partner_index
+                )
+        except Exception as e:
+            if not duplicates:
+                _logger.warning("Import of the MT940 file %s failed: %s", filename, e)
+            return {
+                "state": "duplicate" if duplicates else "error",
+                "message": str(e),
+                "duration": time.perf_counter() - start,
+            }
+        return dict(
+            counts,
+            state="imported",
+            message="\n".join(
+                notification.get("message", "")
+                for notification in result["notifications"]
+            ),
+            duration=time.perf_counter() - start,
+        )
+
+
+class MT940BatchImportLine(models.TransientModel):
+    _name = "l10n.ro.mt940.batch.import.line"
+    _description = "MT940 Bank Statements Batch Import Line"
+    _order = "id"
+
+    wizard_id = fields.Many2one(
+        "l10n.ro.mt940.batch.import", required=True, ondelete="cascade"
+    )
+    filename = fields.Char(string="File")
+    journal_id = fields.Many2one("account.journal")
+    mt940_type = fields.Char(string="MT940 Type")
+    state = fields.Selection(
+        [
+            ("draft", "Not Imported"),
+            ("imported", "Imported"),
+            ("duplicate", "Duplicate"),
+            ("error", "Error"),
+        ],
+        default="draft",
+    )
+    statement_count = fields.Integer(string="Statements")
+    transaction_count = fields.Integer(string="Transactions")
+    duration = fields.Float(string="Duration (s)", digits=(16, 3))
+    message = fields.Text()
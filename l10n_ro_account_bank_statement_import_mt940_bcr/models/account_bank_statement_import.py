@@ -4,6 +4,10 @@
 
 from odoo import models
 
+from odoo.addons.l10n_ro_account_bank_statement_import_mt940_base.models import (
+    mt940_partner_index,
+)
+
 
 class AccountBankStatementImport(models.TransientModel):
     _inherit = "account.statement.import"
@@ -23,15 +27,26 @@ class AccountBankStatementImport(models.TransientModel):
                 return self._post_parse_file(data)
         return super(AccountBankStatementImport, self)._parse_file(data_file)
 
-    def _post_parse_file(self, data):
+    def _l10n_ro_get_mt940_type(self):
+        if self._is_bcr():
+            return "mt940_ro_bcr"
+        return super()._l10n_ro_get_mt940_type()
+
+    def _l10n_ro_post_parse_statement(self, data, partner_index=None):
+        if self._is_bcr():
+            return self._post_parse_file(data, partner_index=partner_index)
+        return super()._l10n_ro_post_parse_statement(data, partner_index=partner_index)
+
+    def _post_parse_file(self, data, partner_index=None):
         currency, account_num, all_statements = data
+        if not partner_index:
+            partner_index = mt940_partner_index.MT940PartnerIndex(self.env)
         for statements in all_statements:
             for transaction in statements["transactions"]:
                 vat = transaction.pop("vat", False)
-                if vat:
-                    domain = [("vat", "like", vat), ("is_company", "=", True)]
-                    partner = self.env["res.partner"].search(domain, limit=1)
-                    if partner:
-                        transaction["partner_name"] = partner.name
-                        transaction["partner_id"] = partner.id
+                partner_id = partner_index.find_by_vat(vat, company=True)
+                if partner_id:
+                    partner = self.env["res.partner"].browse(partner_id)
+                    transaction["partner_name"] = partner.name
+                    transaction["partner_id"] = partner.id
         return data
@@ -120,15 +120,11 @@ class MT940Parser(models.AbstractModel):
                         ).strip()
                         transaction["account_number"] = parsed_data.get("iban_b")
                         vat = parsed_data.get("codfis_b")
-                    if vat:
-                        domain = [
-                            ("vat", "=", vat),
-                            ("is_company", "=", True),
-                        ]
-                        partner = self.env["res.partner"].search(domain, limit=1)
-                        if partner:
-                            transaction["partner_name"] = partner.name
-                            transaction["partner_id"] = partner.id
+                    partner_id = result["partner_index"].find_by_vat(vat, company=True)
+                    if partner_id:
+                        partner = self.env["res.partner"].browse(partner_id)
+                        transaction["partner_name"] = partner.name
+                        transaction["partner_id"] = partner.id
                     if parsed_data.get("detalii"):
                         transaction["payment_ref"] = parsed_data.get("detalii")
 
@@ -124,3 +124,23 @@ class TestImport(TestMT940BankStatementImport):
         self.assertTrue(line.date == fields.Date.from_string("2022-10-31"))
         self.assertTrue(line.payment_ref == transact["payment_ref"])
         self.assertTrue(line.ref == transact["ref"])
+
+    def test_parse(self):
+        """The BCR statements are named after the account."""
+        transactions = self.assert_parsed_file(
+            "l10n_ro_account_bank_statement_import_mt940_bcr",
+            "test_file_bcr.STA",
+            "mt940_ro_bcr",
+            "RO48RNCB0090000506460001",
+            [
+                (
+                    "RO48RNCB0090000506460001",
+                    1000.0,
+                    0.0,
+                    [1000.0, -4.0, -2.0, -243836.22],
+                )
+            ],
+        )
+        self.assertEqual(transactions[0]["ref"], "221031S029321541")
+        self.assertEqual(transactions[0]["partner_name"], "Test Partner BCR")
+        self.assertEqual(transactions[0]["account_number"], "RO24BREL0002002472400100")
@@ -22,3 +22,8 @@ class AccountBankStatementImport(models.TransientModel):
             if data:
                 return data
         return super(AccountBankStatementImport, self)._parse_file(data_file)
+
+    def _l10n_ro_get_mt940_type(self):
+        if self._is_brd():
+            return "mt940_ro_brd"
+        return super()._l10n_ro_get_mt940_type()
@@ -101,3 +101,22 @@ class TestImport(TestMT940BankStatementImport):
         self.assertTrue(line.date == fields.Date.from_string("2016-05-17"))
         self.assertTrue(line.payment_ref == transact["payment_ref"])
         self.assertTrue(line.ref == transact["ref"])
+
+    def test_parse(self):
+        """BRD puts the payment reference after the transaction reference."""
+        transactions = self.assert_parsed_file(
+            "l10n_ro_account_bank_statement_import_mt940_brd",
+            "test_brd_940.txt",
+            "mt940_ro_brd",
+            "RO56BRDE360SV52474653600",
+            [("00138/1", 1000.0, 1998.0, [1000.0, -2.0])],
+        )
+        self.assertEqual(
+            [tr["ref"] for tr in transactions], ["OPH478PLATA", "OPH47825"]
+        )
+        self.assertEqual(
+            [tr["payment_ref"] for tr in transactions],
+            ["/PLATA FACT 4603309", "/25-Comision MULTIX"],
+        )
+        self.assertEqual(transactions[0]["partner_name"], "NEXTERP ROMANIA SRL")
+        self.assertEqual(transactions[0]["account_number"], "RO89RZBR0000060003480121")
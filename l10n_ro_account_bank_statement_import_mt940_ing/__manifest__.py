@@ -5,7 +5,7 @@
 
 {
     "name": "MT940 ING Format Bank Statements Import",
-    "version": "14.0.1.5.0",
+    "version": "14.0.1.6.0",
     "license": "AGPL-3",
     "author": "Terrabit,"
     "NextERP Romania SRL,"
@@ -14,7 +14,11 @@
     "website": "https://github.com/OCA/l10n-romania",
     "category": "Localization",
     "depends": ["l10n_ro_account_bank_statement_import_mt940_base"],
-    "data": ["views/res_bank_view.xml"],
+    "data": [
+        "security/ir.model.access.csv",
+        "wizard/mt940_tag86_pattern_test_view.xml",
+        "views/res_bank_view.xml",
+    ],
     "installable": True,
     "development_status": "Mature",
     "maintainers": ["feketemihai", "dhongu"],
@@ -21,11 +21,21 @@ class AccountBankStatementImport(models.TransientModel):
             parser = parser.with_context(type="mt940_ro_ing")
             data = parser.parse(data_file)
             if data:
-                account_number = data[1]
-                bank = self.env.company.bank_ids.filtered(
-                    lambda b: account_number in b.sanitized_acc_number
-                )
-                if bank:
-                    return (data[0], bank.sanitized_acc_number, data[2])
-                return data
+                return self._l10n_ro_post_parse_statement(data)
         return super(AccountBankStatementImport, self)._parse_file(data_file)
+
+    def _l10n_ro_get_mt940_type(self):
+        if self._is_ing():
+            return "mt940_ro_ing"
+        return super()._l10n_ro_get_mt940_type()
+
+    def _l10n_ro_post_parse_statement(self, data, partner_index=None):
+        if self._is_ing():
+            account_number = data[1]
+            bank = self.env.company.bank_ids.filtered(
+                lambda b: account_number in b.sanitized_acc_number
+            )
+            if bank:
+                return (data[0], bank.sanitized_acc_number, data[2])
+            return data
+        return super()._l10n_ro_post_parse_statement(data, partner_index=partner_index)
@@ -5,7 +5,11 @@
 import re
 from datetime import datetime
 
-from odoo import models
+from odoo import models, tools
+
+from odoo.addons.l10n_ro_account_bank_statement_import_mt940_base.models import (
+    mt940_partner_index,
+)
 
 
 class MT940Parser(models.AbstractModel):
@@ -111,46 +115,47 @@ class MT940Parser(models.AbstractModel):
             # pentru eliminarea spatiilor din codewords (in data)
             data = self._clean_codewords(data, codewords)
 
+            prefix_regex = self._get_codeword_prefix_regex(codewords[:-2])
             for word in data.split(self.get_subfield_split_text()):
                 word = word.strip()
                 if not word and not current_codeword:
                     continue
 
-                cw_found = False
-                for cw in codewords[:-2]:
-                    len_cw = len(cw)
-                    if word[:len_cw] == cw:
-                        current_codeword = cw
-                        subfields[cw] = [word[len_cw:]]
-                        cw_found = True
-                        break
-
-                if cw_found:
+                cw_match = prefix_regex.match(word)
+                if cw_match:
+                    current_codeword = cw_match.group(0)
+                    subfields[current_codeword] = [word[cw_match.end() :]]
                     continue
 
                 if current_codeword in subfields:
-                    len_cw = 0 if not cw_found else len(current_codeword)
-                    subfields[current_codeword].append(word[len_cw:])
+                    subfields[current_codeword].append(word)
             return subfields
         return super().get_subfields(data, codewords)
 
-    def handle_common_subfields(self, transaction, subfields):
+    @tools.ormcache("tuple(codewords)")
+    def _get_codeword_prefix_regex(self, codewords):
+        """Match the first codeword, in list order, which starts a word"""
+        return re.compile("|".join(re.escape(cw) for cw in codewords))
+
+    def handle_common_subfields(self, transaction, subfields, partner_index=None):
         """Deal with common functionality for tag 86 subfields."""
         # Get counterpart from 31, 32 or 33 subfields:
         if self.get_mt940_type() == "mt940_ro_ing":
+            if not partner_index:
+                partner_index = mt940_partner_index.MT940PartnerIndex(self.env)
             counterpart_fields = []
             if "110" in subfields:
-                self.handle_common_subfields_100(transaction, subfields)
+                self.handle_common_subfields_100(
+                    transaction, subfields, partner_index=partner_index
+                )
 
             if "32" in subfields:
                 partner_name = subfields["32"][0]
                 transaction.update({"partner_name": partner_name})
                 if not transaction.get("partner_id"):
-                    partner = self.env["res.partner"].search(
-                        [("name", "=ilike", partner_name)], limit=1
-                    )
-                    if partner:
-                        transaction.update({"partner_id": partner.id})
+                    partner_id = partner_index.find_by_name(partner_name)
+                    if partner_id:
+                        transaction.update({"partner_id": partner_id})
             for counterpart_field in [
                 "31",
                 "32",
@@ -194,41 +199,72 @@ class MT940Parser(models.AbstractModel):
             if transaction.get("ref") in subfields:
                 transaction["ref"] = "".join(subfields[transaction["ref"]])
             return transaction
-        return super().handle_common_subfields(transaction, subfields)
+        return super().handle_common_subfields(
+            transaction, subfields, partner_index=partner_index
+        )
 
-    def handle_common_subfields_100(self, transaction, subfields):
+    def handle_common_subfields_100(self, transaction, subfields, partner_index=None):
         # tag 86 nestructurat
-        journal = self.env["account.journal"].browse(self._context.get("journal_id", 0))
-        if journal.bank_account_id.l10n_ro_unstructured_tag86:
-            patterns = journal.bank_account_id.l10n_ro_unstructured_tag86.split("\n")
-        else:
-            patterns = [
-                "INCASARE[\n]?[ ]*(?P<partner_name>.*)[ ](?P<vat>[A-Z]{0,}[0-9]{8})?[ ]"
-                "(?P<account_number>[A-Z]{2}[0-9]{2}[A-Z]{4}\\w{16}).*",
-                r"(.*)(?P<account_number>[A-Z]{2}[0-9]{2}[A-Z]{4}\w{16}).*",
-            ]
-
         data = "".join(subfields["110"])
-        result = None
-        for pattern in patterns:
-            pattern = re.compile(pattern)
-            result = pattern.match(data)
-            if result:
-                result = result.groupdict()
-                break
+        transaction["narration"] = data
+        result = self._l10n_ro_match_unstructured_tag86(
+            data, self._l10n_ro_get_unstructured_tag86_patterns()
+        )
 
         if result:
             if result.get("vat"):
-                partner = self.env["res.partner"].search(
-                    [("l10n_ro_vat_number", "like", result["vat"])], limit=1
-                )
-                if partner:
-                    transaction.update({"partner_id": partner.id})
+                if not partner_index:
+                    partner_index = mt940_partner_index.MT940PartnerIndex(self.env)
+                partner_id = partner_index.find_by_vat(result["vat"])
+                if partner_id:
+                    transaction.update({"partner_id": partner_id})
             if result.get("partner_name"):
                 transaction.update({"partner_name": result["partner_name"]})
             if result.get("account_number"):
                 transaction.update({"account_number": result["account_number"]})
 
+    def _l10n_ro_get_unstructured_tag86_patterns(self):
+        """Return the compiled patterns of the journal bank account, or the
+        default ones"""
+        journal = self.env["account.journal"].browse(self._context.get("journal_id", 0))
+        bank_account = journal.bank_account_id
+        if bank_account.l10n_ro_unstructured_tag86:
+            patterns = bank_account._l10n_ro_get_unstructured_tag86_patterns()
+            if patterns:
+                return patterns
+        return self._l10n_ro_get_default_unstructured_tag86_patterns()
+
+    @tools.ormcache()
+    def _l10n_ro_get_default_unstructured_tag86_patterns(self):
+        return tuple(
+            re.compile(pattern)
+            for pattern in [
+                "INCASARE[\n]?[ ]*(?P<partner_name>.*)[ ](?P<vat>[A-Z]{0,}[0-9]{8})?[ ]"
+                "(?P<account_number>[A-Z]{2}[0-9]{2}[A-Z]{4}\\w{16}).*",
+                r"(.*)(?P<account_number>[A-Z]{2}[0-9]{2}[A-Z]{4}\w{16}).*",
+            ]
+        )
+
+    def _l10n_ro_match_unstructured_tag86(self, data, patterns):
+        """Return the groups of the first pattern matching the data"""
+        for pattern in patterns:
+            match = pattern.match(data)
+            if match:
+                return match.groupdict()
+        return None
+
+    def _l10n_ro_get_unstructured_tag86_texts(self, data):
+        """Return the unstructured tag 86 texts of the statement file, kept
+        in the narration of the transactions"""
+        parser = self.with_context(type="mt940_ro_ing")
+        return [
+            transaction["narration"]
+            for _currency, _account, statement in parser.parse_statements(data)
+            if statement
+            for transaction in statement["transactions"]
+            if "narration" in transaction
+        ]
+
     def handle_tag_25(self, data, result):
         if self.get_mt940_type() == "mt940_ro_ing":
             result["account_number"] = data.replace("/", "").strip()
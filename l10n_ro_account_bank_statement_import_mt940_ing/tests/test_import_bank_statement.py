@@ -3,10 +3,16 @@
 # Copyright (C) 2022 NextERP Romania
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+import base64
+
 from odoo import fields
+from odoo.exceptions import ValidationError
 from odoo.modules.module import get_module_resource
 from odoo.tests import tagged
 
+from odoo.addons.l10n_ro_account_bank_statement_import_mt940_base.models import (
+    mt940_partner_index,
+)
 from odoo.addons.l10n_ro_account_bank_statement_import_mt940_base.tests.common import (
     TestMT940BankStatementImport,
 )
@@ -145,3 +151,80 @@ class TestImport(TestMT940BankStatementImport):
         self.assertTrue(line.date == fields.Date.from_string("2020-02-11"))
         self.assertTrue(line.payment_ref == transact["payment_ref"])
         self.assertTrue(line.ref == transact["ref"])
+
+    def test_parse(self):
+        """The ING statements are named after the account."""
+        transactions = self.assert_parsed_file(
+            "l10n_ro_account_bank_statement_import_mt940_ing",
+            "test_ing_940.txt",
+            "mt940_ro_ing",
+            "RO19INGB0000999904621843",
+            [("RO19INGB0000999904621843", 1000.0, 2000.0, [1000.0])],
+        )
+        self.assertEqual(transactions[0]["ref"], "RE20200211-7523")
+        self.assertEqual(transactions[0]["partner_name"], "NEXTERP ROMANIA SRL")
+        self.assertEqual(transactions[0]["account_number"], "RO25INGB0014000031948911")
+
+    def test_partner_index(self):
+        """The partners are found by name and VAT without a search per
+        transaction."""
+        partner = self.env["res.partner"].create(
+            {"name": "NextERP Romania SRL", "vat": "RO30834857", "is_company": True}
+        )
+        index = mt940_partner_index.MT940PartnerIndex(self.env)
+        self.assertEqual(index.find_by_name("NEXTERP  ROMANIA SRL"), partner.id)
+        self.assertEqual(index.find_by_vat("30834857"), partner.id)
+        self.assertEqual(index.find_by_vat("RO30834857", company=True), partner.id)
+        self.assertFalse(index.find_by_name("NEXTERP ROMANIA"))
+
+        transaction = dict(self.transactions[0])
+        parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
+        parser = parser.with_context(type="mt940_ro_ing")
+        subfields = parser.get_subfields(self.data, self.codewords)
+        parser.handle_common_subfields(transaction, subfields, partner_index=index)
+        self.assertEqual(transaction["partner_id"], partner.id)
+
+    def test_unstructured_tag86_patterns(self):
+        """The compiled patterns are cached by their text."""
+        self.bank.l10n_ro_unstructured_tag86 = "INCASARE (?P<partner_name>.*)\n"
+        patterns = self.bank._l10n_ro_get_unstructured_tag86_patterns()
+        self.assertEqual(len(patterns), 1)
+        self.assertIs(self.bank._l10n_ro_get_unstructured_tag86_patterns(), patterns)
+        self.bank.l10n_ro_unstructured_tag86 = "PLATA (?P<partner_name>.*)"
+        patterns = self.bank._l10n_ro_get_unstructured_tag86_patterns()
+        self.assertEqual(patterns[0].pattern, "PLATA (?P<partner_name>.*)")
+
+        parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
+        parser = parser.with_context(type="mt940_ro_ing", journal_id=self.journal.id)
+        transaction = {}
+        parser.handle_common_subfields_100(
+            transaction, {"110": ["PLATA NEXTERP ROMANIA SRL"]}
+        )
+        self.assertEqual(transaction["partner_name"], "NEXTERP ROMANIA SRL")
+        self.assertEqual(transaction["narration"], "PLATA NEXTERP ROMANIA SRL")
+
+        with self.assertRaises(ValidationError):
+            self.bank.l10n_ro_unstructured_tag86 = "PLATA (?P<partner_name>.*"
+
+    def test_unstructured_tag86_pattern_test_wizard(self):
+        """The wizard shows the match rate of the patterns on a statement."""
+        testfile = get_module_resource(
+            "l10n_ro_account_bank_statement_import_mt940_ing",
+            "test_files",
+            "test_ing_940n.txt",
+        )
+        with open(testfile, "rb") as datafile:
+            statement_file = base64.b64encode(datafile.read())
+        wizard = self.env["l10n.ro.mt940.tag86.pattern.test"].create(
+            {
+                "bank_account_id": self.bank.id,
+                "patterns": "(?P<partner_name>.*)",
+                "statement_file": statement_file,
+            }
+        )
+        wizard.action_test_patterns()
+        self.assertEqual(wizard.texts_count, 1)
+        self.assertEqual(wizard.matched_count, 1)
+        self.assertEqual(wizard.match_rate, 100)
+        wizard.action_apply_patterns()
+        self.assertEqual(self.bank.l10n_ro_unstructured_tag86, "(?P<partner_name>.*)")
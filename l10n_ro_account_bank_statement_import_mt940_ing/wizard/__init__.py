@@ -0,0 +1 @@
+from . import mt940_tag86_pattern_test
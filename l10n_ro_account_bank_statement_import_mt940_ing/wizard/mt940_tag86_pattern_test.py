@@ -0,0 +1,96 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import base64
+import re
+import time
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+
+class MT940Tag86PatternTest(models.TransientModel):
+    _name = "l10n.ro.mt940.tag86.pattern.test"
+    _description = "Test MT940 Unstructured Tag 86 Patterns"
+
+    bank_account_id = fields.Many2one("res.partner.bank", required=True)
+    patterns = fields.Text(
+        compute="_compute_patterns",
+        store=True,
+        readonly=False,
+        help="One pattern per line, the default ones are used if empty.",
+    )
+    statement_file = fields.Binary(string="Sample Statement", required=True)
+    statement_filename = fields.Char()
+    texts_count = fields.Integer(string="Unstructured Texts", readonly=True)
+    matched_count = fields.Integer(string="Matched Texts", readonly=True)
+    match_rate = fields.Float(string="Match Rate (%)", readonly=True)
+    duration = fields.Float(string="Matching Time (ms)", readonly=True)
+    result = fields.Text(readonly=True)
+
+    @api.depends("bank_account_id")
+    def _compute_patterns(self):
+        for wizard in self:
+            wizard.patterns = wizard.bank_account_id.l10n_ro_unstructured_tag86
+
+    def action_test_patterns(self):
+        """Match the patterns against all the unstructured tag 86 texts of
+        the sample statement, and show the match rate and timing"""
+        self.ensure_one()
+        parser = self.env["l10n.ro.account.bank.statement.import.mt940.parser"]
+        parser = parser.with_context(type="mt940_ro_ing")
+        try:
+            patterns = self.bank_account_id._l10n_ro_compile_tag86_patterns(
+                self.patterns
+            )
+        except re.error as e:
+            raise UserError(_("Invalid pattern: %s") % e)
+        if not patterns:
+            patterns = parser._l10n_ro_get_default_unstructured_tag86_patterns()
+        texts = parser._l10n_ro_get_unstructured_tag86_texts(
+            base64.b64decode(self.statement_file)
+        )
+        if not texts:
+            raise UserError(_("The statement has no unstructured tag 86 texts."))
+
+        hits = dict.fromkeys(patterns, 0)
+        unmatched = []
+        start = time.perf_counter()
+        for text in texts:
+            for pattern in patterns:
+                if pattern.match(text):
+                    hits[pattern] += 1
+                    break
+            else:
+                unmatched.append(text)
+        duration = (time.perf_counter() - start) * 1000
+
+        lines = [
+            _("%s texts matched by %s") % (count, pattern.pattern)
+            for pattern, count in hits.items()
+        ]
+        if unmatched:
+            lines.append(_("Not matched:"))
+            lines.extend(unmatched[:20])
+        matched_count = len(texts) - len(unmatched)
+        self.write(
+            {
+                "texts_count": len(texts),
+                "matched_count": matched_count,
+                "match_rate": 100.0 * matched_count / len(texts),
+                "duration": duration,
+                "result": "\n".join(lines),
+            }
+        )
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": self._name,
+            "res_id": self.id,
+            "view_mode": "form",
+            "target": "new",
+        }
+
+    def action_apply_patterns(self):
+        self.ensure_one()
+        self.bank_account_id.l10n_ro_unstructured_tag86 = self.patterns
+        return {"type": "ir.actions.act_window_close"}
@@ -80,7 +80,7 @@ class MT940Parser(models.AbstractModel):
             return subfields
         return super().get_subfields(data, codewords)
 
-    def handle_common_subfields(self, transaction, subfields):
+    def handle_common_subfields(self, transaction, subfields, partner_index=None):
         """Deal with common functionality for tag 86 subfields."""
         # Get counterpart from 31, 32 or 33 subfields:
         if self.get_mt940_type() == "mt940_ro_rffsn":
@@ -108,7 +108,9 @@ class MT940Parser(models.AbstractModel):
             if transaction.get("ref") in subfields:
                 transaction["ref"] = "".join(subfields[transaction["ref"]])
             return transaction
-        return super().handle_common_subfields(transaction, subfields)
+        return super().handle_common_subfields(
+            transaction, subfields, partner_index=partner_index
+        )
 
     def handle_tag_28C(self, data, result):
         """Sequence number within batch - normally only zeroes."""
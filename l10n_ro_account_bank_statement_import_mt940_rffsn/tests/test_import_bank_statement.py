@@ -102,3 +102,20 @@ RGER LOGISTICS ROU"""
         self.assertTrue(line.date == fields.Date.from_string("2012-06-18"))
         self.assertTrue(line.payment_ref == transact["payment_ref"])
         self.assertTrue(line.ref == transact["ref"])
+
+    def test_parse(self):
+        """Raiffeisen gives no partner for its own fees."""
+        transactions = self.assert_parsed_file(
+            "l10n_ro_account_bank_statement_import_mt940_rffsn",
+            "test_rffsn_940.txt",
+            "mt940_ro_rffsn",
+            "RO40RZBR0000060001111111",
+            [(None, 15564.52, 16083.73, [1179.87, -654.96, -5.7])],
+        )
+        self.assertEqual(
+            [tr.get("partner_name") for tr in transactions],
+            ["QUEHENBERGER LOGISTICS ROU", "DANTE INTERNATIONAL SA", None],
+        )
+        self.assertEqual(
+            [tr["ref"] for tr in transactions], ["11808959", "NONREF", "NONREF"]
+        )
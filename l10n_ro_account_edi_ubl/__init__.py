@@ -2,4 +2,5 @@
 # See README.rst file on addons root folder for license details
 
 from . import models
+from . import tools
 from .init_hook import pre_init_hook
@@ -12,6 +12,7 @@
     "data": [
         "security/ir.model.access.csv",
         "data/account_edi_data.xml",
+        "data/account_edi_cron.xml",
         "data/ubl_templates.xml",
         "views/res_config_settings_views.xml",
         "views/account_invoice.xml",
@@ -20,7 +21,7 @@
         "views/cius_template.xml",
     ],
     "license": "AGPL-3",
-    "version": "14.0.1.15.0",
+    "version": "14.0.1.21.0",
     "author": "Terrabit," "NextERP Romania," "Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/l10n-romania",
     "installable": True,
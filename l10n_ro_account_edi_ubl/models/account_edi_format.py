@@ -3,35 +3,94 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
-import requests
+import psycopg2
 from lxml import etree
+from requests.exceptions import RequestException
 
-from odoo import _, models
+from odoo import _, fields, models
+from odoo.exceptions import UserError, ValidationError
+
+from odoo.addons.l10n_ro_config.tools import http_client
+
+from ..tools import e_invoice, validator
 
 _logger = logging.getLogger(__name__)
 
+# Number of invoices exported together, their records are read at once
+EXPORT_BATCH_SIZE = 500
+# Retries of an upload when the connection could not be made or after a 429
+# response, the other failures may come after ANAF received the invoice,
+# they are not retried to not upload it twice
+UPLOAD_RETRIES = 2
+UPLOAD_RETRY_STATUS = (429,)
+UPLOAD_RETRY_ERRORS = http_client.is_connect_error
+# Days of ANAF messages read when checking the state of the invoices
+MESSAGES_DAYS = 50
+# Minutes between the automatic checks while ANAF processes the invoices
+STATUS_CHECK_MIN_INTERVAL = 5
+STATUS_CHECK_MAX_INTERVAL = 120
+# Number of downloaded vendor bills created together
+DOWNLOAD_BATCH_SIZE = 100
+
 
 class AccountEdiXmlCIUSRO(models.Model):
     _inherit = "account.edi.format"
 
     def _export_cius_ro(self, invoice):
         self.ensure_one()
-        # Create file content.
-        builder = self._get_xml_builder(invoice.company_id)
-        xml_content, errors = builder._export_invoice(invoice)
-        xml_content = xml_content.decode()
-        xml_content = xml_content.encode()
-        xml_name = builder._export_invoice_filename(invoice)
-        return self.env["ir.attachment"].create(
-            {
-                "name": xml_name,
-                "raw": xml_content,
-                "mimetype": "application/xml",
-                "res_model": "account.move",
-                "res_id": invoice.id,
-            }
+        return self._export_cius_ro_batch(invoice)[invoice]
+
+    def _export_cius_ro_batch(self, invoices):
+        """Create the CIUS-RO XML attachments of the invoices, by batches.
+
+        The lines, partners, taxes and products of a batch are read together
+        before rendering, the partner values are shared by the invoices of
+        the batch, and the attachments are created with one create.
+        Return a dictionary invoice: attachment.
+        """
+        self.ensure_one()
+        res = {}
+        for start in range(0, len(invoices), EXPORT_BATCH_SIZE):
+            batch = invoices[start : start + EXPORT_BATCH_SIZE]
+            self._l10n_ro_prefetch_cius_ro(batch)
+            # the partner values are computed once for all the batch
+            memo = {}
+            vals_list = []
+            for invoice in batch:
+                builder = self._get_xml_builder(invoice.company_id).with_context(
+                    l10n_ro_partner_vals_memo=memo
+                )
+                xml_content, errors = builder._export_invoice(invoice)
+                vals_list.append(
+                    {
+                        "name": builder._export_invoice_filename(invoice),
+                        "raw": xml_content,
+                        "mimetype": "application/xml",
+                        "res_model": "account.move",
+                        "res_id": invoice.id,
+                    }
+                )
+            attachments = self.env["ir.attachment"].create(vals_list)
+            res.update(zip(batch, attachments))
+        return res
+
+    def _l10n_ro_prefetch_cius_ro(self, invoices):
+        """Read at once the records used to render the XML of the invoices"""
+        lines = invoices.mapped("invoice_line_ids")
+        lines.mapped("product_id.product_tmpl_id")
+        lines.mapped("product_uom_id")
+        lines.mapped("tax_ids")
+        partners = (
+            invoices.mapped("partner_id")
+            | invoices.mapped("commercial_partner_id")
+            | invoices.mapped("company_id.partner_id")
         )
+        partners.mapped("country_id")
+        partners.mapped("state_id")
 
     def _export_invoice_filename(self, invoice):
         return f"{invoice.name.replace('/', '_')}_cius_ro.xml"
@@ -53,6 +112,11 @@ class AccountEdiXmlCIUSRO(models.Model):
             return self.env["account.edi.xml.cius_ro"]
         return super()._get_xml_builder(company)
 
+    def _support_batching(self, move=None, state=None, company=None):
+        if self.code != "cius_ro":
+            return super()._support_batching(move=move, state=state, company=company)
+        return True
+
     def _is_compatible_with_journal(self, journal):
         self.ensure_one()
         if self.code != "cius_ro":
@@ -62,31 +126,25 @@ class AccountEdiXmlCIUSRO(models.Model):
     def _is_required_for_invoice(self, invoice):
         if self.code != "cius_ro":
             return super()._is_required_for_invoice(invoice)
-        is_required = invoice.commercial_partner_id.l10n_ro_e_invoice
-        if not is_required:
-            # Check if it contains high risk products
-            invoice_nc_codes = list(
-                set(invoice.invoice_line_ids.mapped("product_id.l10n_ro_nc_code"))
-            )
-            high_risk_nc_codes = invoice.get_l10n_ro_high_risk_nc_codes()
-            if invoice_nc_codes and invoice_nc_codes != [False]:
-                for hr_code in high_risk_nc_codes:
-                    if any(
-                        item and item.startswith(hr_code) for item in invoice_nc_codes
-                    ):
-                        is_required = True
-                        break
-        return is_required
+        if invoice.commercial_partner_id.l10n_ro_e_invoice:
+            return True
+        # Check if it contains high risk products, the stored flag of the
+        # products of all the invoices being checked is read at once
+        return any(invoice.invoice_line_ids.mapped("product_id.l10n_ro_high_risk_nc"))
 
     def _post_invoice_edi(self, invoices, test_mode=False):
         self.ensure_one()
         if self.code != "cius_ro":
             return super()._post_invoice_edi(invoices, test_mode)
         res = {}
+        attachments = {
+            invoice: invoice._get_edi_attachment(self) for invoice in invoices
+        }
+        to_export = invoices.filtered(lambda i: not attachments[i])
+        attachments.update(self._export_cius_ro_batch(to_export))
+        to_upload = to_check = self.env["account.move"]
         for invoice in invoices:
-            attachment = invoice._get_edi_attachment(self)
-            if not attachment:
-                attachment = self._export_cius_ro(invoice)
+            attachment = attachments[invoice]
             res[invoice] = {"attachment": attachment, "success": True}
             anaf_config = invoice.company_id.l10n_ro_account_anaf_sync_id
             if anaf_config.state != "manual" and (
@@ -94,12 +152,29 @@ class AccountEdiXmlCIUSRO(models.Model):
                 and self.env.context.get("l10n_ro_edi_manual_action")
             ):
                 if not invoice.l10n_ro_edi_transaction:
-                    res[invoice] = self._l10n_ro_post_invoice_step_1(
-                        invoice, attachment
-                    )
+                    to_upload |= invoice
                 else:
-                    res[invoice] = self._l10n_ro_post_invoice_step_2(invoice)
-
+                    to_check |= invoice
+        # the XML already validated by _check_move_configuration is not
+        # validated again, unless the attachment changed since
+        errors = self._l10n_ro_validate_cius_ro(
+            {
+                invoice: attachments[invoice].raw
+                for invoice in to_upload
+                if attachments[invoice].checksum
+                != invoice.l10n_ro_edi_validated_checksum
+            }
+        )
+        for invoice, invoice_errors in errors.items():
+            if invoice_errors:
+                to_upload -= invoice
+                res[invoice] = {
+                    "success": False,
+                    "error": "\n".join(invoice_errors),
+                    "blocking_level": "error",
+                }
+        res.update(self._l10n_ro_post_invoices_step_1(to_upload, attachments))
+        res.update(self._l10n_ro_post_invoices_step_2(to_check))
         return res
 
     def _cancel_invoice_edi(self, invoices, test_mode=False):
@@ -139,8 +214,37 @@ class AccountEdiXmlCIUSRO(models.Model):
                     )
                     % partner.name
                 ]
+        if not errors and any(self._l10n_ro_get_cius_ro_validation_files()):
+            builder = self._get_xml_builder(move.company_id)
+            xml_content = builder._export_invoice(move)[0]
+            errors += self._l10n_ro_validate_cius_ro({move: xml_content})[move]
+            if not errors:
+                move.l10n_ro_edi_validated_checksum = self.env[
+                    "ir.attachment"
+                ]._compute_checksum(xml_content)
         return errors
 
+    def _l10n_ro_get_cius_ro_validation_files(self):
+        """Return the paths of the UBL XSD and of the CIUS-RO schematron
+        compiled to XSLT, used to validate the XML before the upload"""
+        get_param = self.env["ir.config_parameter"].sudo().get_param
+        return (
+            get_param("l10n_ro_account_edi_ubl.cius_ro_xsd_file", False),
+            get_param("l10n_ro_account_edi_ubl.cius_ro_schematron_file", False),
+        )
+
+    def _l10n_ro_validate_cius_ro(self, invoices_xml):
+        """Validate the XML of the invoices, given as a dictionary invoice:
+        XML content, in parallel. Return a dictionary invoice: errors list,
+        empty when the validation is not configured."""
+        xsd_file, schematron_file = self._l10n_ro_get_cius_ro_validation_files()
+        if not invoices_xml or not (xsd_file or schematron_file):
+            return {}
+        results = validator.validate_many(
+            invoices_xml.values(), xsd_file, schematron_file
+        )
+        return dict(zip(invoices_xml, results))
+
     def _get_invoice_edi_content(self, move):
         if self.code != "cius_ro":
             return super()._get_invoice_edi_content(move)
@@ -152,8 +256,82 @@ class AccountEdiXmlCIUSRO(models.Model):
         return attachment.raw
 
     def _l10n_ro_post_invoice_step_1(self, invoice, attachment):
+        res = self._l10n_ro_post_invoices_step_1(invoice, {invoice: attachment})
+        return res[invoice]
+
+    def _l10n_ro_post_invoices_step_1(self, invoices, attachments):
+        """Upload the XML of the invoices to ANAF SPV.
+
+        The uploads of a company are sent concurrently, by at most
+        upload_workers threads and upload_rate_limit requests per second of
+        its ANAF config. The connection errors and the 429 responses are
+        retried with backoff, the other failures are blocking errors,
+        and the transaction ids are written with a single update.
+        """
+        res = {}
+        transactions = {}
+        for anaf_config in invoices.mapped("company_id.l10n_ro_account_anaf_sync_id"):
+            company_invoices = invoices.filtered(
+                lambda i: i.company_id.l10n_ro_account_anaf_sync_id == anaf_config
+            )
+            upload_requests = [
+                self._l10n_ro_prepare_upload_request(invoice, attachments[invoice])
+                for invoice in company_invoices
+            ]
+            responses = self._l10n_ro_send_upload_requests(anaf_config, upload_requests)
+            for invoice, response in zip(company_invoices, responses):
+                if isinstance(response, RequestException):
+                    _logger.warning("Upload of %s failed: %s", invoice.name, response)
+                    res[invoice] = self._l10n_ro_get_upload_failure(str(response))
+                    continue
+                _logger.info(response.content)
+                if response.status_code == 200:
+                    res[invoice] = {"attachment": attachments[invoice]}
+                    doc = etree.fromstring(response.content)
+                    # header_element = doc.find('header')
+                    transactions[invoice] = doc.get("index_incarcare")
+                else:
+                    self._l10n_ro_check_token_response(anaf_config, response)
+                    res[invoice] = self._l10n_ro_get_upload_failure(_("Access error"))
+        self._l10n_ro_write_edi_transactions(transactions)
+        return res
+
+    def _l10n_ro_get_upload_failure(self, error):
+        """Result of an upload which failed without a transaction id"""
+        return {"success": False, "error": error, "blocking_level": "error"}
+
+    def _l10n_ro_check_token_response(self, anaf_config, response):
+        """Evict the cached access token when ANAF rejects it"""
+        if response.status_code == 401:
+            _logger.warning("ANAF rejected the access token of %s", anaf_config)
+            anaf_config._l10n_ro_clear_token_cache()
+
+    def _l10n_ro_send_upload_requests(self, anaf_config, upload_requests):
+        """Send the (url, kwargs) upload requests in parallel, return the
+        responses, or the exceptions of the failed requests"""
+        limiter = http_client.RateLimiter(anaf_config.upload_rate_limit)
+
+        def upload(request_args):
+            limiter.wait()
+            url, kwargs = request_args
+            try:
+                return http_client.post(
+                    url,
+                    retries=UPLOAD_RETRIES,
+                    retry_status=UPLOAD_RETRY_STATUS,
+                    retry_errors=UPLOAD_RETRY_ERRORS,
+                    **kwargs,
+                )
+            except RequestException as e:
+                return e
+
+        max_workers = max(anaf_config.upload_workers, 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(upload, upload_requests))
+
+    def _l10n_ro_prepare_upload_request(self, invoice, attachment):
         anaf_config = invoice.company_id.l10n_ro_account_anaf_sync_id
-        access_token = anaf_config.access_token
+        access_token = anaf_config._l10n_ro_get_access_token()
         url = anaf_config.anaf_einvoice_sync_url + "/upload"
         headers = {
             "Content-Type": "application/xml",
@@ -163,47 +341,145 @@ class AccountEdiXmlCIUSRO(models.Model):
             "standard": "UBL",
             "cif": invoice.company_id.partner_id.vat.replace("RO", ""),
         }
-        response = requests.post(
-            url, params=params, data=attachment.raw, headers=headers, timeout=80
+        return url, {
+            "params": params,
+            "data": attachment.raw,
+            "headers": headers,
+            "timeout": 80,
+        }
+
+    def _l10n_ro_write_edi_transactions(self, transactions):
+        """Write the ANAF transaction ids of the invoices, given as a
+        dictionary invoice: transaction id, with one query"""
+        if not transactions:
+            return
+        moves = self.env["account.move"].concat(*transactions)
+        # Each invoice has its own transaction id, so a write() grouped by
+        # value would still be one query per invoice, each running the
+        # checks of the posted moves. The update is safe: the field is a
+        # technical one, without tracking, and no stored computed field or
+        # constraint depends on it. The cache is flushed before and
+        # invalidated after.
+        moves.flush(["l10n_ro_edi_transaction"])
+        values = ", ".join(["(%s, %s)"] * len(transactions))
+        params = [self.env.uid]
+        for invoice, transaction in transactions.items():
+            params += [invoice.id, transaction]
+        query = """
+            UPDATE account_move AS move
+            SET l10n_ro_edi_transaction = upload.transaction,
+                write_uid = %s,
+                write_date = (now() at time zone 'UTC')
+            FROM (VALUES {}) AS upload(id, transaction)
+            WHERE move.id = upload.id
+        """.format(
+            values
+        )
+        self.env.cr.execute(query, params)
+        moves.invalidate_cache(
+            ["l10n_ro_edi_transaction", "write_uid", "write_date"], moves.ids
         )
 
-        _logger.info(response.content)
+    def _l10n_ro_post_invoice_step_2(self, invoice, test_mode=False):
+        return self._l10n_ro_post_invoices_step_2(invoice)[invoice]
 
-        if response.status_code == 200:
-            res = {"attachment": attachment}
-            doc = etree.fromstring(response.content)
-            # header_element = doc.find('header')
-            transaction = doc.get("index_incarcare")
-            invoice.write({"l10n_ro_edi_transaction": transaction})
-        else:
-            res = {"success": False, "error": _("Access error")}
+    def _l10n_ro_post_invoices_step_2(self, invoices):
+        """Check the ANAF state of the uploaded invoices.
 
+        The messages list of a company is read once, page by page, and
+        stareMesaj is only called for the transactions missing from it. The
+        automatic checks are spaced out while ANAF is still processing the
+        same invoices.
+        """
+        res = {}
+        now = fields.Datetime.now()
+        for anaf_config in invoices.mapped("company_id.l10n_ro_account_anaf_sync_id"):
+            company_invoices = invoices.filtered(
+                lambda i: i.company_id.l10n_ro_account_anaf_sync_id == anaf_config
+            )
+            next_check = anaf_config.next_status_check
+            if (
+                self.env.context.get("l10n_ro_edi_status_sync")
+                and next_check
+                and next_check > now
+            ):
+                for invoice in company_invoices:
+                    res[invoice] = {
+                        "success": False,
+                        "error": "in prelucrare",
+                        "blocking_level": "info",
+                    }
+                continue
+            messages = {
+                message.get("id_solicitare"): message
+                for message in self._l10n_ro_get_anaf_messages(anaf_config)
+            }
+            for invoice in company_invoices:
+                message = messages.get(invoice.l10n_ro_edi_transaction)
+                if message:
+                    res[invoice] = self._l10n_ro_get_message_result(message)
+                else:
+                    res[invoice] = self._l10n_ro_get_message_state(invoice)
+            pending = len(
+                [i for i in company_invoices if res[i].get("error") == "in prelucrare"]
+            )
+            self._l10n_ro_schedule_status_check(
+                anaf_config, pending, len(company_invoices) - pending
+            )
         return res
 
-    def _l10n_ro_post_invoice_step_2(self, invoice, test_mode=False):
-        anaf_config = invoice.company_id.l10n_ro_account_anaf_sync_id
-        access_token = anaf_config.access_token
-        url = anaf_config.anaf_einvoice_sync_url + "/listaMesajeFactura"
-
-        headers = {
-            "Content-Type": "application/xml",
-            "Authorization": f"Bearer {access_token}",
-        }
+    def _l10n_ro_get_anaf_messages(self, anaf_config, message_filter=None):
+        """Return the ANAF messages of the last MESSAGES_DAYS days of the
+        company, all or only those of a type (filtru): E errors, T sent
+        invoices, P received invoices, R buyer messages"""
+        url = anaf_config.anaf_einvoice_sync_url + "/listaMesajePaginatieFactura"
+        access_token = anaf_config._l10n_ro_get_access_token()
+        headers = {"Authorization": f"Bearer {access_token}"}
+        end_time = int(time.time() * 1000)
         params = {
-            "zile": 50,
-            "cif": invoice.company_id.partner_id.vat.replace("RO", ""),
+            "startTime": end_time - MESSAGES_DAYS * 24 * 3600 * 1000,
+            "endTime": end_time,
+            "cif": anaf_config.company_id.partner_id.vat.replace("RO", ""),
+            "pagina": 1,
         }
-        response = requests.get(url, params=params, headers=headers)
+        if message_filter:
+            params["filtru"] = message_filter
+        messages = []
+        while True:
+            response = http_client.get(url, params=params, headers=headers)
+            if response.status_code != 200:
+                _logger.warning("ANAF messages list error: %s", response.content)
+                self._l10n_ro_check_token_response(anaf_config, response)
+                break
+            content = response.json()
+            if content.get("eroare"):
+                _logger.info("ANAF messages list: %s", content["eroare"])
+                break
+            messages += content.get("mesaje", [])
+            if params["pagina"] >= int(content.get("numar_total_pagini") or 1):
+                break
+            params["pagina"] += 1
+        return messages
 
-        _logger.info(response.content)
+    def _l10n_ro_get_message_result(self, message):
+        if message.get("tip") == "ERORI FACTURA":
+            return {
+                "success": False,
+                "error": message.get("detalii"),
+                "blocking_level": "error",
+            }
+        return {"success": True}
 
+    def _l10n_ro_get_message_state(self, invoice):
+        anaf_config = invoice.company_id.l10n_ro_account_anaf_sync_id
+        access_token = anaf_config._l10n_ro_get_access_token()
         url = anaf_config.anaf_einvoice_sync_url + "/stareMesaj"
         headers = {
             "Content-Type": "application/xml",
             "Authorization": f"Bearer {access_token}",
         }
         params = {"id_incarcare": invoice.l10n_ro_edi_transaction}
-        response = requests.get(url, params=params, headers=headers)
+        response = http_client.get(url, params=params, headers=headers)
 
         _logger.info(response.content)
 
@@ -216,6 +492,314 @@ class AccountEdiXmlCIUSRO(models.Model):
                 if stare == "in prelucrare":
                     res.update({"error": stare, "blocking_level": "info"})
         else:
+            self._l10n_ro_check_token_response(anaf_config, response)
             res = {"success": False, "error": _("Access error")}
 
         return res
+
+    def _l10n_ro_schedule_status_check(self, anaf_config, pending, resolved):
+        """Set the next automatic check: soon if ANAF answered for some of
+        the invoices, later and later if all are still processed"""
+        if not pending:
+            interval = 0
+        elif resolved or not anaf_config.status_check_interval:
+            interval = STATUS_CHECK_MIN_INTERVAL
+        else:
+            interval = min(
+                anaf_config.status_check_interval * 2, STATUS_CHECK_MAX_INTERVAL
+            )
+        anaf_config.sudo().write(
+            {
+                "status_check_interval": interval,
+                "next_status_check": interval
+                and fields.Datetime.now() + timedelta(minutes=interval),
+            }
+        )
+
+    def _l10n_ro_download_received_invoices(self, anaf_config):
+        """Create draft vendor bills from the e-invoices received in the SPV
+        of the company.
+
+        Only the messages not downloaded before are fetched, their id is
+        stored on the bill. The archives are downloaded and parsed in
+        parallel, under the rate limit of the ANAF config, and the bills are
+        created by batches of DOWNLOAD_BATCH_SIZE.
+        """
+        company = anaf_config.company_id
+        messages = self._l10n_ro_get_anaf_messages(anaf_config, message_filter="P")
+        message_ids = list(
+            dict.fromkeys(message["id"] for message in messages if message.get("id"))
+        )
+        downloaded = {
+            move["l10n_ro_edi_download"]
+            for move in self.env["account.move"].search_read(
+                [
+                    ("company_id", "=", company.id),
+                    ("l10n_ro_edi_download", "in", message_ids),
+                ],
+                ["l10n_ro_edi_download"],
+            )
+        }
+        message_ids = [
+            message_id for message_id in message_ids if message_id not in downloaded
+        ]
+        bills_values = []
+        parsed = self._l10n_ro_download_e_invoices(anaf_config, message_ids)
+        for message_id, values in zip(message_ids, parsed):
+            if values.get("error"):
+                _logger.warning(
+                    "Download of the e-invoice %s failed: %s",
+                    message_id,
+                    values["error"],
+                )
+                continue
+            values["message_id"] = message_id
+            bills_values.append(values)
+        moves = self.env["account.move"]
+        for start in range(0, len(bills_values), DOWNLOAD_BATCH_SIZE):
+            moves |= self._l10n_ro_create_vendor_bills(
+                company, bills_values[start : start + DOWNLOAD_BATCH_SIZE]
+            )
+        _logger.info(
+            "Downloaded %s e-invoices of %s from ANAF", len(moves), company.name
+        )
+        return moves
+
+    def _l10n_ro_download_e_invoices(self, anaf_config, message_ids):
+        """Download and parse the archives of the messages in parallel, return
+        the invoice values, or a dictionary with the error, of each one.
+
+        The archives are parsed by the download threads: lxml releases the
+        GIL while parsing, and a process pool would fork the Odoo worker
+        with its database connections."""
+        limiter = http_client.RateLimiter(anaf_config.upload_rate_limit)
+        url = anaf_config.anaf_einvoice_sync_url + "/descarcare"
+        access_token = anaf_config._l10n_ro_get_access_token()
+        headers = {"Authorization": f"Bearer {access_token}"}
+
+        def download(message_id):
+            limiter.wait()
+            try:
+                response = http_client.get(
+                    url, params={"id": message_id}, headers=headers
+                )
+            except RequestException as e:
+                return {"error": str(e)}
+            if response.status_code != 200:
+                return {"error": _("Access error"), "status": response.status_code}
+            return e_invoice.parse_e_invoice_zip(response.content)
+
+        max_workers = max(anaf_config.upload_workers, 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            parsed = list(executor.map(download, message_ids))
+        if any(values.get("status") == 401 for values in parsed):
+            anaf_config._l10n_ro_clear_token_cache()
+        return parsed
+
+    def _l10n_ro_create_vendor_bills(self, company, bills_values):
+        """Create the draft vendor bills of the parsed e-invoices with one
+        create, the suppliers, currencies and taxes are read at once.
+
+        The tax of a line is the purchase tax with its percent, the default
+        purchase tax of the company first, mapped by the fiscal position of
+        the supplier. The bills of the suppliers which can't be created are
+        skipped, they are downloaded again by the next run. The e-invoices of
+        the bills already entered by hand, with the same supplier, type and
+        reference, are linked to them instead of creating new bills.
+        """
+        partners, errors = self._l10n_ro_get_e_invoice_suppliers(company, bills_values)
+        if errors:
+            for values in bills_values:
+                error = errors.get(e_invoice.vat_number(values["supplier_vat"]))
+                if error:
+                    _logger.warning(
+                        "Download of the e-invoice %s failed: %s",
+                        values["message_id"],
+                        error,
+                    )
+            bills_values = [
+                values
+                for values in bills_values
+                if e_invoice.vat_number(values["supplier_vat"]) not in errors
+            ]
+        bills_values = self._l10n_ro_link_entered_bills(company, partners, bills_values)
+        currencies = {
+            currency.name: currency.id
+            for currency in self.env["res.currency"]
+            .with_context(active_test=False)
+            .search([("name", "in", [v["currency"] for v in bills_values])])
+        }
+        taxes = {}
+        for tax in self.env["account.tax"].search(
+            [
+                ("company_id", "=", company.id),
+                ("type_tax_use", "=", "purchase"),
+                ("amount_type", "=", "percent"),
+                ("price_include", "=", False),
+            ],
+            order="sequence, id",
+        ):
+            taxes.setdefault(tax.amount, tax)
+        default_tax = company.account_purchase_tax_id
+        if default_tax.amount_type == "percent" and not default_tax.price_include:
+            taxes[default_tax.amount] = default_tax
+        fiscal_position_model = self.env["account.fiscal.position"].with_company(
+            company
+        )
+        fiscal_positions = {
+            partner_id: fiscal_position_model.get_fiscal_position(partner_id)
+            for partner_id in set(partners.values())
+        }
+        no_tax = self.env["account.tax"]
+        no_fiscal_position = self.env["account.fiscal.position"]
+        journal = self.env["account.journal"].search(
+            [("type", "=", "purchase"), ("company_id", "=", company.id)], limit=1
+        )
+        vals_list = []
+        for values in bills_values:
+            partner_id = partners.get(e_invoice.vat_number(values["supplier_vat"]))
+            fiscal_position = fiscal_positions.get(partner_id, no_fiscal_position)
+            lines = []
+            for line in values["lines"]:
+                tax = taxes.get(line["tax_percent"], no_tax)
+                lines.append(
+                    (
+                        0,
+                        0,
+                        {
+                            "name": line["name"],
+                            "quantity": line["quantity"],
+                            "price_unit": line["price_unit"],
+                            "tax_ids": [(6, 0, fiscal_position.map_tax(tax).ids)],
+                        },
+                    )
+                )
+            vals = {
+                "move_type": values["move_type"],
+                "journal_id": journal.id,
+                "company_id": company.id,
+                "partner_id": partner_id,
+                "fiscal_position_id": fiscal_position.id,
+                "ref": values["ref"],
+                "invoice_date": values["invoice_date"],
+                "l10n_ro_edi_download": values["message_id"],
+                "invoice_line_ids": lines,
+            }
+            if values["invoice_date_due"]:
+                vals["invoice_date_due"] = values["invoice_date_due"]
+            if currencies.get(values["currency"]):
+                vals["currency_id"] = currencies[values["currency"]]
+            vals_list.append(vals)
+        moves = (
+            self.env["account.move"]
+            .with_company(company)
+            .with_context(default_move_type="in_invoice")
+            .create(vals_list)
+        )
+        self.env["ir.attachment"].create(
+            [
+                {
+                    "name": values["filename"],
+                    "raw": values["content"],
+                    "mimetype": "application/xml",
+                    "res_model": "account.move",
+                    "res_id": move.id,
+                }
+                for move, values in zip(moves, bills_values)
+            ]
+        )
+        return moves
+
+    def _l10n_ro_link_entered_bills(self, company, partners, bills_values):
+        """Link the e-invoices to the vendor bills entered by hand, found
+        with one search, and return the values of the other e-invoices"""
+        refs = {values["ref"] for values in bills_values if values["ref"]}
+        if not refs:
+            return bills_values
+        commercial_partners = {
+            partner.id: partner.commercial_partner_id.id
+            for partner in self.env["res.partner"].browse(set(partners.values()))
+        }
+        entered = {}
+        for move in self.env["account.move"].search(
+            [
+                ("company_id", "=", company.id),
+                ("move_type", "in", ("in_invoice", "in_refund")),
+                ("commercial_partner_id", "in", list(commercial_partners.values())),
+                ("ref", "in", list(refs)),
+                ("state", "!=", "cancel"),
+            ]
+        ):
+            key = (move.commercial_partner_id.id, move.move_type, move.ref)
+            entered.setdefault(key, move)
+        new_bills_values = []
+        for values in bills_values:
+            partner_id = partners.get(e_invoice.vat_number(values["supplier_vat"]))
+            key = (
+                commercial_partners.get(partner_id),
+                values["move_type"],
+                values["ref"],
+            )
+            move = entered.get(key)
+            if not move:
+                new_bills_values.append(values)
+                continue
+            _logger.info(
+                "The e-invoice %s was already entered as %s",
+                values["message_id"],
+                move.display_name,
+            )
+            if not move.l10n_ro_edi_download:
+                move.l10n_ro_edi_download = values["message_id"]
+        return new_bills_values
+
+    def _l10n_ro_get_e_invoice_suppliers(self, company, bills_values):
+        """Return the supplier partner ids by VAT number, the suppliers not
+        found are created, and the creation errors by VAT number.
+
+        The missing suppliers are created together in a savepoint, if that
+        fails each one is created in its own savepoint, so that an invalid
+        supplier only skips its own e-invoices.
+        """
+        suppliers = {}
+        for values in bills_values:
+            vat_number = e_invoice.vat_number(values["supplier_vat"])
+            if vat_number:
+                suppliers.setdefault(vat_number, values)
+        partners = {}
+        for partner in self.env["res.partner"].search(
+            [
+                ("l10n_ro_vat_number", "in", list(suppliers)),
+                ("parent_id", "=", False),
+                ("company_id", "in", [False, company.id]),
+            ],
+            order="is_company desc, id",
+        ):
+            partners.setdefault(partner.l10n_ro_vat_number, partner.id)
+        missing = [vat for vat in suppliers if vat not in partners]
+        errors = {}
+        if not missing:
+            return partners, errors
+
+        def partner_vals(vat):
+            return {
+                "name": suppliers[vat]["supplier_name"] or vat,
+                "vat": suppliers[vat]["supplier_vat"],
+                "is_company": True,
+            }
+
+        try:
+            with self.env.cr.savepoint():
+                new_partners = self.env["res.partner"].create(
+                    [partner_vals(vat) for vat in missing]
+                )
+            partners.update(zip(missing, new_partners.ids))
+        except (UserError, ValidationError, psycopg2.Error):
+            for vat in missing:
+                try:
+                    with self.env.cr.savepoint():
+                        partner = self.env["res.partner"].create(partner_vals(vat))
+                    partners[vat] = partner.id
+                except (UserError, ValidationError, psycopg2.Error) as e:
+                    errors[vat] = str(e)
+        return partners, errors
@@ -13,8 +13,30 @@ class AccountEdiXmlCIUSRO(models.Model):
     def _export_invoice_filename(self, invoice):
         return f"{invoice.name.replace('/', '_')}_cius_ro.xml"
 
+    def _l10n_ro_memoize_partner_vals(self, key, partner, compute):
+        """Return the partner values computed by ``compute``, from the memo
+        shared by the invoices of an export batch when there is one. The
+        memo is keyed by the partner write_date, so a changed partner is
+        computed again."""
+        memo = self.env.context.get("l10n_ro_partner_vals_memo")
+        if memo is None or not partner:
+            return compute()
+        key = (key, partner.id, partner.write_date)
+        if key not in memo:
+            memo[key] = compute()
+        return memo[key]
+
     def _get_partner_address_vals(self, partner):
         # EXTENDS account.edi.xml.ubl_21
+        return dict(
+            self._l10n_ro_memoize_partner_vals(
+                "address",
+                partner,
+                lambda: self._l10n_ro_get_partner_address_vals(partner),
+            )
+        )
+
+    def _l10n_ro_get_partner_address_vals(self, partner):
         vals = super()._get_partner_address_vals(partner)
         # CIUS-RO country_subentity formed as country_code + state code
         if partner and partner.state_id:
@@ -28,6 +50,18 @@ class AccountEdiXmlCIUSRO(models.Model):
 
     def _get_partner_party_tax_scheme_vals_list(self, partner, role):
         # EXTENDS account.edi.xml.ubl_21
+        return [
+            dict(vals)
+            for vals in self._l10n_ro_memoize_partner_vals(
+                ("tax_scheme", role),
+                partner,
+                lambda: self._l10n_ro_get_partner_party_tax_scheme_vals_list(
+                    partner, role
+                ),
+            )
+        ]
+
+    def _l10n_ro_get_partner_party_tax_scheme_vals_list(self, partner, role):
         vals_list = super()._get_partner_party_tax_scheme_vals_list(partner, role)
 
         for vals in vals_list:
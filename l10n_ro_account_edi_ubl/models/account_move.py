@@ -1,11 +1,23 @@
 # Copyright (C) 2022 Dorin Hongu <dhongu(@)gmail(.)com
 # Copyright (C) 2022 NextERP Romania
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+from bisect import bisect_right
 
-
-from odoo import _, fields, models
+from odoo import _, api, fields, models, tools
 from odoo.exceptions import UserError
 
+HIGH_RISK_NC_CODES = tuple(
+    (
+        "0701,0702,0703,0704,0705,0706,0707,0708,0709,0710,0711,0712,"
+        "0713,0714,0801,0802,0803,0804,0805,0806,0807,0808,0809,0810,"
+        "0811,0812,0813,0814,2201,2202,2203,2204,2205,2206,2207,2208,"
+        "2505,2515,2516,2517,6401,6402,6403,6404,6405,6101,6102,6103,"
+        "6104,6105,6106,6107,6108,6109,61106111,6112,6113,5903,5906,"
+        "5907,6114,6115,6116,6117,6201,6202,6203,6204,6205,6206,6207,"
+        "6208,6209,6210,6211,62126214,6215,6216,6217"
+    ).split(",")
+)
+
 
 class AccountMove(models.Model):
     _inherit = "account.move"
@@ -15,6 +27,13 @@ class AccountMove(models.Model):
         help="Technical field used to track the status of a submission.",
         copy=False,
     )
+    l10n_ro_edi_download = fields.Char(
+        "Download ID (RO)",
+        help="Technical field with the ANAF message id of a received e-invoice, "
+        "used to download it only once.",
+        copy=False,
+        index=True,
+    )
     l10n_ro_send_state = fields.Selection(
         [
             ("new", "New"),
@@ -28,6 +47,20 @@ class AccountMove(models.Model):
         copy=False,
         string="Invoice XML Send State",
     )
+    l10n_ro_edi_validated_checksum = fields.Char(
+        "Validated XML Checksum (RO)",
+        help="Technical field with the checksum of the last CIUS-RO XML of the "
+        "invoice that passed the XSD and schematron validation.",
+        copy=False,
+    )
+
+    _sql_constraints = [
+        (
+            "l10n_ro_edi_download_uniq",
+            "unique(company_id, l10n_ro_edi_download)",
+            "This e-invoice was already downloaded from ANAF!",
+        ),
+    ]
 
     def button_draft(self):
         # OVERRIDE
@@ -69,10 +102,43 @@ class AccountMove(models.Model):
         ).l10n_ro_edi_transaction = None
 
     def send_to_anaf_e_invoice(self):
-        for move in self:
-            move.with_context(
-                l10n_ro_edi_manual_action=True
-            ).action_process_edi_web_services()
+        self.with_context(
+            l10n_ro_edi_manual_action=True
+        ).action_process_edi_web_services()
+
+    @api.model
+    def _l10n_ro_cron_check_edi_status(self):
+        """Check the ANAF state of the e-invoices waiting for validation, the
+        companies are checked at the interval set by the previous check"""
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        moves = self.search(
+            [
+                ("l10n_ro_edi_transaction", "!=", False),
+                ("edi_document_ids.edi_format_id", "=", cius_ro.id),
+                ("edi_document_ids.state", "=", "to_send"),
+            ]
+        )
+        moves.with_context(
+            l10n_ro_edi_manual_action=True, l10n_ro_edi_status_sync=True
+        ).action_process_edi_web_services()
+
+    @api.model
+    def _l10n_ro_cron_download_received_invoices(self):
+        """Create draft vendor bills from the e-invoices received in ANAF
+        SPV by the companies with an automatic ANAF config, which chose to
+        download their vendor bills"""
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        anaf_configs = self.env["l10n.ro.account.anaf.sync"].search(
+            [
+                ("state", "=", "automatic"),
+                ("access_token", "!=", False),
+                ("company_id.l10n_ro_edi_download_bills", "=", True),
+            ]
+        )
+        for anaf_config in anaf_configs:
+            cius_ro.with_company(
+                anaf_config.company_id
+            )._l10n_ro_download_received_invoices(anaf_config)
 
     def attach_ubl_xml_file_button(self):
         self.ensure_one()
@@ -95,14 +161,23 @@ class AccountMove(models.Model):
         return action
 
     def get_l10n_ro_high_risk_nc_codes(self):
-        high_risk_nc = (
-            "0701,0702,0703,0704,0705,0706,0707,0708,0709,0710,0711,0712,"
-            "0713,0714,0801,0802,0803,0804,0805,0806,0807,0808,0809,0810,"
-            "0811,0812,0813,0814,2201,2202,2203,2204,2205,2206,2207,2208,"
-            "2505,2515,2516,2517,6401,6402,6403,6404,6405,6101,6102,6103,"
-            "6104,6105,6106,6107,6108,6109,61106111,6112,6113,5903,5906,"
-            "5907,6114,6115,6116,6117,6201,6202,6203,6204,6205,6206,6207,"
-            "6208,6209,6210,6211,62126214,6215,6216,6217"
-        )
-        high_risk_nc_list = high_risk_nc.split(",")
-        return high_risk_nc_list
+        return list(HIGH_RISK_NC_CODES)
+
+    @tools.ormcache()
+    def _l10n_ro_get_high_risk_nc_prefixes(self):
+        """Return the sorted high risk NC code prefixes, without the prefixes
+        extending a shorter one, so a code can only start with the prefix
+        right before it in the sorted tuple"""
+        prefixes = []
+        for prefix in sorted(set(filter(None, self.get_l10n_ro_high_risk_nc_codes()))):
+            if not prefixes or not prefix.startswith(prefixes[-1]):
+                prefixes.append(prefix)
+        return tuple(prefixes)
+
+    @api.model
+    def _l10n_ro_is_high_risk_nc_code(self, nc_code):
+        if not nc_code:
+            return False
+        prefixes = self._l10n_ro_get_high_risk_nc_prefixes()
+        index = bisect_right(prefixes, nc_code)
+        return bool(index) and nc_code.startswith(prefixes[index - 1])
@@ -43,6 +43,14 @@ class ProductProduct(models.Model):
         index=True,
         readonly=False,
     )
+    l10n_ro_high_risk_nc = fields.Boolean(
+        "Romania - High Risk NC Code",
+        compute="_compute_l10n_ro_high_risk_nc",
+        store=True,
+        index=True,
+        help="The NC code is a high risk one, the invoices with this product "
+        "are always sent to e-Factura.",
+    )
 
     @api.depends(lambda self: self._check_l10n_ro_intrastat_fields())
     def _compute_l10n_ro_nc_code(self):
@@ -58,6 +66,14 @@ class ProductProduct(models.Model):
                 l10n_ro_nc_code = product.intrastat_id.code
             product.l10n_ro_nc_code = l10n_ro_nc_code
 
+    @api.depends("l10n_ro_nc_code")
+    def _compute_l10n_ro_high_risk_nc(self):
+        move_model = self.env["account.move"]
+        for product in self:
+            product.l10n_ro_high_risk_nc = move_model._l10n_ro_is_high_risk_nc_code(
+                product.l10n_ro_nc_code
+            )
+
     def _check_l10n_ro_intrastat_fields(self):
         # Add compatibility with intrastat modules from OCA or Enterprise
         has_hs_code_id = "hs_code_id" in self.env[self._name]._fields
@@ -11,3 +11,8 @@ class ResCompany(models.Model):
     l10n_ro_edi_manual = fields.Boolean(
         string="Romania - E-Invoice Manual submission", default=True
     )
+    l10n_ro_edi_download_bills = fields.Boolean(
+        string="Romania - E-Invoice Download Vendor Bills",
+        help="Create every hour draft vendor bills from the e-invoices "
+        "received in the ANAF SPV.",
+    )
@@ -13,3 +13,8 @@ class ResConfigSettings(models.TransientModel):
         readonly=False,
         string="E-Invoice Manual submission",
     )
+    l10n_ro_edi_download_bills = fields.Boolean(
+        related="company_id.l10n_ro_edi_download_bills",
+        readonly=False,
+        string="E-Invoice Download Vendor Bills",
+    )
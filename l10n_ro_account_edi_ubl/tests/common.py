@@ -0,0 +1,116 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+MESSAGE_FILTERS = {
+    "E": "ERORI FACTURA",
+    "T": "FACTURA TRIMISA",
+    "P": "FACTURA PRIMITA",
+    "R": "MESAJ CUMPARATOR PRIMIT / MESAJ CUMPARATOR TRANSMIS",
+}
+
+
+class FakeANAFHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the ANAF e-Factura API used by the tests"""
+
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    # statuses returned before the next uploads are accepted
+    upload_statuses = []
+    uploads = []
+    requests = []
+    # listaMesajePaginatieFactura messages, returned by pages of page_size
+    messages = []
+    page_size = 2
+    # stareMesaj state by upload index
+    states = {}
+    # descarcare archives by message id
+    archives = {}
+
+    @classmethod
+    def reset(cls):
+        cls.upload_statuses = []
+        cls.uploads = []
+        cls.requests = []
+        cls.messages = []
+        cls.states = {}
+        cls.archives = {}
+
+    def _send(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            self.requests.append((url.path, parse_qs(url.query)))
+            if self.upload_statuses:
+                return self._send(self.upload_statuses.pop(0))
+            self.uploads.append(data)
+            index = len(self.uploads)
+        body = (
+            '<header xmlns="mfp:anaf:dgti:spv:respUploadFisier:v1" '
+            'ExecutionStatus="0" index_incarcare="%s"/>' % index
+        )
+        self._send(200, body.encode())
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        with self.lock:
+            self.requests.append((url.path, query))
+        if url.path.endswith("/listaMesajePaginatieFactura"):
+            page = int(query["pagina"][0])
+            messages = self.messages
+            if query.get("filtru"):
+                tip = MESSAGE_FILTERS[query["filtru"][0]]
+                messages = [m for m in messages if m.get("tip") == tip]
+            pages = max((len(messages) - 1) // self.page_size + 1, 1)
+            start = (page - 1) * self.page_size
+            content = {
+                "mesaje": messages[start : start + self.page_size],
+                "numar_total_pagini": pages,
+                "index_pagina_curenta": page,
+            }
+            if not messages:
+                content = {"eroare": "Nu exista mesaje in intervalul selectat"}
+            return self._send(200, json.dumps(content).encode())
+        if url.path.endswith("/stareMesaj"):
+            state = self.states.get(query["id_incarcare"][0], "in prelucrare")
+            body = (
+                '<header xmlns="mfp:anaf:dgti:efactura:stareMesajFactura:v1" '
+                'stare="%s"/>' % state
+            )
+            return self._send(200, body.encode())
+        if url.path.endswith("/descarcare"):
+            archive = self.archives.get(query["id"][0])
+            if archive:
+                return self._send(200, archive)
+        self._send(404)
+
+    def log_message(self, format, *args):
+        return
+
+
+class FakeANAFServerMixin(object):
+    @classmethod
+    def start_fake_anaf(cls):
+        cls.anaf_server = ThreadingHTTPServer(("127.0.0.1", 0), FakeANAFHandler)
+        cls.anaf_thread = threading.Thread(
+            target=cls.anaf_server.serve_forever, daemon=True
+        )
+        cls.anaf_thread.start()
+        cls.anaf_url = "http://127.0.0.1:%s/rest" % cls.anaf_server.server_address[1]
+
+    @classmethod
+    def stop_fake_anaf(cls):
+        cls.anaf_server.shutdown()
+        cls.anaf_server.server_close()
@@ -3,19 +3,34 @@
 
 
 import base64
+import io
+import logging
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from unittest import mock
 
 from odoo import fields
 from odoo.tests import tagged
 
 from odoo.addons.account_edi.tests.common import AccountEdiTestCommon
+from odoo.addons.l10n_ro_config.tools import http_client
+
+from ..tools import validator
+from .common import FakeANAFHandler, FakeANAFServerMixin
+
+_logger = logging.getLogger(__name__)
 
 
 @tagged("post_install", "-at_install")
-class TestAccountEdiUbl(AccountEdiTestCommon):
+class TestAccountEdiUbl(AccountEdiTestCommon, FakeANAFServerMixin):
     @classmethod
     def setUpClass(cls):
         ro_template_ref = "l10n_ro.ro_chart_template"
         super().setUpClass(chart_template_ref=ro_template_ref)
+        cls.start_fake_anaf()
         cls.env.company.l10n_ro_accounting = True
         cls.currency = cls.env["res.currency"].search([("name", "=", "RON")])
         cls.country_state = cls.env["res.country.state"].search(
@@ -289,6 +304,33 @@ class TestAccountEdiUbl(AccountEdiTestCommon):
             </Invoice>
         """
 
+    @classmethod
+    def tearDownClass(cls):
+        cls.stop_fake_anaf()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        FakeANAFHandler.reset()
+        patcher = mock.patch.object(http_client, "RETRY_BACKOFF", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _create_anaf_config(self, **values):
+        anaf_config = self.env["l10n.ro.account.anaf.sync"].create(
+            dict(
+                {
+                    "company_id": self.env.company.id,
+                    "anaf_einvoice_sync_url": self.anaf_url,
+                    "access_token": "test",
+                    "state": "automatic",
+                },
+                **values,
+            )
+        )
+        self.env.company.l10n_ro_account_anaf_sync_id = anaf_config
+        return anaf_config
+
     def test_account_edi_ubl(self):
         self.invoice.action_post()
         invoice_xml = self.invoice.attach_ubl_xml_file_button()
@@ -300,4 +342,379 @@ class TestAccountEdiUbl(AccountEdiTestCommon):
         )
         self.assertXmlTreeEqual(current_etree, expected_etree)
 
+    def test_export_cius_ro_batch(self):
+        invoices = self.invoice | self.invoice.copy(
+            {"invoice_date": fields.Date.from_string("2022-09-01")}
+        )
+        invoices.action_post()
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        attachments = cius_ro._export_cius_ro_batch(invoices)
+        self.assertEqual(set(attachments), set(invoices))
+        for invoice, attachment in attachments.items():
+            self.assertEqual(attachment.res_id, invoice.id)
+            self.assertEqual(
+                attachment.name, f"{invoice.name.replace('/', '_')}_cius_ro.xml"
+            )
+        current_etree = self.get_xml_tree_from_string(attachments[self.invoice].raw)
+        expected_etree = self.get_xml_tree_from_string(
+            self.expected_invoice_factur_values
+        )
+        self.assertXmlTreeEqual(current_etree, expected_etree)
+
+    def test_upload_e_invoices(self):
+        invoices = self.invoice | self.invoice.copy(
+            {"invoice_date": fields.Date.from_string("2022-09-01")}
+        )
+        invoices.action_post()
+        self._create_anaf_config(upload_workers=2, upload_rate_limit=0)
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        attachments = cius_ro._export_cius_ro_batch(invoices)
+        FakeANAFHandler.upload_statuses = [429]
+        res = cius_ro._l10n_ro_post_invoices_step_1(invoices, attachments)
+        self.assertEqual(len(FakeANAFHandler.requests), 3)
+        self.assertEqual(
+            sorted(FakeANAFHandler.uploads),
+            sorted(attachment.raw for attachment in attachments.values()),
+        )
+        self.assertEqual(sorted(invoices.mapped("l10n_ro_edi_transaction")), ["1", "2"])
+        for invoice in invoices:
+            self.assertEqual(res[invoice], {"attachment": attachments[invoice]})
+        self.assertEqual(
+            FakeANAFHandler.requests[0][1], {"standard": ["UBL"], "cif": ["30834857"]}
+        )
+
+    def test_upload_e_invoice_not_retried(self):
+        """A 5xx upload response is not retried, ANAF may have received the
+        invoice"""
+        self.invoice.action_post()
+        self._create_anaf_config(upload_workers=2, upload_rate_limit=0)
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        attachments = cius_ro._export_cius_ro_batch(self.invoice)
+        FakeANAFHandler.upload_statuses = [503]
+        res = cius_ro._l10n_ro_post_invoices_step_1(self.invoice, attachments)
+        self.assertEqual(len(FakeANAFHandler.requests), 1)
+        self.assertFalse(FakeANAFHandler.uploads)
+        self.assertFalse(self.invoice.l10n_ro_edi_transaction)
+        self.assertFalse(res[self.invoice]["success"])
+        self.assertEqual(res[self.invoice]["blocking_level"], "error")
+
+    def test_upload_e_invoice_unauthorized(self):
+        """The cached access token is evicted when ANAF rejects it"""
+        self.invoice.action_post()
+        anaf_config = self._create_anaf_config(upload_rate_limit=0)
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        attachments = cius_ro._export_cius_ro_batch(self.invoice)
+        FakeANAFHandler.upload_statuses = [401]
+        with mock.patch.object(
+            type(anaf_config), "_l10n_ro_clear_token_cache"
+        ) as clear_token_cache:
+            res = cius_ro._l10n_ro_post_invoices_step_1(self.invoice, attachments)
+        clear_token_cache.assert_called_once_with()
+        self.assertFalse(res[self.invoice]["success"])
+
+    def test_check_e_invoices_state(self):
+        invoices = self.invoice
+        for _i in range(2):
+            invoices |= self.invoice.copy(
+                {"invoice_date": fields.Date.from_string("2022-09-01")}
+            )
+        invoices.action_post()
+        for index, invoice in enumerate(invoices, 1):
+            invoice.l10n_ro_edi_transaction = str(index)
+        anaf_config = self._create_anaf_config()
+        FakeANAFHandler.messages = [
+            {"id_solicitare": "1", "tip": "FACTURA TRIMISA", "id": "11"},
+            {"id_solicitare": "2", "tip": "ERORI FACTURA", "id": "12"},
+            {"id_solicitare": "99", "tip": "FACTURA PRIMITA", "id": "13"},
+        ]
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        res = cius_ro._l10n_ro_post_invoices_step_2(invoices)
+        self.assertEqual(res[invoices[0]], {"success": True})
+        self.assertFalse(res[invoices[1]]["success"])
+        self.assertEqual(res[invoices[1]]["blocking_level"], "error")
+        self.assertEqual(res[invoices[2]]["error"], "in prelucrare")
+        paths = [path for path, query in FakeANAFHandler.requests]
+        self.assertEqual(
+            paths,
+            [
+                "/rest/listaMesajePaginatieFactura",
+                "/rest/listaMesajePaginatieFactura",
+                "/rest/stareMesaj",
+            ],
+        )
+        self.assertEqual(anaf_config.status_check_interval, 5)
+        self.assertTrue(anaf_config.next_status_check)
+
+        # the automatic checks wait for the next check time
+        FakeANAFHandler.requests.clear()
+        res = cius_ro.with_context(
+            l10n_ro_edi_status_sync=True
+        )._l10n_ro_post_invoices_step_2(invoices[2])
+        self.assertEqual(res[invoices[2]]["error"], "in prelucrare")
+        self.assertFalse(FakeANAFHandler.requests)
+
+        FakeANAFHandler.states = {"3": "ok"}
+        res = cius_ro._l10n_ro_post_invoices_step_2(invoices[2])
+        self.assertEqual(res[invoices[2]], {"success": True})
+        self.assertEqual(anaf_config.status_check_interval, 0)
+        self.assertFalse(anaf_config.next_status_check)
+
+    def _make_e_invoice_zip(self, message_id, content):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, "w") as archive:
+            archive.writestr("%s.xml" % message_id, content)
+            archive.writestr("semnatura_%s.xml" % message_id, b"<Signature/>")
+        return data.getvalue()
+
+    def test_download_received_invoices(self):
+        self.invoice.action_post()
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        content = cius_ro._export_cius_ro(self.invoice).raw
+        anaf_config = self._create_anaf_config(upload_workers=2, upload_rate_limit=0)
+        FakeANAFHandler.messages = [
+            {"id_solicitare": "1", "tip": "FACTURA TRIMISA", "id": "11"},
+            {"id_solicitare": "2", "tip": "FACTURA PRIMITA", "id": "12"},
+            {"id_solicitare": "3", "tip": "FACTURA PRIMITA", "id": "13"},
+            {"id_solicitare": "4", "tip": "FACTURA PRIMITA", "id": "14"},
+        ]
+        FakeANAFHandler.archives = {
+            "12": self._make_e_invoice_zip("12", content),
+            "13": self._make_e_invoice_zip("13", content),
+            "14": b"not a zip",
+        }
+        bills = cius_ro._l10n_ro_download_received_invoices(anaf_config)
+        self.assertEqual(sorted(bills.mapped("l10n_ro_edi_download")), ["12", "13"])
+        for bill in bills:
+            self.assertEqual(bill.move_type, "in_invoice")
+            self.assertEqual(bill.state, "draft")
+            self.assertEqual(bill.ref, self.invoice.name)
+            self.assertEqual(bill.partner_id, self.env.company.partner_id)
+            self.assertEqual(len(bill.invoice_line_ids), 2)
+            self.assertEqual(bill.amount_untaxed, self.invoice.amount_untaxed)
+            for line in bill.invoice_line_ids:
+                self.assertEqual(line.tax_ids.mapped("amount"), [19.0])
+                self.assertEqual(line.tax_ids.type_tax_use, "purchase")
+        attachments = self.env["ir.attachment"].search(
+            [("res_model", "=", "account.move"), ("res_id", "in", bills.ids)]
+        )
+        self.assertEqual(sorted(attachments.mapped("name")), ["12.xml", "13.xml"])
+
+        # only the messages not downloaded before are fetched again
+        FakeANAFHandler.requests.clear()
+        bills = cius_ro._l10n_ro_download_received_invoices(anaf_config)
+        self.assertFalse(bills)
+        downloads = [
+            query["id"][0]
+            for path, query in FakeANAFHandler.requests
+            if path == "/rest/descarcare"
+        ]
+        self.assertEqual(downloads, ["14"])
+
+    def test_vendor_bills_invalid_supplier(self):
+        """The bills of a supplier which can't be created are skipped"""
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        values = {
+            "move_type": "in_invoice",
+            "ref": "F1",
+            "invoice_date": "2022-09-01",
+            "invoice_date_due": False,
+            "currency": "RON",
+            "supplier_name": "Supplier",
+            "lines": [
+                {
+                    "name": "Line",
+                    "quantity": 1.0,
+                    "price_unit": 100.0,
+                    "tax_percent": 19.0,
+                }
+            ],
+            "filename": "test.xml",
+            "content": b"<Invoice/>",
+        }
+        bills_values = [
+            dict(values, supplier_vat="RO1", message_id="21"),
+            dict(values, supplier_vat=self.partner.vat, message_id="22"),
+        ]
+        bills = cius_ro._l10n_ro_create_vendor_bills(self.env.company, bills_values)
+        self.assertEqual(bills.mapped("l10n_ro_edi_download"), ["22"])
+        self.assertEqual(bills.partner_id, self.partner)
+        self.assertFalse(
+            self.env["res.partner"].search([("l10n_ro_vat_number", "=", "1")])
+        )
+
+    def test_vendor_bills_entered_by_hand(self):
+        """The e-invoices of the bills entered by hand are linked to them"""
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        bill = self.env["account.move"].create(
+            {
+                "move_type": "in_invoice",
+                "partner_id": self.partner.id,
+                "ref": "F1",
+                "invoice_date": "2022-09-01",
+            }
+        )
+        values = {
+            "move_type": "in_invoice",
+            "ref": "F1",
+            "invoice_date": "2022-09-01",
+            "invoice_date_due": False,
+            "currency": "RON",
+            "supplier_name": "Supplier",
+            "supplier_vat": self.partner.vat,
+            "lines": [],
+            "filename": "test.xml",
+            "content": b"<Invoice/>",
+        }
+        bills_values = [
+            dict(values, message_id="31"),
+            dict(values, message_id="32", ref="F2"),
+        ]
+        bills = cius_ro._l10n_ro_create_vendor_bills(self.env.company, bills_values)
+        self.assertEqual(bills.mapped("ref"), ["F2"])
+        self.assertEqual(bill.l10n_ro_edi_download, "31")
+
+    def test_download_received_invoices_cron(self):
+        """Only the companies which chose it download their vendor bills"""
+        self._create_anaf_config()
+        move_model = self.env["account.move"]
+        with mock.patch.object(
+            type(self.env["account.edi.format"]),
+            "_l10n_ro_download_received_invoices",
+        ) as download:
+            move_model._l10n_ro_cron_download_received_invoices()
+            download.assert_not_called()
+            self.env.company.l10n_ro_edi_download_bills = True
+            move_model._l10n_ro_cron_download_received_invoices()
+            download.assert_called_once()
+
+    def test_high_risk_nc_code(self):
+        move_model = self.env["account.move"]
+        self.assertTrue(move_model._l10n_ro_is_high_risk_nc_code("07019050"))
+        self.assertTrue(move_model._l10n_ro_is_high_risk_nc_code("2204"))
+        self.assertFalse(move_model._l10n_ro_is_high_risk_nc_code("0700"))
+        self.assertFalse(move_model._l10n_ro_is_high_risk_nc_code("85"))
+        self.assertFalse(move_model._l10n_ro_is_high_risk_nc_code(False))
+
+        self.product_a.l10n_ro_nc_code = "85123000"
+        self.assertFalse(self.product_a.l10n_ro_high_risk_nc)
+        self.partner.l10n_ro_e_invoice = False
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        self.assertFalse(cius_ro._is_required_for_invoice(self.invoice))
+        self.product_b.l10n_ro_nc_code = "22042109"
+        self.assertTrue(self.product_b.l10n_ro_high_risk_nc)
+        self.assertTrue(cius_ro._is_required_for_invoice(self.invoice))
+
+    def test_partner_vals_memo_benchmark(self):
+        """Time the partner values of 10k invoices to the same customer"""
+        builder = self.env["account.edi.xml.cius_ro"]
+        partners = self.env.company.partner_id | self.partner
+        invoices = 10000
+
+        def build_partner_vals(builder):
+            start_time = time.perf_counter()
+            for _i in range(invoices):
+                res = [
+                    (
+                        builder._get_partner_address_vals(partner),
+                        builder._get_partner_party_tax_scheme_vals_list(
+                            partner, "customer"
+                        ),
+                    )
+                    for partner in partners
+                ]
+            return res, time.perf_counter() - start_time
+
+        plain_vals, plain_time = build_partner_vals(builder)
+        memo = {}
+        memo_vals, memo_time = build_partner_vals(
+            builder.with_context(l10n_ro_partner_vals_memo=memo)
+        )
+        _logger.info(
+            "CIUS-RO partner values of %s invoices: %.2fµs per invoice, "
+            "%.2fµs per invoice with the batch memo",
+            invoices,
+            plain_time / invoices * 1e6,
+            memo_time / invoices * 1e6,
+        )
+        self.assertEqual(memo_vals, plain_vals)
+        self.assertEqual(len(memo), 2 * len(partners))
+
+    def test_validate_cius_ro(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        xsd_file = os.path.join(tmp_dir, "invoice.xsd")
+        with open(xsd_file, "w") as xsd:
+            xsd.write(
+                """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"
+                    targetNamespace="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+                    elementFormDefault="qualified">
+                    <xs:element name="Invoice">
+                        <xs:complexType>
+                            <xs:sequence>
+                                <xs:any namespace="##any" processContents="skip"
+                                    minOccurs="0" maxOccurs="unbounded"/>
+                            </xs:sequence>
+                        </xs:complexType>
+                    </xs:element>
+                </xs:schema>"""
+            )
+        schematron_file = os.path.join(tmp_dir, "cius_ro.xslt")
+        with open(schematron_file, "w") as schematron:
+            schematron.write(
+                """<xsl:stylesheet version="1.0"
+                    xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
+                    xmlns:svrl="http://purl.oclc.org/dsdl/svrl"
+                    xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2">
+                    <xsl:template match="/">
+                        <svrl:schematron-output>
+                            <xsl:if test="not(//cbc:DocumentCurrencyCode = 'RON')">
+                                <svrl:failed-assert id="BR-RO-CUR" flag="fatal">
+                                    <svrl:text>The currency must be RON.</svrl:text>
+                                </svrl:failed-assert>
+                            </xsl:if>
+                        </svrl:schematron-output>
+                    </xsl:template>
+                </xsl:stylesheet>"""
+            )
+        set_param = self.env["ir.config_parameter"].sudo().set_param
+        set_param("l10n_ro_account_edi_ubl.cius_ro_xsd_file", xsd_file)
+        set_param("l10n_ro_account_edi_ubl.cius_ro_schematron_file", schematron_file)
+
+        self.invoice.action_post()
+        cius_ro = self.env.ref("l10n_ro_account_edi_ubl.edi_ubl_cius_ro")
+        self.assertEqual(cius_ro._check_move_configuration(self.invoice), [])
+        attachment = cius_ro._export_cius_ro(self.invoice)
+        # the XML validated by the check is not validated again at upload
+        self.assertEqual(
+            self.invoice.l10n_ro_edi_validated_checksum, attachment.checksum
+        )
+        xml_content = attachment.raw
+        invoice_eur = self.invoice.copy()
+        errors = cius_ro._l10n_ro_validate_cius_ro(
+            {
+                self.invoice: b"<Invoice/>",
+                invoice_eur: xml_content.replace(b">RON<", b">EUR<"),
+            }
+        )
+        # not an UBL invoice for the XSD, and without currency
+        self.assertEqual(len(errors[self.invoice]), 2)
+        self.assertEqual(errors[invoice_eur], ["[BR-RO-CUR] The currency must be RON."])
+        # the batches are validated by the same pool of threads
+        executor = validator._get_executor()
+        cius_ro._l10n_ro_validate_cius_ro(
+            {self.invoice: xml_content, invoice_eur: xml_content}
+        )
+        self.assertIs(validator._get_executor(), executor)
+
+        # a missing validation file is a configuration error
+        set_param(
+            "l10n_ro_account_edi_ubl.cius_ro_xsd_file",
+            os.path.join(tmp_dir, "missing.xsd"),
+        )
+        errors = cius_ro._l10n_ro_validate_cius_ro({self.invoice: xml_content})
+        self.assertEqual(len(errors[self.invoice]), 1)
+        self.assertIn("Configuration error", errors[self.invoice][0])
+        # and it fails the check of the invoice
+        self.assertEqual(len(cius_ro._check_move_configuration(invoice_eur)), 1)
+
     # TODO-add test for credit note
@@ -0,0 +1,2 @@
+from . import e_invoice
+from . import validator
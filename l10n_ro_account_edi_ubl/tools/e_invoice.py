@@ -0,0 +1,109 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Parsing of the e-invoices downloaded from the ANAF SPV.
+
+The functions only use lxml and return plain data, so that the archives
+can be parsed by the download threads, without the ORM and its cursor.
+"""
+
+import io
+import zipfile
+
+from lxml import etree
+
+NAMESPACES = {
+    "cac": "urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2",
+    "cbc": "urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2",
+}
+
+
+def _text(node, path):
+    value = node.findtext(path, namespaces=NAMESPACES)
+    return value.strip() if value else False
+
+
+def _float(node, path, default=0.0):
+    value = _text(node, path)
+    return float(value) if value else default
+
+
+def vat_number(vat):
+    """Return the VAT number without the country code, like l10n_ro_vat_number"""
+    vat = (vat or "").replace(" ", "")
+    if vat[:2].isalpha():
+        vat = vat[2:]
+    return vat
+
+
+def read_e_invoice_zip(data):
+    """Return the (filename, content) of the invoice XML of an ANAF
+    archive, which also contains the signature of the Ministry"""
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            name = info.filename
+            if name.lower().endswith(".xml") and not name.startswith("semnatura"):
+                return name, archive.read(info)
+    return False, False
+
+
+def parse_e_invoice(content):
+    """Return the values of an UBL invoice or credit note as a dictionary"""
+    tree = etree.fromstring(content)
+    is_credit_note = etree.QName(tree).localname == "CreditNote"
+    is_refund = is_credit_note or _text(tree, "cbc:InvoiceTypeCode") == "381"
+    supplier = tree.find("cac:AccountingSupplierParty/cac:Party", NAMESPACES)
+    lines = []
+    line_tag = "cac:CreditNoteLine" if is_credit_note else "cac:InvoiceLine"
+    quantity_tag = "cbc:CreditedQuantity" if is_credit_note else "cbc:InvoicedQuantity"
+    for line in tree.iterfind(line_tag, NAMESPACES):
+        quantity = _float(line, quantity_tag, 1.0)
+        # the net amount of the line includes the discounts and allowances
+        if quantity:
+            price_unit = _float(line, "cbc:LineExtensionAmount") / quantity
+        else:
+            base_quantity = _float(line, "cac:Price/cbc:BaseQuantity", 1.0) or 1.0
+            price_unit = _float(line, "cac:Price/cbc:PriceAmount") / base_quantity
+        lines.append(
+            {
+                "name": _text(line, "cac:Item/cbc:Name")
+                or _text(line, "cac:Item/cbc:Description"),
+                "quantity": quantity,
+                "price_unit": price_unit,
+                "tax_percent": _float(
+                    line, "cac:Item/cac:ClassifiedTaxCategory/cbc:Percent", None
+                ),
+            }
+        )
+    return {
+        "move_type": "in_refund" if is_refund else "in_invoice",
+        "ref": _text(tree, "cbc:ID"),
+        "invoice_date": _text(tree, "cbc:IssueDate"),
+        "invoice_date_due": _text(tree, "cbc:DueDate")
+        or _text(tree, "cac:PaymentMeans/cbc:PaymentDueDate"),
+        "currency": _text(tree, "cbc:DocumentCurrencyCode"),
+        "supplier_name": supplier is not None
+        and (
+            _text(supplier, "cac:PartyLegalEntity/cbc:RegistrationName")
+            or _text(supplier, "cac:PartyName/cbc:Name")
+        ),
+        "supplier_vat": supplier is not None
+        and (
+            _text(supplier, "cac:PartyTaxScheme/cbc:CompanyID")
+            or _text(supplier, "cac:PartyLegalEntity/cbc:CompanyID")
+        ),
+        "lines": lines,
+    }
+
+
+def parse_e_invoice_zip(data):
+    """Parse an archive downloaded from ANAF, return the invoice values with
+    the XML filename and content, or a dictionary with the error"""
+    try:
+        filename, content = read_e_invoice_zip(data)
+        if not content:
+            return {"error": "The archive doesn't contain an invoice XML."}
+        values = parse_e_invoice(content)
+    except (zipfile.BadZipFile, etree.XMLSyntaxError, ValueError) as e:
+        return {"error": str(e)}
+    values.update(filename=filename, content=content)
+    return values
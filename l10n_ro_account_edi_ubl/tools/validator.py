@@ -0,0 +1,112 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Local validation of the CIUS-RO XML against the UBL XSD and the CIUS-RO
+schematron, compiled to XSLT.
+
+The compiled XSD and XSLT are cached per thread, they keep their error log
+on the object so they can't be shared by threads validating at the same
+time. A file is compiled again when it is changed on disk. lxml releases
+the GIL while validating, so the invoices of a batch are validated in
+parallel by the threads of a long-lived pool, which keep their cache
+between the batches.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from lxml import etree
+
+SVRL_NS = "http://purl.oclc.org/dsdl/svrl"
+# Number of invoices validated at the same time against the XSD/schematron
+WORKERS = 4
+
+_local = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ConfigurationError(Exception):
+    """A validation file is missing or can't be compiled"""
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=WORKERS, thread_name_prefix="cius_ro_validator"
+            )
+        return _executor
+
+
+def _get_compiled(path, compile_method):
+    cache = getattr(_local, "cache", None)
+    if cache is None:
+        cache = _local.cache = {}
+    key = (compile_method.__name__, path)
+    try:
+        mtime = os.path.getmtime(path)
+        cached = cache.get(key)
+        if not cached or cached[0] != mtime:
+            cached = cache[key] = (mtime, compile_method(etree.parse(path)))
+    except (OSError, etree.Error) as e:
+        raise ConfigurationError("%s: %s" % (path, e)) from e
+    return cached[1]
+
+
+def get_schema(path):
+    return _get_compiled(path, etree.XMLSchema)
+
+
+def get_schematron(path):
+    return _get_compiled(path, etree.XSLT)
+
+
+def validate(content, xsd_path=None, schematron_path=None):
+    """Return the list of the errors of the XML content, an empty list when
+    it is valid. The schematron warnings are not errors. A validation file
+    which can't be used is returned as a configuration error."""
+    try:
+        return _validate(content, xsd_path, schematron_path)
+    except ConfigurationError as e:
+        return ["Configuration error of the CIUS-RO validation, %s" % e]
+
+
+def validate_many(contents, xsd_path=None, schematron_path=None):
+    """Return the errors lists of the XML contents, validated in parallel"""
+    contents = list(contents)
+    if len(contents) <= 1:
+        return [validate(content, xsd_path, schematron_path) for content in contents]
+    return list(
+        _get_executor().map(
+            validate,
+            contents,
+            [xsd_path] * len(contents),
+            [schematron_path] * len(contents),
+        )
+    )
+
+
+def _validate(content, xsd_path, schematron_path):
+    try:
+        tree = etree.fromstring(content)
+    except etree.XMLSyntaxError as e:
+        return [str(e)]
+    errors = []
+    if xsd_path:
+        schema = get_schema(xsd_path)
+        if not schema.validate(tree):
+            errors += [
+                "%s: %s" % (error.line, error.message) for error in schema.error_log
+            ]
+    if schematron_path:
+        report = get_schematron(schematron_path)(tree)
+        for failed in report.iter("{%s}failed-assert" % SVRL_NS):
+            if failed.get("flag") == "warning":
+                continue
+            text = " ".join(failed.findtext("{%s}text" % SVRL_NS, default="").split())
+            errors.append(
+                "[%s] %s" % (failed.get("id") or failed.get("location"), text)
+            )
+    return errors
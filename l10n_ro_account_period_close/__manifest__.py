@@ -6,13 +6,16 @@
     "summary": "Romania - Account Period Closing",
     "depends": ["l10n_ro_config"],
     "data": [
+        "data/ir_cron.xml",
         "views/account_period_close_view.xml",
         "wizards/wizard_account_period_closing_view.xml",
+        "wizards/wizard_account_period_closing_run_view.xml",
+        "views/account_balance_month_view.xml",
         "security/account_security.xml",
         "security/ir.model.access.csv",
     ],
     "license": "AGPL-3",
-    "version": "14.0.3.6.0",
+    "version": "14.0.3.11.0",
     "author": "NextERP Romania,"
     "Forest and Biomass Romania,"
     "Odoo Community Association (OCA)",
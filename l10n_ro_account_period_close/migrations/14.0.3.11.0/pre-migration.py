@@ -0,0 +1,21 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    # the monthly balances are appended as delta rows of the same month
+    cr.execute(
+        """
+        ALTER TABLE l10n_ro_account_balance_month
+        DROP CONSTRAINT IF EXISTS l10n_ro_account_balance_month_account_month_uniq
+        """
+    )
+    cr.execute(
+        """
+        DELETE FROM ir_model_constraint
+        WHERE name = 'l10n_ro_account_balance_month_account_month_uniq'
+        """
+    )
@@ -1,2 +1,3 @@
 from . import account
 from . import account_period_close
+from . import account_balance_month
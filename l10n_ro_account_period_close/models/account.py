@@ -2,7 +2,10 @@
 # Copyright (C) 2019 NextERP Romania
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import fields, models
+from odoo import api, fields, models
+
+# Fields of the journal items summed in the monthly balances
+BALANCE_FIELDS = {"account_id", "company_id", "date", "debit", "credit", "balance"}
 
 
 class Account(models.Model):
@@ -26,3 +29,65 @@ class AccountMove(models.Model):
         "l10n.ro.account.period.closing", string="Romania - Closed Account Period"
     )
     l10n_ro_closing_move = fields.Boolean(string="Romania - Is Closing Move")
+
+    def _post(self, soft=True):
+        posted = super()._post(soft=soft)
+        self.env["l10n.ro.account.balance.month"]._add_moves(posted)
+        return posted
+
+    def button_draft(self):
+        posted = self.filtered(lambda move: move.state == "posted")
+        self.env["l10n.ro.account.balance.month"]._add_moves(posted, sign=-1)
+        return super().button_draft()
+
+    def write(self, vals):
+        if not {"date", "company_id"} & set(vals):
+            return super().write(vals)
+        month_balance_model = self.env["l10n.ro.account.balance.month"]
+        posted = self.filtered(lambda move: move.state == "posted")
+        month_balance_model._add_moves(posted, sign=-1)
+        # all the lines of the moves are added again after the write
+        res = super(
+            AccountMove, self.with_context(l10n_ro_balance_month_by_move=True)
+        ).write(vals)
+        month_balance_model._add_moves(
+            posted.filtered(lambda move: move.state == "posted")
+        )
+        return res
+
+
+class AccountMoveLine(models.Model):
+    _inherit = "account.move.line"
+
+    # The monthly balances follow the changes of the posted journal items.
+    # The journal items of a deleted move are deleted with unlink() first.
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        if not self.env.context.get("l10n_ro_balance_month_by_move"):
+            self.env["l10n.ro.account.balance.month"]._add_lines(
+                lines.filtered(lambda line: line.parent_state == "posted")
+            )
+        return lines
+
+    def write(self, vals):
+        if not BALANCE_FIELDS & set(vals) or self.env.context.get(
+            "l10n_ro_balance_month_by_move"
+        ):
+            return super().write(vals)
+        month_balance_model = self.env["l10n.ro.account.balance.month"]
+        posted = self.filtered(lambda line: line.parent_state == "posted")
+        month_balance_model._add_lines(posted, sign=-1)
+        res = super().write(vals)
+        month_balance_model._add_lines(
+            posted.filtered(lambda line: line.parent_state == "posted")
+        )
+        return res
+
+    def unlink(self):
+        if not self.env.context.get("l10n_ro_balance_month_by_move"):
+            self.env["l10n.ro.account.balance.month"]._add_lines(
+                self.filtered(lambda line: line.parent_state == "posted"), sign=-1
+            )
+        return super().unlink()
@@ -0,0 +1,278 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import api, fields, models, tools
+
+
+class AccountBalanceMonth(models.Model):
+    """Monthly debit, credit and balance of the accounts.
+
+    The changes of the posted journal items are appended as signed delta
+    rows, so the transactions posting in the same month and account don't
+    update, nor wait for, the same row. The balance of a month is the sum
+    of its rows, they are compacted by a cron and when a month is closed.
+    """
+
+    _name = "l10n.ro.account.balance.month"
+    _description = "Account Monthly Balance"
+    _order = "month, account_id, id"
+
+    company_id = fields.Many2one("res.company", required=True, readonly=True)
+    account_id = fields.Many2one(
+        "account.account", required=True, readonly=True, ondelete="cascade"
+    )
+    month = fields.Date(required=True, readonly=True, help="First day of the month")
+    debit = fields.Float(readonly=True, digits="Account")
+    credit = fields.Float(readonly=True, digits="Account")
+    balance = fields.Float(readonly=True, digits="Account")
+
+    def init(self):
+        if not tools.index_exists(
+            self.env.cr, "l10n_ro_account_balance_month_account_month_index"
+        ):
+            tools.create_index(
+                self.env.cr,
+                "l10n_ro_account_balance_month_account_month_index",
+                self._table,
+                ["account_id", "month", "company_id"],
+            )
+        self.env.cr.execute("SELECT 1 FROM l10n_ro_account_balance_month LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._rebuild()
+
+    @api.model
+    def action_rebuild(self):
+        """Compute again all the monthly balances, from the menu Accounting /
+        Actions / Rebuild Monthly Balances, if they don't match the journal
+        items anymore"""
+        self.check_access_rights("write")
+        self._rebuild()
+
+    @api.model
+    def _rebuild(self):
+        """Compute again all the monthly balances from the posted lines, one
+        row by company, account and month"""
+        self.env["account.move.line"].flush(
+            ["company_id", "account_id", "date", "debit", "credit", "balance"]
+        )
+        self.env.cr.execute("DELETE FROM l10n_ro_account_balance_month")
+        self.env.cr.execute(
+            """
+            INSERT INTO l10n_ro_account_balance_month
+                (company_id, account_id, month, debit, credit, balance,
+                create_uid, create_date, write_uid, write_date)
+            SELECT aml.company_id, aml.account_id,
+                date_trunc('month', aml.date)::date,
+                SUM(aml.debit), SUM(aml.credit), SUM(aml.balance),
+                %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+            FROM account_move_line aml
+            WHERE aml.parent_state = 'posted'
+            GROUP BY aml.company_id, aml.account_id, date_trunc('month', aml.date)
+            """,
+            {"uid": self.env.uid},
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def _add_moves(self, moves, sign=1):
+        """Add the lines of the moves to the monthly balances, or remove them
+        with sign -1, with one query"""
+        self._add_balances("move_id", moves.ids, sign)
+
+    @api.model
+    def _add_lines(self, lines, sign=1):
+        """Add the journal items to the monthly balances, or remove them
+        with sign -1, with one query"""
+        self._add_balances("id", lines.ids, sign)
+
+    @api.model
+    def _add_balances(self, column, ids, sign):
+        if not ids:
+            return
+        self.env["account.move.line"].flush(
+            [
+                "move_id",
+                "company_id",
+                "account_id",
+                "date",
+                "debit",
+                "credit",
+                "balance",
+            ]
+        )
+        self.env.cr.execute(
+            """
+            INSERT INTO l10n_ro_account_balance_month
+                (company_id, account_id, month, debit, credit, balance,
+                create_uid, create_date, write_uid, write_date)
+            SELECT aml.company_id, aml.account_id,
+                date_trunc('month', aml.date)::date,
+                %(sign)s * SUM(aml.debit), %(sign)s * SUM(aml.credit),
+                %(sign)s * SUM(aml.balance),
+                %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+            FROM account_move_line aml
+            WHERE aml.{column} IN %(ids)s
+            GROUP BY aml.company_id, aml.account_id, date_trunc('month', aml.date)
+            """.format(
+                column=column
+            ),
+            {"sign": sign, "uid": self.env.uid, "ids": tuple(ids)},
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def _compact(self, company_ids=None, month_to=None):
+        """Replace the delta rows of every company, account and month by
+        one row with their sums, for the given companies and the months
+        until month_to, or all of them. The rows appended meanwhile by
+        other transactions are not deleted, they are compacted next time."""
+        self.flush()
+        where = ["TRUE"]
+        params = {"uid": self.env.uid}
+        if company_ids:
+            where.append("company_id IN %(company_ids)s")
+            params["company_ids"] = tuple(company_ids)
+        if month_to:
+            where.append("month <= %(month_to)s")
+            params["month_to"] = fields.Date.to_date(month_to)
+        self.env.cr.execute(
+            """
+            WITH deleted AS (
+                DELETE FROM l10n_ro_account_balance_month
+                WHERE (company_id, account_id, month) IN (
+                    SELECT company_id, account_id, month
+                    FROM l10n_ro_account_balance_month
+                    WHERE {where}
+                    GROUP BY company_id, account_id, month
+                    HAVING COUNT(*) > 1
+                )
+                RETURNING company_id, account_id, month, debit, credit, balance
+            )
+            INSERT INTO l10n_ro_account_balance_month
+                (company_id, account_id, month, debit, credit, balance,
+                create_uid, create_date, write_uid, write_date)
+            SELECT company_id, account_id, month,
+                SUM(debit), SUM(credit), SUM(balance),
+                %(uid)s, now() at time zone 'UTC', %(uid)s, now() at time zone 'UTC'
+            FROM deleted
+            GROUP BY company_id, account_id, month
+            """.format(
+                where=" AND ".join(where)
+            ),
+            params,
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def _cron_compact(self):
+        """Compact the delta rows of all the monthly balances"""
+        self._compact()
+
+    @api.model
+    def _get_balances(self, account_ids, date_to, date_from=False):
+        """Return the debit, credit and balance of the posted lines of the
+        accounts between the dates, as a dictionary account id: dict."""
+        balances = self._get_periods_balances(account_ids, [(date_from, date_to)])
+        return {account_id: values for (_index, account_id), values in balances.items()}
+
+    @api.model
+    def _split_period(self, date_from, date_to):
+        """Return the (month_from, month_to) of the whole months of the
+        period, or False, and the (date_from, date_to) of the incomplete
+        months at its ends"""
+        date_to = fields.Date.to_date(date_to)
+        date_from = fields.Date.to_date(date_from) if date_from else False
+        # first day of the first and of the last whole months
+        month_from = date_from and date_from + relativedelta(day=1)
+        if month_from and month_from != date_from:
+            month_from += relativedelta(months=1)
+        month_to = date_to + relativedelta(day=1)
+        if date_to != date_to + relativedelta(day=31):
+            month_to -= relativedelta(months=1)
+        if month_from and month_from > month_to:
+            # no whole month, all the lines are read
+            return False, [(date_from, date_to)]
+        ledger_ranges = []
+        if date_from and date_from < month_from:
+            ledger_ranges.append((date_from, month_from - relativedelta(days=1)))
+        month_to_end = month_to + relativedelta(day=31)
+        if date_to > month_to_end:
+            ledger_ranges.append((month_to_end + relativedelta(days=1), date_to))
+        return (month_from or None, month_to), ledger_ranges
+
+    @api.model
+    def _get_periods_balances(self, account_ids, periods):
+        """Return the debit, credit and balance of the posted lines of the
+        accounts for every (date_from, date_to) period, with one query, as a
+        dictionary (period index, account id): dict.
+
+        The whole months of a period are summed from the rows of the monthly
+        balances, only the lines of the incomplete months at its ends are read from
+        account_move_line.
+        """
+        if not account_ids or not periods:
+            return {}
+        month_ranges = []
+        ledger_ranges = []
+        for index, (date_from, date_to) in enumerate(periods):
+            month_range, ranges = self._split_period(date_from, date_to)
+            if month_range:
+                month_ranges.append((index,) + month_range)
+            ledger_ranges += [(index,) + date_range for date_range in ranges]
+
+        self.flush()
+        self.env["account.move.line"].flush(
+            ["account_id", "date", "debit", "credit", "balance", "parent_state"]
+        )
+        queries = []
+        params = []
+        if month_ranges:
+            queries.append(
+                """
+                SELECT period.idx, month_balance.account_id, month_balance.debit,
+                    month_balance.credit, month_balance.balance
+                FROM l10n_ro_account_balance_month month_balance
+                JOIN (VALUES {}) AS period(idx, date_from, date_to)
+                    ON (period.date_from IS NULL
+                        OR month_balance.month >= period.date_from)
+                    AND month_balance.month <= period.date_to
+                WHERE month_balance.account_id IN %s
+                """.format(
+                    ", ".join(["(%s, %s::date, %s::date)"] * len(month_ranges))
+                )
+            )
+            for month_range in month_ranges:
+                params += month_range
+            params.append(tuple(account_ids))
+        if ledger_ranges:
+            queries.append(
+                """
+                SELECT period.idx, aml.account_id, aml.debit, aml.credit,
+                    aml.balance
+                FROM account_move_line aml
+                JOIN (VALUES {}) AS period(idx, date_from, date_to)
+                    ON aml.date >= period.date_from AND aml.date <= period.date_to
+                WHERE aml.account_id IN %s AND aml.parent_state = 'posted'
+                """.format(
+                    ", ".join(["(%s, %s::date, %s::date)"] * len(ledger_ranges))
+                )
+            )
+            for ledger_range in ledger_ranges:
+                params += ledger_range
+            params.append(tuple(account_ids))
+        self.env.cr.execute(
+            """
+            SELECT idx, account_id, SUM(debit), SUM(credit), SUM(balance)
+            FROM ({}) AS balances
+            GROUP BY idx, account_id
+            """.format(
+                " UNION ALL ".join(queries)
+            ),
+            params,
+        )
+        return {
+            (index, account_id): {"debit": debit, "credit": credit, "balance": balance}
+            for index, account_id, debit, credit, balance in self.env.cr.fetchall()
+        }
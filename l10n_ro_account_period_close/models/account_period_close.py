@@ -2,6 +2,8 @@
 # Copyright (C) 2019 NextERP Romania
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+import datetime
+
 from odoo import api, fields, models
 
 
@@ -21,6 +23,14 @@ class AccountPeriodClosing(models.Model):
         required=True,
     )
     close_result = fields.Boolean("Close debit and credit accounts")
+    group_by_partner = fields.Boolean(
+        "Close by partner", help="Close the balance of every partner separately."
+    )
+    group_by_currency = fields.Boolean(
+        "Close by currency",
+        help="Close the balance of every currency separately, with its amount "
+        "in currency.",
+    )
     journal_id = fields.Many2one("account.journal", string="Journal", required=True)
     account_ids = fields.Many2many("account.account", string="Accounts to close")
     debit_account_id = fields.Many2one(
@@ -81,7 +91,10 @@ class AccountPeriodClosing(models.Model):
         self.account_ids = accounts
 
     def _get_accounts(self, accounts, display_account):
-        """compute the balance, debit and credit for the provided accounts
+        """Compute the balance, debit and credit of the provided accounts of
+        the closing, between the date_from and date_to of the context, with
+        _get_closing_balances.
+
         :Arguments:
             `accounts`: list of accounts record,
             `display_account`: it's used to display either all accounts or
@@ -93,50 +106,26 @@ class AccountPeriodClosing(models.Model):
             `debit`: total amount of debit,
             `balance`: total amount of balance,
         """
-
-        account_result = {}
-        # Prepare sql query base on selected parameters from wizard
-        tables, where_clause, where_params = self.env["account.move.line"]._query_get()
-        tables = tables.replace('"', "")
-        if not tables:
-            tables = "account_move_line"
-        wheres = [""]
-        if where_clause.strip():
-            wheres.append(where_clause.strip())
-        filters = " AND ".join(wheres)
-        # compute the balance, debit and credit for the provided accounts
-        # pylint: disable=E8103
-        request = (
-            "SELECT account_id AS id, "
-            "SUM(debit) AS debit, "
-            "SUM(credit) AS credit, "
-            "(SUM(debit) - SUM(credit)) AS balance"
-            + " FROM "
-            + tables
-            + " WHERE account_id IN %s "
-            + filters
-            + " GROUP BY account_id"
+        self.ensure_one()
+        date_from = fields.Date.to_date(self.env.context.get("date_from"))
+        date_to = (
+            fields.Date.to_date(self.env.context.get("date_to")) or datetime.date.max
         )
-        params = (tuple(accounts.ids),) + tuple(where_params)
-        self.env.cr.execute(request, params)
-        for row in self.env.cr.dictfetchall():
-            account_result[row.pop("id")] = row
-
+        account_result = {}
+        for values in self._get_closing_balances([(date_from, date_to)]).get(
+            (0, self.id), []
+        ):
+            res = account_result.setdefault(
+                values["account_id"], {"debit": 0.0, "credit": 0.0, "balance": 0.0}
+            )
+            for field_name in res:
+                res[field_name] += values[field_name]
         account_res = []
         for account in accounts:
-            res = {fn: 0.0 for fn in ["credit", "debit", "balance"]}
-            currency = (
-                account.currency_id
-                if account.currency_id
-                else account.company_id.currency_id
-            )
-            res["id"] = account.id
-            res["code"] = account.code
-            res["name"] = account.name
-            if account.id in account_result:
-                res["debit"] = account_result[account.id].get("debit")
-                res["credit"] = account_result[account.id].get("credit")
-                res["balance"] = account_result[account.id].get("balance")
+            currency = account.currency_id or account.company_id.currency_id
+            res = {"credit": 0.0, "debit": 0.0, "balance": 0.0}
+            res.update(account_result.get(account.id, {}))
+            res.update(id=account.id, code=account.code, name=account.name)
             if display_account == "all":
                 account_res.append(res)
             if display_account == "not_zero" and not currency.is_zero(res["balance"]):
@@ -151,126 +140,280 @@ class AccountPeriodClosing(models.Model):
     def close(self, journal_id=None, date_from=None, date_to=None):
         """This method will create the closing move for the
         date interval selected."""
-        account_obj = self.env["account.account"]
-        if not journal_id:
-            journal_id = self.journal_id.id
-        for closing in self:
-            ctx = self.env.context.copy()
-            ctx.update(
-                {
-                    "strict_range": True,
-                    "state": "posted",
-                    "date_from": date_from,
-                    "date_to": date_to,
-                    "company_id": closing.company_id.id,
-                }
-            )
-            account_res = self.with_context(ctx)._get_accounts(
-                closing.account_ids, "not_zero"
-            )
-            move = self.env["account.move"].create(
+        return self.close_periods([(date_from, date_to)], journal_id=journal_id)
+
+    def close_periods(self, periods, journal_id=None):
+        """Create and post the closing moves of the closings, of any
+        companies, for every (date_from, date_to) period.
+
+        The balances of all the closings and periods are computed with one
+        grouped query, and all the moves are created with one create. The
+        periods are closed in chronological order and the closings in their
+        order, the balances and the result of a closing take into account
+        the moves of the closings before it.
+        """
+        periods = sorted(
+            (
+                (fields.Date.to_date(date_from), fields.Date.to_date(date_to))
+                for date_from, date_to in periods
+            ),
+            key=lambda period: period[1],
+        )
+        balances = self._get_closing_balances(periods)
+        result_balances = self._get_result_balances(periods)
+        # (date, account id, balance) of the closing lines of this run
+        run_lines = []
+        vals_list = []
+        for index, (date_from, date_to) in enumerate(periods):
+            for closing in self:
+                lines = closing._prepare_closing_lines(
+                    closing._add_run_balances(
+                        balances.get((index, closing.id), []),
+                        run_lines,
+                        date_from,
+                        date_to,
+                    )
+                )
+                if closing.close_result and lines[-1]["balance"]:
+                    account_balances = {
+                        account.id: result_balances.get((index, account.id), 0.0)
+                        + sum(
+                            line[2]
+                            for line in run_lines
+                            if line[0] <= date_to and line[1] == account.id
+                        )
+                        for account in closing.debit_account_id
+                        | closing.credit_account_id
+                    }
+                    lines += closing._prepare_result_lines(account_balances)
+                run_lines += [
+                    (date_to, line["account_id"], line["balance"]) for line in lines
+                ]
+                vals_list.append(
+                    closing._prepare_closing_move(journal_id, date_to, lines)
+                )
+        moves = self.env["account.move"].create(vals_list)
+        moves.action_post()
+        # the closed months are not posted in anymore
+        self.env["l10n.ro.account.balance.month"]._compact(
+            self.mapped("company_id").ids, periods[-1][1]
+        )
+        return moves
+
+    def _get_closing_balances(self, periods):
+        """Return the balances of the accounts to close, by closing and
+        period, with one query grouped by closing, period, account and, if
+        the closing is configured so, partner and currency.
+
+        :returns: a dictionary (period index, closing id): list of dict with
+            account_id, partner_id, currency_id, close_check, balance,
+            amount_currency, debit and credit
+        """
+        if not self or not periods:
+            return {}
+        self.env["account.move.line"].flush(
+            [
+                "account_id",
+                "partner_id",
+                "currency_id",
+                "company_id",
+                "date",
+                "debit",
+                "credit",
+                "balance",
+                "amount_currency",
+                "parent_state",
+            ]
+        )
+        self.flush(["company_id", "group_by_partner", "group_by_currency"])
+        field = self._fields["account_ids"]
+        params = []
+        for index, (date_from, date_to) in enumerate(periods):
+            params += [index, date_from, date_to]
+        query = """
+            SELECT period.idx, closing.id, aml.account_id, account.l10n_ro_close_check,
+                CASE WHEN closing.group_by_partner THEN aml.partner_id END,
+                CASE WHEN closing.group_by_currency THEN aml.currency_id END,
+                SUM(aml.balance), SUM(aml.amount_currency),
+                SUM(aml.debit), SUM(aml.credit)
+            FROM l10n_ro_account_period_closing closing
+            JOIN {relation} rel ON rel.{column1} = closing.id
+            JOIN account_account account ON account.id = rel.{column2}
+            JOIN account_move_line aml
+                ON aml.account_id = account.id AND aml.company_id = closing.company_id
+            JOIN (VALUES {values}) AS period(idx, date_from, date_to)
+                ON (period.date_from IS NULL OR aml.date >= period.date_from)
+                AND aml.date <= period.date_to
+            WHERE closing.id IN %s AND aml.parent_state = 'posted'
+            GROUP BY 1, 2, 3, 4, 5, 6, account.code
+            ORDER BY 1, 2, account.code, 3, 5, 6
+        """.format(
+            relation=field.relation,
+            column1=field.column1,
+            column2=field.column2,
+            values=", ".join(["(%s, %s::date, %s::date)"] * len(periods)),
+        )
+        self.env.cr.execute(query, params + [tuple(self.ids)])
+        res = {}
+        for row in self.env.cr.fetchall():
+            index, closing_id, account_id, check, partner_id, currency_id = row[:6]
+            res.setdefault((index, closing_id), []).append(
                 {
-                    "date": date_to,
-                    "journal_id": journal_id,
-                    "l10n_ro_close_id": closing.id,
-                    "company_id": closing.company_id.id,
-                    "l10n_ro_closing_move": True,
+                    "account_id": account_id,
+                    "close_check": check,
+                    "partner_id": partner_id,
+                    "currency_id": currency_id,
+                    "balance": row[6],
+                    "amount_currency": row[7],
+                    "debit": row[8],
+                    "credit": row[9],
                 }
             )
-            amount = 0.0
-            line_values = []
-            for account in account_res:
-                if account["balance"] != 0.0:
-                    balance = move.currency_id.round(account["balance"])
-                    check = account_obj.browse(account["id"]).l10n_ro_close_check
-                    if closing.type == "expense" and not check:
-                        val = {
-                            "name": "Closing " + closing.name,
-                            "move_id": move.id,
-                            "account_id": account["id"],
-                            "credit": balance or 0.0,
-                            "debit": 0.0,
-                        }
-                    elif closing.type == "income" and not check:
-                        val = {
-                            "name": "Closing " + closing.name,
-                            "move_id": move.id,
-                            "account_id": account["id"],
-                            "credit": 0.0,
-                            "debit": (-1 * balance) or 0.0,
-                        }
-                    else:
-                        val = {
-                            "name": "Closing " + closing.name,
-                            "move_id": move.id,
-                            "account_id": account["id"],
-                            "credit": balance if balance > 0.0 else 0.0,
-                            "debit": -balance if balance < 0.0 else 0.0,
-                        }
-                    amount += balance
+        return res
+
+    def _add_run_balances(self, balances, run_lines, date_from, date_to):
+        """Return the balances of the accounts to close with the lines of
+        the closings before it in this run, which are not in the database
+        yet. The closing lines have no partner and no currency."""
+        self.ensure_one()
+        run_balances = {}
+        for date, account_id, balance in run_lines:
+            if (
+                account_id in self.account_ids.ids
+                and (not date_from or date >= date_from)
+                and date <= date_to
+            ):
+                run_balances[account_id] = run_balances.get(account_id, 0.0) + balance
+        if not run_balances:
+            return balances
+        balances = [dict(values) for values in balances]
+        for values in balances:
+            if not values["partner_id"] and not values["currency_id"]:
+                values["balance"] += run_balances.pop(values["account_id"], 0.0)
+        for account in self.account_ids:
+            if account.id in run_balances:
+                balances.append(
+                    {
+                        "account_id": account.id,
+                        "close_check": account.l10n_ro_close_check,
+                        "partner_id": None,
+                        "currency_id": None,
+                        "balance": run_balances[account.id],
+                        "amount_currency": 0.0,
+                    }
+                )
+        return balances
+
+    def _get_result_balances(self, periods):
+        """Return the balances at the end of every period of the debit and
+        credit accounts of the closings closing the result, read from the
+        monthly balances with one query, as a dictionary (period index,
+        account id): balance"""
+        closings = self.filtered("close_result")
+        accounts = closings.mapped("debit_account_id") | closings.mapped(
+            "credit_account_id"
+        )
+        if not accounts:
+            return {}
+        balances = self.env["l10n.ro.account.balance.month"]._get_periods_balances(
+            accounts.ids, [(False, date_to) for _date_from, date_to in periods]
+        )
+        return {key: values["balance"] for key, values in balances.items()}
 
-                    line_values += [val]
-            diff_line = {
-                "name": "Closing " + closing.name,
-                "move_id": move.id,
-                "account_id": closing.debit_account_id.id
+    def _prepare_closing_lines(self, balances):
+        """Return the values of the lines closing the balances of the
+        accounts, the last one is the closing account line"""
+        self.ensure_one()
+        currency = self.company_id.currency_id
+        name = "Closing " + self.name
+        amount = 0.0
+        lines = []
+        for account in balances:
+            balance = currency.round(account["balance"])
+            if currency.is_zero(balance):
+                continue
+            if self.type == "expense" and not account["close_check"]:
+                debit, credit = 0.0, balance
+            elif self.type == "income" and not account["close_check"]:
+                debit, credit = -balance, 0.0
+            else:
+                debit = -balance if balance < 0.0 else 0.0
+                credit = balance if balance > 0.0 else 0.0
+            vals = {
+                "name": name,
+                "account_id": account["account_id"],
+                "partner_id": account["partner_id"],
+                "debit": debit,
+                "credit": credit,
+                "balance": -balance,
+            }
+            if account["currency_id"] and account["currency_id"] != currency.id:
+                vals.update(
+                    currency_id=account["currency_id"],
+                    amount_currency=-account["amount_currency"],
+                )
+            lines.append(vals)
+            amount += balance
+        lines.append(
+            {
+                "name": name,
+                "account_id": self.debit_account_id.id
                 if amount >= 0
-                else closing.credit_account_id.id,
+                else self.credit_account_id.id,
                 "credit": -amount if amount <= 0.0 else 0.0,
                 "debit": amount if amount >= 0.0 else 0.0,
+                "balance": amount,
             }
+        )
+        return lines
 
-            line_values += [diff_line]
-
-            if self.close_result and amount != 0.0:
-                debit_acc = closing.debit_account_id
-                credit_acc = closing.credit_account_id
-                debit = credit = new_amount = 0.0
-                ctx1 = dict(self._context)
-                ctx1.update({"date_from": False, "date_to": date_to})
-                accounts = account_obj.browse(
-                    [closing.debit_account_id.id, closing.credit_account_id.id]
-                )
-                account_res = self.with_context(ctx1)._get_accounts(accounts, "all")
-                for acc in account_res:
-                    if acc["id"] == closing.debit_account_id.id:
-                        debit = acc["balance"]
-                    if acc["id"] == closing.credit_account_id.id:
-                        credit = acc["balance"]
-                    old_balance = debit - (-1 * credit)
-                    if credit and debit:
-                        if old_balance > 0:
-                            debit_acc = closing.credit_account_id
-                            credit_acc = closing.debit_account_id
-                        elif old_balance < 0:
-                            debit_acc = closing.debit_account_id
-                            credit_acc = closing.credit_account_id
-                if abs(debit) > abs(credit):
-                    new_amount = -1 * credit
-                else:
-                    new_amount = debit
-                diff_line = {
-                    "name": "Closing " + closing.name + " " + str(debit_acc.code),
-                    "move_id": move.id,
-                    "account_id": debit_acc.id,
-                    "credit": new_amount if new_amount > 0 else 0,
-                    "debit": -new_amount if new_amount < 0 else 0,
-                }
-
-                line_values += [diff_line]
-
-                diff_line = {
-                    "name": "Closing " + closing.name + " " + str(credit_acc.code),
-                    "move_id": move.id,
-                    "account_id": credit_acc.id,
-                    "credit": 0.0 - new_amount if new_amount < 0 else 0,
-                    "debit": new_amount if new_amount > 0 else 0,
-                }
-
-                line_values += [diff_line]
+    def _prepare_result_lines(self, account_balances):
+        """Return the values of the lines closing the result between the
+        debit and the credit accounts, from their balances"""
+        self.ensure_one()
+        debit_acc = self.debit_account_id
+        credit_acc = self.credit_account_id
+        debit = account_balances.get(debit_acc.id, 0.0)
+        credit = account_balances.get(credit_acc.id, 0.0)
+        old_balance = debit + credit
+        if credit and debit:
+            if old_balance > 0:
+                debit_acc = self.credit_account_id
+                credit_acc = self.debit_account_id
+            elif old_balance < 0:
+                debit_acc = self.debit_account_id
+                credit_acc = self.credit_account_id
+        if abs(debit) > abs(credit):
+            new_amount = -1 * credit
+        else:
+            new_amount = debit
+        return [
+            {
+                "name": "Closing " + self.name + " " + str(debit_acc.code),
+                "account_id": debit_acc.id,
+                "credit": new_amount if new_amount > 0 else 0,
+                "debit": -new_amount if new_amount < 0 else 0,
+                "balance": -new_amount,
+            },
+            {
+                "name": "Closing " + self.name + " " + str(credit_acc.code),
+                "account_id": credit_acc.id,
+                "credit": 0.0 - new_amount if new_amount < 0 else 0,
+                "debit": new_amount if new_amount > 0 else 0,
+                "balance": new_amount,
+            },
+        ]
 
-            # se genereaza toate liniile
-            self.env["account.move.line"].with_context(
-                check_move_validity=False
-            ).create(line_values)
-            move.action_post()
+    def _prepare_closing_move(self, journal_id, date, lines):
+        self.ensure_one()
+        return {
+            "date": date,
+            "journal_id": journal_id or self.journal_id.id,
+            "l10n_ro_close_id": self.id,
+            "company_id": self.company_id.id,
+            "l10n_ro_closing_move": True,
+            "line_ids": [
+                (0, 0, {key: value for key, value in line.items() if key != "balance"})
+                for line in lines
+            ],
+        }
@@ -1,7 +1,9 @@
 # Copyright (C) 2018 Forest and Biomass Romania
 # Copyright (C) 2019 NextERP Romania
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+import threading
 import time
+from unittest import mock
 
 from dateutil.relativedelta import relativedelta
 
@@ -10,6 +12,8 @@ from odoo.tests import tagged
 
 from odoo.addons.account.tests.common import AccountTestInvoicingCommon
 
+from ..wizards import wizard_account_period_closing_run
+
 
 @tagged("post_install", "-at_install")
 class TestPeriodClosing(AccountTestInvoicingCommon):
@@ -227,6 +231,35 @@ class TestPeriodClosing(AccountTestInvoicingCommon):
         self.inc_closing._onchange_type()
         self.assertEqual(self.inc_closing.account_ids, inc_accounts)
 
+    def test_period_closing_get_closing_balances(self):
+        account_expense = self.company_data["default_account_expense"]
+        account_revenue = self.company_data["default_account_revenue"]
+        account_sale_tax = self.company.account_sale_tax_id.mapped(
+            "invoice_repartition_line_ids.account_id"
+        )
+        account_purchase_tax = self.company.account_purchase_tax_id.mapped(
+            "invoice_repartition_line_ids.account_id"
+        )
+        self.exp_closing._onchange_type()
+        self.inc_closing._onchange_type()
+        date_from = fields.Date.from_string(time.strftime("%Y-%m") + "-01")
+        date_to = fields.Date.from_string(time.strftime("%Y-%m") + "-28")
+        closings = self.exp_closing | self.inc_closing | self.vat_closing
+        balances = closings._get_closing_balances([(date_from, date_to)])
+
+        def get_balances(closing):
+            return {
+                values["account_id"]: values["balance"]
+                for values in balances.get((0, closing.id), [])
+            }
+
+        self.assertEqual(get_balances(self.exp_closing), {account_expense.id: 100.0})
+        self.assertEqual(get_balances(self.inc_closing), {account_revenue.id: -1000.0})
+        self.assertEqual(
+            get_balances(self.vat_closing),
+            {account_sale_tax.id: -150.0, account_purchase_tax.id: 15.0},
+        )
+
     def test_period_closing_get_accounts(self):
 
         account_expense = self.company_data["default_account_expense"]
@@ -312,6 +345,204 @@ class TestPeriodClosing(AccountTestInvoicingCommon):
         self.inc_closing.close(date_from=date_from, date_to=date_to)
         self.assertEqual(len(self.exp_closing.move_ids), 1)
 
+    def test_period_closing_several_periods(self):
+        self.exp_closing._onchange_type()
+        self.inc_closing._onchange_type()
+        month_start = fields.Date.from_string(time.strftime("%Y-%m") + "-01")
+        month_end = month_start + relativedelta(day=31)
+        previous_month_start = month_start - relativedelta(months=1)
+        previous_month_end = month_start - relativedelta(days=1)
+        periods = [
+            (month_start, month_end),
+            (previous_month_start, previous_month_end),
+        ]
+        moves = (self.exp_closing | self.inc_closing).close_periods(periods)
+        self.assertEqual(len(moves), 4)
+        self.assertEqual(set(moves.mapped("state")), {"posted"})
+        self.assertEqual(len(self.exp_closing.move_ids), 2)
+        self.assertEqual(moves[0].date, previous_month_end)
+
+        lines = moves.filtered(lambda m: m.date == month_end).mapped("line_ids")
+        account_expense = self.company_data["default_account_expense"]
+        account_revenue = self.company_data["default_account_revenue"]
+
+        def balance(account):
+            account_lines = lines.filtered(lambda line: line.account_id == account)
+            return sum(account_lines.mapped("balance"))
+
+        self.assertEqual(balance(account_expense), -100.0)
+        self.assertEqual(balance(account_revenue), 1000.0)
+        self.assertEqual(balance(self.debit_acc), 100.0)
+        self.assertEqual(balance(self.credit_acc), -1000.0)
+
+    def test_period_closing_run(self):
+        self.exp_closing._onchange_type()
+        self.inc_closing._onchange_type()
+        month_start = fields.Date.from_string(time.strftime("%Y-%m") + "-01")
+        closings = self.vat_closing | self.inc_closing | self.exp_closing
+        wizard = self.env["l10n.ro.account.period.closing.run"].create(
+            {
+                "closing_ids": [(6, 0, closings.ids)],
+                "date_from": month_start - relativedelta(months=1),
+                "date_to": month_start + relativedelta(day=31),
+            }
+        )
+        self.assertEqual(len(wizard._get_periods()), 2)
+        self.assertEqual(
+            wizard._sort_closings(closings),
+            self.exp_closing | self.inc_closing | self.vat_closing,
+        )
+        wizard.do_close()
+        self.assertEqual(len(wizard.line_ids), 1)
+        self.assertEqual(wizard.line_ids.company_id, self.company)
+        self.assertEqual(wizard.line_ids.state, "done")
+        self.assertEqual(wizard.line_ids.move_count, 6)
+        for closing in closings:
+            self.assertEqual(len(closing.move_ids), 2)
+
+    def test_period_closing_run_threads(self):
+        """The companies are closed by a thread pool, each in its cursor"""
+        self.exp_closing._onchange_type()
+        self.inc_closing._onchange_type()
+        month_start = fields.Date.from_string(time.strftime("%Y-%m") + "-01")
+        closings = self.inc_closing | self.exp_closing
+        wizard = self.env["l10n.ro.account.period.closing.run"].create(
+            {
+                "closing_ids": [(6, 0, closings.ids)],
+                "date_from": month_start,
+                "date_to": month_start + relativedelta(day=31),
+            }
+        )
+        # the cursors of the registry share the transaction of the test
+        self.registry.enter_test_mode(self.cr)
+        self.addCleanup(self.registry.leave_test_mode)
+        run_module = wizard_account_period_closing_run
+        with mock.patch.object(
+            threading.current_thread(), "testing", False, create=True
+        ), mock.patch.object(
+            run_module,
+            "ThreadPoolExecutor",
+            wraps=run_module.ThreadPoolExecutor,
+        ) as executor:
+            wizard.do_close()
+        executor.assert_called_once()
+        self.assertEqual(wizard.line_ids.state, "done")
+        self.assertEqual(wizard.line_ids.move_count, 2)
+        for closing in closings:
+            self.assertEqual(len(closing.move_ids), 1)
+
+    def test_period_closing_dependencies(self):
+        """A closing of the accounts where another closing posts comes after
+        it, and closes the balances of its moves"""
+        month_start = fields.Date.from_string(time.strftime("%Y-%m") + "-01")
+        month_end = month_start + relativedelta(day=31)
+        vat_result_closing = self.per_close_model.create(
+            {
+                "name": "Closing VAT Result",
+                "type": "selected",
+                "account_ids": [
+                    (6, 0, (self.vat_close_debit | self.vat_close_credit).ids)
+                ],
+                "journal_id": self.misc_journal.id,
+                "debit_account_id": self.debit_acc.id,
+                "credit_account_id": self.credit_acc.id,
+            }
+        )
+        vat_closing = self.vat_closing.copy({"name": "Closing VAT 2"})
+        closings = vat_result_closing | vat_closing
+        wizard_model = self.env["l10n.ro.account.period.closing.run"]
+        closings = wizard_model._sort_closings(closings)
+        self.assertEqual(closings, vat_closing | vat_result_closing)
+        moves = closings.close_periods([(month_start, month_end)])
+        result_lines = moves.filtered(
+            lambda move: move.l10n_ro_close_id == vat_result_closing
+        ).line_ids
+        self.assertEqual(
+            {line.account_id: line.balance for line in result_lines},
+            {self.vat_close_credit: 135.0, self.credit_acc: -135.0},
+        )
+
+    def test_account_balance_month(self):
+        month_balance_model = self.env["l10n.ro.account.balance.month"]
+        account_revenue = self.company_data["default_account_revenue"]
+        account_expense = self.company_data["default_account_expense"]
+        month_start = fields.Date.from_string(time.strftime("%Y-%m") + "-01")
+        month_end = month_start + relativedelta(day=31)
+        account_ids = [account_revenue.id, account_expense.id]
+
+        def get_balances(date_to, date_from=False):
+            balances = month_balance_model._get_balances(
+                account_ids, date_to, date_from
+            )
+            return {
+                account_id: balances.get(account_id, {}).get("balance", 0.0)
+                for account_id in account_ids
+            }
+
+        def get_month_rows():
+            return month_balance_model.search([("account_id", "in", account_ids)]).read(
+                ["account_id", "month", "debit", "credit", "balance"], load=""
+            )
+
+        expected = {account_revenue.id: -1000.0, account_expense.id: 100.0}
+        self.assertEqual(get_balances(month_end), expected)
+        self.assertEqual(get_balances(month_end, month_start), expected)
+        # partial months are read from the journal items
+        self.assertEqual(get_balances(month_start, month_start), expected)
+        self.assertEqual(
+            get_balances(month_start - relativedelta(days=1)),
+            {account_revenue.id: 0.0, account_expense.id: 0.0},
+        )
+        month_balance_model._compact()
+        rows = get_month_rows()
+        month_balance_model._rebuild()
+        self.assertEqual(
+            [dict(row, id=False) for row in get_month_rows()],
+            [dict(row, id=False) for row in rows],
+        )
+
+        self.test_move.button_draft()
+        self.assertEqual(
+            get_balances(month_end),
+            {account_revenue.id: -1000.0, account_expense.id: 0.0},
+        )
+        self.test_move.action_post()
+        self.assertEqual(get_balances(month_end), expected)
+        # the changes are appended as delta rows, summed by the compaction
+        self.assertGreater(len(get_month_rows()), 2)
+        month_balance_model._cron_compact()
+        self.assertEqual(len(get_month_rows()), 2)
+        self.assertEqual(get_balances(month_end), expected)
+
+        # several periods are read with one query
+        periods = [(False, month_start - relativedelta(days=1)), (False, month_end)]
+        balances = month_balance_model._get_periods_balances(account_ids, periods)
+        self.assertEqual(balances[(1, account_revenue.id)]["balance"], -1000.0)
+        self.assertNotIn((0, account_revenue.id), balances)
+
+        # the changes of the posted journal items are followed
+        expense_line = self.test_move.line_ids.filtered(
+            lambda line: line.account_id == account_expense
+        )
+        expense_line.account_id = account_revenue
+        self.assertEqual(
+            get_balances(month_end),
+            {account_revenue.id: -900.0, account_expense.id: 0.0},
+        )
+        # the rebuild doesn't keep the months left without lines
+        month_balance_model._compact(self.env.company.ids, month_end)
+        rows = [row for row in get_month_rows() if row["debit"] or row["credit"]]
+        month_balance_model.action_rebuild()
+        self.assertEqual(
+            [dict(row, id=False) for row in get_month_rows()],
+            [dict(row, id=False) for row in rows],
+        )
+        self.test_move.with_context(force_delete=True).unlink()
+        self.assertEqual(
+            get_balances(month_end),
+            {account_revenue.id: -1000.0, account_expense.id: 0.0},
+        )
+
     def test_period_closing_wizard_defaults(self):
         today = fields.Date.from_string(fields.Date.today())
         date_from = today + relativedelta(day=1, months=-1)
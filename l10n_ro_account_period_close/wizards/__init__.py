@@ -1 +1,2 @@
 from . import wizard_account_period_closing
+from . import wizard_account_period_closing_run
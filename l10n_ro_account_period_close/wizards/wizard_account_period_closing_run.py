@@ -0,0 +1,175 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dateutil.relativedelta import relativedelta
+
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+# Number of companies closed at the same time, each with its own cursor
+MAX_WORKERS = 4
+
+
+class WizardAccountPeriodClosingRun(models.TransientModel):
+    _name = "l10n.ro.account.period.closing.run"
+    _description = "Account Period Closing of Several Companies and Months"
+
+    def _get_default_date_from(self):
+        today = fields.Date.from_string(fields.Date.today())
+        return today + relativedelta(day=1, month=1, years=-1)
+
+    def _get_default_date_to(self):
+        today = fields.Date.from_string(fields.Date.today())
+        return today + relativedelta(day=31, month=12, years=-1)
+
+    closing_ids = fields.Many2many(
+        "l10n.ro.account.period.closing", string="Closing Models", required=True
+    )
+    date_from = fields.Date("Start Date", required=True, default=_get_default_date_from)
+    date_to = fields.Date("End Date", required=True, default=_get_default_date_to)
+    line_ids = fields.One2many(
+        "l10n.ro.account.period.closing.run.line",
+        "wizard_id",
+        string="Results",
+        readonly=True,
+    )
+    duration = fields.Float(string="Duration (s)", readonly=True)
+
+    def _get_periods(self):
+        """Return the (date_from, date_to) of every month of the interval"""
+        self.ensure_one()
+        periods = []
+        date_from = self.date_from
+        while date_from <= self.date_to:
+            date_to = min(date_from + relativedelta(day=31), self.date_to)
+            periods.append((date_from, date_to))
+            date_from = date_to + relativedelta(days=1)
+        return periods
+
+    @api.model
+    def _sort_closings(self, closings):
+        """Sort the closings of a company in dependency order: a closing
+        comes after the closings whose moves post to the accounts it closes,
+        or to its debit and credit accounts when it closes the result. The
+        closings without dependencies between them, or in a cycle, are
+        sorted with the income and expense closings first, and the closings
+        of the result after the other ones."""
+
+        def closed_accounts(closing):
+            accounts = closing.account_ids
+            if closing.close_result:
+                accounts |= closing.debit_account_id | closing.credit_account_id
+            return accounts
+
+        depends = {
+            closing: closings.filtered(
+                lambda other: other != closing
+                and (other.debit_account_id | other.credit_account_id)
+                & closed_accounts(closing)
+            )
+            for closing in closings
+        }
+        pending = closings.sorted(
+            lambda closing: (
+                closing.type == "selected",
+                closing.close_result,
+                closing.id,
+            )
+        )
+        res = closings.browse()
+        while pending:
+            ready = pending.filtered(lambda closing: not depends[closing] & pending)
+            closing = ready[:1] or pending[:1]
+            res |= closing
+            pending -= closing
+        return res
+
+    def do_close(self):
+        self.ensure_one()
+        if self.date_from > self.date_to:
+            raise UserError(_("The start date must be before the end date."))
+        start = time.perf_counter()
+        periods = self._get_periods()
+        to_close = []
+        for company in self.closing_ids.mapped("company_id"):
+            closings = self.closing_ids.filtered(
+                lambda closing: closing.company_id == company
+            )
+            to_close.append((company.id, self._sort_closings(closings).ids))
+        results = self._run_closings(to_close, periods)
+        self.write(
+            {
+                "line_ids": [(5, 0, 0)] + [(0, 0, vals) for vals in results],
+                "duration": time.perf_counter() - start,
+            }
+        )
+        return {
+            "type": "ir.actions.act_window",
+            "res_model": self._name,
+            "res_id": self.id,
+            "view_mode": "form",
+            "target": "new",
+        }
+
+    def _run_closings(self, to_close, periods):
+        """Close the companies in parallel, each one in its own transaction,
+        return the result values of each company"""
+        if getattr(threading.current_thread(), "testing", False):
+            # the tests can't commit, nor see their data from other cursors
+            return [
+                self._close_company(company_id, closing_ids, periods)
+                for company_id, closing_ids in to_close
+            ]
+        # the closings are read and the moves created by other cursors
+        self.flush()
+        uid, context = self.env.uid, self.env.context
+
+        def close_company(args):
+            company_id, closing_ids = args
+            with api.Environment.manage(), self.pool.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                return env[self._name]._close_company(company_id, closing_ids, periods)
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = list(executor.map(close_company, to_close))
+        self.invalidate_cache()
+        return results
+
+    @api.model
+    def _close_company(self, company_id, closing_ids, periods):
+        """Create the closing moves of a company, all or nothing"""
+        start = time.perf_counter()
+        vals = {"company_id": company_id}
+        closings = self.env["l10n.ro.account.period.closing"].browse(closing_ids)
+        try:
+            with self.env.cr.savepoint():
+                moves = closings.with_company(company_id).close_periods(periods)
+        except Exception as e:
+            _logger.warning("Period closing of company %s failed: %s", company_id, e)
+            vals.update(state="error", message=str(e))
+        else:
+            vals.update(state="done", move_count=len(moves))
+        vals["duration"] = time.perf_counter() - start
+        return vals
+
+
+class WizardAccountPeriodClosingRunLine(models.TransientModel):
+    _name = "l10n.ro.account.period.closing.run.line"
+    _description = "Account Period Closing Result of a Company"
+    _order = "id"
+
+    wizard_id = fields.Many2one(
+        "l10n.ro.account.period.closing.run", required=True, ondelete="cascade"
+    )
+    company_id = fields.Many2one("res.company", string="Company")
+    state = fields.Selection([("done", "Closed"), ("error", "Error")])
+    move_count = fields.Integer(string="Closing Moves")
+    duration = fields.Float(string="Duration (s)", digits=(16, 3))
+    message = fields.Text()
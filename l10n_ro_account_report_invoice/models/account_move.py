@@ -1,8 +1,14 @@
 # Copyright 2018 NextERP Romania
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+import logging
+from bisect import bisect_right
+from collections import defaultdict
+
 from odoo import api, fields, models
 
+_logger = logging.getLogger(__name__)
+
 
 class AccountMove(models.Model):
     _name = "account.move"
@@ -10,16 +16,22 @@ class AccountMove(models.Model):
 
     @api.depends("currency_id", "invoice_date", "date")
     def _compute_l10n_ro_currency_rate(self):
+        groups = defaultdict(lambda: self.env["account.move"])
         for invoice in self:
-            currency_rate = 1
+            invoice.l10n_ro_currency_rate = 1
             if invoice.is_l10n_ro_record and invoice.currency_id:
-                currency_rate = self.env["res.currency"]._get_conversion_rate(
-                    invoice.currency_id,
-                    invoice.company_currency_id,
-                    invoice.company_id or self.env.company,
-                    invoice.invoice_date or invoice.date or fields.Date.today(),
-                )
-            invoice.l10n_ro_currency_rate = currency_rate
+                company = invoice.company_id or self.env.company
+                key = (invoice.currency_id, invoice.company_currency_id, company)
+                groups[key] |= invoice
+        for (currency, company_currency, company), invoices in groups.items():
+            dates = [invoice._l10n_ro_get_currency_rate_date() for invoice in invoices]
+            rate_table = self._l10n_ro_get_rate_table(
+                currency | company_currency, company, max(dates)
+            )
+            for invoice, rate_date in zip(invoices, dates):
+                invoice.l10n_ro_currency_rate = self._l10n_ro_lookup_rate(
+                    rate_table, company_currency, rate_date
+                ) / self._l10n_ro_lookup_rate(rate_table, currency, rate_date)
 
     l10n_ro_currency_rate = fields.Float(
         string="Romania - Currency Rate",
@@ -27,3 +39,62 @@ class AccountMove(models.Model):
         readonly=True,
         compute="_compute_l10n_ro_currency_rate",
     )
+
+    def _l10n_ro_get_currency_rate_date(self):
+        return self.invoice_date or self.date or fields.Date.today()
+
+    @api.model
+    def _l10n_ro_get_rate_table(self, currencies, company, date_to):
+        """Load once all the rates of the currencies for the company up to
+        date_to, as sorted (dates, rates) lists by currency; the company
+        specific rates are kept apart from the shared ones because they take
+        precedence, like in res.currency._get_rates."""
+        self.env["res.currency.rate"].flush(
+            ["rate", "currency_id", "company_id", "name"]
+        )
+        self.env.cr.execute(
+            """
+            SELECT currency_id, company_id IS NOT NULL, name, rate
+            FROM res_currency_rate
+            WHERE currency_id IN %s AND name <= %s
+                AND (company_id IS NULL OR company_id = %s)
+            ORDER BY name
+            """,
+            (tuple(currencies.ids), date_to, company.id),
+        )
+        rate_table = {
+            currency.id: {True: ([], []), False: ([], [])} for currency in currencies
+        }
+        for currency_id, is_company_rate, rate_date, rate in self.env.cr.fetchall():
+            dates, rates = rate_table[currency_id][is_company_rate]
+            dates.append(rate_date)
+            rates.append(rate)
+        return rate_table
+
+    @api.model
+    def _l10n_ro_lookup_rate(self, rate_table, currency, rate_date):
+        for is_company_rate in (True, False):
+            dates, rates = rate_table[currency.id][is_company_rate]
+            index = bisect_right(dates, rate_date)
+            if index:
+                return rates[index - 1]
+        return 1.0
+
+    @api.model
+    def _l10n_ro_recompute_currency_rate(self, domain=None, batch_size=5000):
+        """Recompute the stored currency rate of the historical invoices in
+        batches, e.g. after rates were changed for past periods."""
+        field = self._fields["l10n_ro_currency_rate"]
+        move_ids = self.search(domain or []).ids
+        for start in range(0, len(move_ids), batch_size):
+            moves = self.browse(move_ids[start : start + batch_size])
+            self.env.add_to_compute(field, moves)
+            moves.recompute(["l10n_ro_currency_rate"])
+            moves.flush(["l10n_ro_currency_rate"])
+            moves.invalidate_cache()
+            _logger.info(
+                "Recomputed currency rate of %s/%s invoices",
+                min(start + batch_size, len(move_ids)),
+                len(move_ids),
+            )
+        return True
@@ -47,3 +47,31 @@ class TestInvoiceCurrencyRate(AccountTestInvoicingCommon):
         move_form.invoice_date = today
         move_form.save()
         self.assertEqual(self.invoice.l10n_ro_currency_rate, 4)
+
+    def test_invoice_currency_rate_batch(self):
+        """Rates of several invoices are resolved from one rate table."""
+        self.env["res.currency.rate"].search([]).unlink()
+        date_from = datetime.date(self.prev_year, 1, 1)
+        date_to = datetime.date(self.prev_year, 12, 31)
+        self.env["res.currency.rate"].create(
+            dict(currency_id=self.usd_currency.id, name=date_from, rate=0.5)
+        )
+        self.env["res.currency.rate"].create(
+            dict(currency_id=self.usd_currency.id, name=date_to, rate=0.25)
+        )
+        invoices = self.env["account.move"]
+        for invoice_date in (date_from, date_to - datetime.timedelta(days=1), date_to):
+            invoice = self.init_invoice(
+                "out_invoice", invoice_date=invoice_date, products=self.product_a
+            )
+            invoice.currency_id = self.usd_currency
+            invoices |= invoice
+        self.assertEqual(invoices.mapped("l10n_ro_currency_rate"), [2, 2, 4])
+
+        self.env["res.currency.rate"].search(
+            [("currency_id", "=", self.usd_currency.id), ("name", "=", date_from)]
+        ).rate = 0.2
+        self.env["account.move"]._l10n_ro_recompute_currency_rate(
+            [("id", "in", invoices.ids)], batch_size=2
+        )
+        self.assertEqual(invoices.mapped("l10n_ro_currency_rate"), [5, 5, 4])
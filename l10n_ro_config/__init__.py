@@ -1,3 +1,4 @@
 from . import models
+from . import tools
 from .init_hook import pre_init_hook
 from . import controllers
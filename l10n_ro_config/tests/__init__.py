@@ -1,2 +1,3 @@
 from . import test_bank_account_print_report
 from . import test_partner_country_code
+from . import test_http_client
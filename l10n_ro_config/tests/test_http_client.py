@@ -0,0 +1,109 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import requests
+from urllib3.exceptions import ProtocolError
+
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+
+from odoo.addons.l10n_ro_config.tools import http_client
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    statuses = []
+
+    def do_GET(self):
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = b"ok"
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_POST = do_GET
+
+    def log_message(self, format, *args):
+        return
+
+
+@tagged("post_install", "-at_install")
+class TestHttpClient(BaseCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.url = "http://127.0.0.1:%s/test" % cls.server.server_address[1]
+        cls.host = "http://127.0.0.1:%s" % cls.server.server_address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        http_client.reset_metrics()
+        FakeHandler.statuses = []
+        patcher = mock.patch.object(http_client, "RETRY_BACKOFF", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_session_reused(self):
+        self.assertIs(
+            http_client.get_session(self.url),
+            http_client.get_session(self.host + "/other"),
+        )
+        response = http_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        metrics = http_client.get_metrics()[self.host]
+        self.assertEqual(metrics["requests"], 1)
+        self.assertEqual(metrics["errors"], 0)
+
+    def test_retry_get(self):
+        FakeHandler.statuses = [503, 200]
+        response = http_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        metrics = http_client.get_metrics()[self.host]
+        self.assertEqual(metrics["requests"], 2)
+        self.assertEqual(metrics["retries"], 1)
+
+    def test_no_retry_post(self):
+        FakeHandler.statuses = [503, 200]
+        response = http_client.post(self.url, data=b"test")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(http_client.get_metrics()[self.host]["errors"], 1)
+
+    def test_retry_status(self):
+        FakeHandler.statuses = [429, 503, 200]
+        response = http_client.post(
+            self.url, data=b"test", retries=2, retry_status=(429,)
+        )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(http_client.get_metrics()[self.host]["retries"], 1)
+
+    def test_retry_connect_error(self):
+        url = "http://127.0.0.1:1/test"
+        with self.assertRaises(requests.ConnectionError) as error:
+            http_client.post(url, retries=1, retry_errors=http_client.is_connect_error)
+        self.assertTrue(http_client.is_connect_error(error.exception))
+        self.assertEqual(http_client.get_metrics()["http://127.0.0.1:1"]["retries"], 1)
+        # the connection was lost after the request was sent
+        aborted = requests.ConnectionError(ProtocolError("Connection aborted."))
+        self.assertFalse(http_client.is_connect_error(aborted))
+        self.assertTrue(http_client.is_connect_error(requests.ConnectTimeout()))
+
+    def test_rate_limiter(self):
+        limiter = http_client.RateLimiter(50)
+        start = http_client.time.monotonic()
+        for _i in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(http_client.time.monotonic() - start, 0.09)
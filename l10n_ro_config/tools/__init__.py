@@ -0,0 +1 @@
+from . import http_client
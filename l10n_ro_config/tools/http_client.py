@@ -0,0 +1,171 @@
+# Copyright (C) 2024 NextERP Romania
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+"""Shared HTTP client used for the ANAF and BNR web services.
+
+Sessions are kept per thread and per host, so that consecutive calls to
+the same service reuse the pooled keep-alive connections instead of
+doing a new TCP + TLS handshake for every request.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+_logger = logging.getLogger(__name__)
+
+# (connect, read) timeout used when the caller doesn't give one
+DEFAULT_TIMEOUT = (10, 80)
+# Number of retries done for idempotent methods
+DEFAULT_RETRIES = 2
+RETRY_BACKOFF = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+POOL_MAXSIZE = 10
+
+_local = threading.local()
+_metrics_lock = threading.Lock()
+_metrics = defaultdict(
+    lambda: {"requests": 0, "errors": 0, "retries": 0, "time": 0.0, "max_time": 0.0}
+)
+
+
+def _get_host(url):
+    parts = urlsplit(url)
+    return "{}://{}".format(parts.scheme, parts.netloc)
+
+
+def get_session(url):
+    """Return the pooled session of the current thread for the url host."""
+    sessions = getattr(_local, "sessions", None)
+    if sessions is None:
+        sessions = _local.sessions = {}
+    host = _get_host(url)
+    session = sessions.get(host)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+        session.mount(host, adapter)
+        sessions[host] = session
+    return session
+
+
+def _record(host, elapsed, error=False, retry=False):
+    with _metrics_lock:
+        stats = _metrics[host]
+        stats["requests"] += 1
+        stats["time"] += elapsed
+        stats["max_time"] = max(stats["max_time"], elapsed)
+        if error:
+            stats["errors"] += 1
+        if retry:
+            stats["retries"] += 1
+
+
+def get_metrics():
+    """Return a copy of the latency and error counters, by host."""
+    with _metrics_lock:
+        return {host: dict(stats) for host, stats in _metrics.items()}
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def is_connect_error(error):
+    """Return True if the request failed before it was sent, because the
+    connection to the server could not be made. Such requests can be
+    retried even if they are not idempotent."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError) and error.args:
+        return isinstance(getattr(error.args[0], "reason", None), NewConnectionError)
+    return False
+
+
+def request(
+    method,
+    url,
+    timeout=None,
+    retries=None,
+    retry_status=RETRY_STATUS,
+    retry_errors=RETRY_ERRORS,
+    **kwargs
+):
+    """Send a request through the pooled session of the url host.
+
+    The errors from ``retry_errors`` (connection errors and timeouts by
+    default), which can also be a function telling if an error is retried,
+    and the statuses from ``retry_status`` are retried with an exponential
+    backoff with jitter. By default only the idempotent methods
+    are retried, pass ``retries`` to change that.
+    The last response is returned, or the last exception is raised.
+    """
+    method = method.upper()
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT
+    if retries is None:
+        retries = DEFAULT_RETRIES if method in IDEMPOTENT_METHODS else 0
+    host = _get_host(url)
+    session = get_session(url)
+    attempt = 0
+    while True:
+        start = time.monotonic()
+        try:
+            response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if isinstance(retry_errors, tuple):
+                can_retry = isinstance(e, retry_errors)
+            else:
+                can_retry = retry_errors(e)
+            can_retry = can_retry and attempt < retries
+            _record(host, time.monotonic() - start, error=True, retry=can_retry)
+            if not can_retry:
+                raise
+            _logger.info("Retrying %s %s after error: %s", method, url, e)
+        else:
+            failed = response.status_code >= 400
+            can_retry = response.status_code in retry_status and attempt < retries
+            _record(host, time.monotonic() - start, error=failed, retry=can_retry)
+            if not can_retry:
+                return response
+            _logger.info(
+                "Retrying %s %s after status %s", method, url, response.status_code
+            )
+        time.sleep(RETRY_BACKOFF * 2**attempt + random.uniform(0, RETRY_BACKOFF))
+        attempt += 1
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+class RateLimiter(object):
+    """Limit the requests done by several threads to ``rate`` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
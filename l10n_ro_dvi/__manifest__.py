@@ -3,7 +3,7 @@
 {
     "name": "Romania - DVI",
     "license": "AGPL-3",
-    "version": "14.0.1.13.0",
+    "version": "14.0.1.14.0",
     "author": "Terrabit," "NextERP Romania," "Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/l10n-romania",
     "category": "Localization",
@@ -1,6 +1,7 @@
 # Copyright (C) 2022 NextERP Romania
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html)
 
+from collections import defaultdict
 
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError, ValidationError
@@ -177,33 +178,56 @@ class AccountInvoiceDVI(models.Model):
     def write(self, vals):
         res = super().write(vals)
         if vals.get("invoice_ids"):
-            for dvi in self:
-                new_lines = []
-                if dvi.line_ids:
-                    dvi.line_ids.unlink()
-                for invoice in dvi.invoice_ids:
-                    invoice_lines = invoice.invoice_line_ids.filtered(
-                        lambda line: not line.display_type
-                        and (
-                            line.product_id.type == "product"
-                            or line.is_landed_costs_line is True
-                        )
-                    )
-                    for inv_line in invoice_lines:
-                        new_lines.append(
-                            (
-                                0,
-                                0,
-                                {
-                                    "dvi_id": dvi.id,
-                                    "invoice_id": invoice.id,
-                                    "invoice_line_id": inv_line.id,
-                                },
-                            )
-                        )
-                dvi.line_ids = new_lines
+            self._l10n_ro_update_lines()
         return res
 
+    @api.model
+    def _l10n_ro_get_invoice_lines(self, invoices):
+        """Return the stockable and landed costs lines of the invoices,
+        by invoice, read with a single search"""
+        lines_by_invoice = defaultdict(list)
+        if not invoices:
+            return lines_by_invoice
+        invoice_lines = self.env["account.move.line"].search(
+            [
+                ("move_id", "in", invoices.ids),
+                ("exclude_from_invoice_tab", "=", False),
+                ("display_type", "=", False),
+                "|",
+                ("product_id.type", "=", "product"),
+                ("is_landed_costs_line", "=", True),
+            ],
+            order="sequence, id",
+        )
+        for inv_line in invoice_lines:
+            lines_by_invoice[inv_line.move_id.id].append(inv_line.id)
+        return lines_by_invoice
+
+    def _l10n_ro_update_lines(self):
+        """Keep the DVI lines in sync with the invoices: the lines of the
+        removed invoices are deleted, the lines of the new invoices are
+        created and the other lines are kept with their DVI quantity."""
+        lines_by_invoice = self._l10n_ro_get_invoice_lines(self.invoice_ids)
+        to_unlink = self.env["l10n.ro.account.dvi.line"]
+        new_lines = []
+        for dvi in self:
+            existing = {line.invoice_line_id.id: line for line in dvi.line_ids}
+            for invoice in dvi.invoice_ids:
+                for inv_line_id in lines_by_invoice[invoice.id]:
+                    if existing.pop(inv_line_id, False):
+                        continue
+                    new_lines.append(
+                        {
+                            "dvi_id": dvi.id,
+                            "invoice_id": invoice.id,
+                            "invoice_line_id": inv_line_id,
+                        }
+                    )
+            for line in existing.values():
+                to_unlink |= line
+        to_unlink.unlink()
+        self.env["l10n.ro.account.dvi.line"].create(new_lines)
+
     def create_account_move_dvi(self):
         account1 = (
             self.vat_price_difference_product_id.product_tmpl_id.get_product_accounts()[
@@ -253,59 +277,49 @@ class AccountInvoiceDVI(models.Model):
             }
         return vals
 
-    @api.model
-    def create(self, vals):
-        dvi = super().create(vals)
-        if vals.get("invoice_ids"):
-            new_lines = []
-            if dvi.line_ids:
-                dvi.line_ids.unlink()
-            for invoice in dvi.invoice_ids:
-                invoice_lines = invoice.invoice_line_ids.filtered(
-                    lambda line: not line.display_type
-                    and (
-                        line.product_id.type == "product"
-                        or line.is_landed_costs_line is True
-                    )
-                )
-                for inv_line in invoice_lines:
-                    new_lines.append(
-                        (
-                            0,
-                            0,
-                            {
-                                "dvi_id": dvi.id,
-                                "invoice_id": invoice.id,
-                                "invoice_line_id": inv_line.id,
-                            },
-                        )
-                    )
-            dvi.line_ids = new_lines
-        return dvi
+    @api.model_create_multi
+    def create(self, vals_list):
+        dvis = super().create(vals_list)
+        dvis.filtered("invoice_ids")._l10n_ro_update_lines()
+        return dvis
 
     def button_post(self):
-        self.ensure_one()
-        if self.state != "draft":
+        if any(dvi.state != "draft" for dvi in self):
             raise ValidationError(_("You can only post DVI from 'draft' state."))
 
-        values = self.prepare_dvi_landed_cost_values()
-        landed_cost = self.env["stock.landed.cost"].create(values)
+        landed_costs = self.env["stock.landed.cost"].create(
+            [dvi.prepare_dvi_landed_cost_values() for dvi in self]
+        )
         action = self.env.ref("stock_landed_costs.action_stock_landed_cost")
         action = action.read()[0]
 
-        if self.vat_price_difference_product_id and self.vat_price_difference:
-            values_move = self.create_account_move_dvi()
+        move_dvis = self.filtered(
+            lambda dvi: dvi.vat_price_difference_product_id and dvi.vat_price_difference
+        )
+        values_moves = [dvi.create_account_move_dvi() for dvi in move_dvis]
+        for storno in (False, True):
+            dvis = self.browse()
+            moves_vals = []
+            for dvi, values_move in zip(move_dvis, values_moves):
+                if (dvi.vat_price_difference < 0) == storno:
+                    dvis |= dvi
+                    moves_vals.append(values_move)
+            if not moves_vals:
+                continue
             move_object = self.env["account.move"]
-            if self.vat_price_difference < 0:
+            if storno:
                 move_object = move_object.with_context(is_dvi_storno=True)
-            move = move_object.create(values_move)
-
-            move.action_post()
-            self.vat_price_difference_move_id = move.id
-
-        action["views"] = [(False, "form")]
-        action["res_id"] = landed_cost.id
-        self.state = "posted"
+            moves = move_object.create(moves_vals)
+            moves.action_post()
+            for dvi, move in zip(dvis, moves):
+                dvi.vat_price_difference_move_id = move.id
+
+        if len(landed_costs) == 1:
+            action["views"] = [(False, "form")]
+            action["res_id"] = landed_costs.id
+        else:
+            action["domain"] = [("id", "in", landed_costs.ids)]
+        self.write({"state": "posted"})
         return action
 
     def button_reverse(self):
@@ -361,14 +375,9 @@ class AccountInvoiceDVI(models.Model):
         return values
 
     def prepare_dvi_landed_cost_vals(self):
-        pickings = self.env["stock.picking"]
-
-        for line in self.line_ids:
-            pickings |= (
-                line.invoice_line_id.purchase_line_id.order_id.picking_ids.filtered(
-                    lambda p: p.state == "done"
-                )
-            )
+        pickings = self.line_ids.mapped(
+            "invoice_line_id.purchase_line_id.order_id.picking_ids"
+        ).filtered(lambda p: p.state == "done")
         return {
             "date": self.date,
             "l10n_ro_cost_type": "dvi",
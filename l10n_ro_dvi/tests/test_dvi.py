@@ -105,6 +105,57 @@ class TestDVI(TestStockCommon2):
         self.assertEqual(revert_lc.l10n_ro_dvi_bill_ids, dvi.invoice_ids)
         self.assertEqual(lc.account_move_id.state, "cancel")
 
+    def test_dvi_lines_update(self):
+        self.create_po()
+        self.create_invoice()
+        invoice_1 = self.invoice
+        self.create_po()
+        self.create_invoice()
+        invoice_2 = self.invoice
+        dvi_vals = {
+            "name": "DVI test",
+            "tax_id": self.tax_id.id,
+            "journal_id": self.journal_id.id,
+            "customs_duty_value": 100,
+            "customs_commission_value": 50,
+        }
+        dvis = self.env["l10n.ro.account.dvi"].create(
+            [
+                dict(dvi_vals, invoice_ids=[(6, 0, invoice_1.ids)]),
+                dict(dvi_vals, invoice_ids=[(6, 0, invoice_2.ids)]),
+            ]
+        )
+        dvi = dvis[0]
+        self.assertEqual(
+            dvi.line_ids.invoice_line_id,
+            invoice_1.invoice_line_ids.filtered(
+                lambda line: line.product_id.type == "product"
+            ),
+        )
+        for dvi_line in dvi.line_ids:
+            dvi_line.line_qty = dvi_line.qty
+        lines_1 = dvi.line_ids
+
+        # the lines of the kept invoice are not recreated
+        dvi.invoice_ids = [(4, invoice_2.id)]
+        self.assertEqual(dvi.line_ids.invoice_id, invoice_1 | invoice_2)
+        self.assertEqual(dvi.line_ids & lines_1, lines_1)
+        for dvi_line in lines_1:
+            self.assertEqual(dvi_line.line_qty, dvi_line.qty)
+
+        dvi.invoice_ids = [(3, invoice_1.id)]
+        self.assertFalse(lines_1.exists())
+        self.assertEqual(dvi.line_ids.invoice_id, invoice_2)
+
+        dvis.button_post()
+        self.assertEqual(set(dvis.mapped("state")), {"posted"})
+        self.assertEqual(len(dvis.landed_cost_ids), 2)
+        for dvi in dvis:
+            self.assertEqual(dvi.landed_cost_ids.l10n_ro_account_dvi_id, dvi)
+            self.assertEqual(
+                dvi.landed_cost_ids.l10n_ro_base_tax_value, dvi.total_base_tax_value
+            )
+
     def test_vat_price_difference(self):
         # pentru valoare pozitiva
         self.create_po()
@@ -5,10 +5,10 @@
 import logging
 import time
 
-import requests
-
 from odoo import api, fields, models
 
+from odoo.addons.l10n_ro_config.tools import http_client
+
 _logger = logging.getLogger(__name__)
 
 CEDILLATRANS = bytes.maketrans(
@@ -48,7 +48,9 @@ class ResPartner(models.Model):
                 if item:
                     anaf_ask.append({"cui": int(item), "data": check_date})
             try:
-                res = requests.post(ANAF_BULK_URL, json=anaf_ask, headers=headers)
+                res = http_client.post(
+                    ANAF_BULK_URL, json=anaf_ask, headers=headers, retries=2
+                )
                 if res.status_code == 200:
                     result = {}
                     try:
@@ -59,7 +61,7 @@ class ResPartner(models.Model):
                         time.sleep(3)
                         resp = False
                         try:
-                            resp = requests.get(ANAF_CORR % result["correlationId"])
+                            resp = http_client.get(ANAF_CORR % result["correlationId"])
                         except Exception as e:
                             _logger.warning("ANAF sync not working: %s" % e)
                         if resp and resp.status_code == 200:
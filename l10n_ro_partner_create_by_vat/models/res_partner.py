@@ -4,10 +4,10 @@
 
 import logging
 
-import requests
-
 from odoo import _, api, fields, models
 
+from odoo.addons.l10n_ro_config.tools import http_client
+
 _logger = logging.getLogger(__name__)
 
 CEDILLATRANS = bytes.maketrans(
@@ -170,7 +170,7 @@ class ResPartner(models.Model):
             json_data = [{"cui": cod, "data": data}]
         try:
 
-            res = requests.post(anaf_url, json=json_data, headers=headers)
+            res = http_client.post(anaf_url, json=json_data, headers=headers, retries=2)
         except Exception as ex:
             return _("ANAF Webservice not working. Exception=%s.") % ex, {}
 
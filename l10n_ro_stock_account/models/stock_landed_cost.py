@@ -41,10 +41,93 @@ class StockLandedCost(models.Model):
             "company_id": self.company_id.id,
         }
 
-    def l10n_ro_create_valuation_layer(self, line, linked_layer, amount):
-        vals = self._prepare_landed_cost_svl_vals(line, linked_layer, amount)
-        valuation_layer = self.env["stock.valuation.layer"].create(vals)
-        return valuation_layer
+    def _l10n_ro_get_landed_cost_allocation(self):
+        """Split the additional cost of the adjustment lines on the valuation
+        layers of their moves and on the layers of the quantities already
+        out, for all the lines at once.
+
+        Return a list of (line, layer, origin, amount, svl_type, date)
+        tuples, one for every layer to create: the adjustment line, the
+        linked layer, the reception layer whose remaining value is updated,
+        the amount, the layer type (in or out) and the accounting date."""
+        self.ensure_one()
+        allocation = []
+        adjustment_lines = self.valuation_adjustment_lines.filtered("move_id")
+        # read the layers of all the moves, and of their quantities out,
+        # with one query each
+        adjustment_lines.mapped(
+            "move_id.stock_valuation_layer_ids.l10n_ro_svl_dest_ids"
+        )
+
+        for line in adjustment_lines:
+            quantity_done = line.move_id.quantity_done
+            for svl in line.move_id.stock_valuation_layer_ids:
+                if svl.quantity == 0:
+                    continue
+                cost_to_add = svl.quantity / quantity_done * line.additional_landed_cost
+                allocation.append((line, svl, svl, cost_to_add, "in", self.date))
+                for svl_out in svl.l10n_ro_svl_dest_ids:
+                    if svl_out.quantity == 0:
+                        continue
+                    allocation.append(
+                        (
+                            line,
+                            svl_out,
+                            svl,
+                            svl_out.quantity / svl.quantity * cost_to_add,
+                            "out",
+                            fields.Date.to_date(svl_out.create_date),
+                        )
+                    )
+        return allocation
+
+    def _l10n_ro_create_landed_cost_moves(self, allocation, valuation_layers):
+        """Create the accounting entries of the new valuation layers, one
+        move for every cost line and accounting date.
+
+        The amounts of an adjustment line are summed by layer type, so the
+        move has two journal items by product and not two by layer."""
+        self.ensure_one()
+        groups = defaultdict(
+            lambda: defaultdict(lambda: [self.env["stock.valuation.layer"], 0.0])
+        )
+        for (line, _layer, _origin, amount, svl_type, date), valuation_layer in zip(
+            allocation, valuation_layers
+        ):
+            # Products with manual inventory valuation are ignored because
+            # they do not need to create journal entries.
+            if line.move_id.product_id.valuation != "real_time":
+                continue
+            entry = groups[(line.cost_line_id, date)][(line, svl_type)]
+            entry[0] |= valuation_layer
+            entry[1] += self.currency_id.round(amount)
+
+        moves_vals = []
+        moves_layers = []
+        for (_cost_line, date), entries in groups.items():
+            move_vals = {
+                "journal_id": self.account_journal_id.id,
+                "date": date,
+                "ref": self.name,
+                "line_ids": [],
+                "move_type": "entry",
+            }
+            layers = self.env["stock.valuation.layer"]
+            for (line, svl_type), (entry_layers, amount) in entries.items():
+                amls = line._l10n_ro_prepare_accounting_entries(
+                    entry_layers, move_vals, amount, svl_type=svl_type
+                )
+                if amls:
+                    move_vals["line_ids"] += amls
+                    layers |= entry_layers
+            if move_vals["line_ids"]:
+                moves_vals.append(move_vals)
+                moves_layers.append(layers)
+        moves = self.env["account.move"].create(moves_vals)
+        for move, layers in zip(moves, moves_layers):
+            layers.write({"account_move_id": move.id})
+        moves._post()
+        return moves
 
     def button_validate(self):
         # Overwrite method for Romania to extract stock valuation layer
@@ -67,86 +150,29 @@ class StockLandedCost(models.Model):
 
         for cost in self:
             cost = cost.with_company(cost.company_id)
-            move = self.env["account.move"]
-            move_vals = {
-                "journal_id": cost.account_journal_id.id,
-                "date": cost.date,
-                "ref": cost.name,
-                "line_ids": [],
-                "move_type": "entry",
-            }
-            valuation_layer_ids = []
+            allocation = cost._l10n_ro_get_landed_cost_allocation()
+            empty_line = self.env["stock.valuation.adjustment.lines"]
+            valuation_layers = self.env["stock.valuation.layer"].create(
+                [
+                    cost._prepare_landed_cost_svl_vals(
+                        line if svl_type == "in" else empty_line, layer, amount
+                    )
+                    for line, layer, _origin, amount, svl_type, _date in allocation
+                ]
+            )
+
+            remaining_values = defaultdict(lambda: 0.0)
             cost_to_add_byproduct = defaultdict(lambda: 0.0)
-            for line in cost.valuation_adjustment_lines.filtered(
-                lambda line: line.move_id
-            ):
-                # Add distributed cost for each stock valuation layer.
+            for line, _layer, origin, amount, _svl_type, _date in allocation:
+                remaining_values[origin] += amount
                 product = line.move_id.product_id
-                for svl in line.move_id.stock_valuation_layer_ids.filtered(
-                    lambda s: s.quantity != 0
-                ):
+                if product.cost_method == "average":
+                    cost_to_add_byproduct[product] += amount
+            for svl, amount in remaining_values.items():
+                svl.remaining_value += amount
+
+            cost._l10n_ro_create_landed_cost_moves(allocation, valuation_layers)
 
-                    cost_to_add = (
-                        svl.quantity / line.move_id.quantity_done
-                    ) * line.additional_landed_cost
-                    valuation_layer = cost.l10n_ro_create_valuation_layer(
-                        line, svl, cost_to_add
-                    )
-                    svl.remaining_value += cost_to_add
-                    valuation_layer_ids.append(valuation_layer.id)
-                    if product.cost_method == "average":
-                        cost_to_add_byproduct[product] += cost_to_add
-                    # Create separate account move for each svl
-                    if product.valuation == "real_time":
-                        svl_move_vals = move_vals
-                        amls = line._l10n_ro_prepare_accounting_entries(
-                            valuation_layer, svl_move_vals, cost_to_add, svl_type="in"
-                        )
-                        if amls:
-                            svl_move_vals["line_ids"] = amls
-                            svl_move = move.create(svl_move_vals)
-                            valuation_layer.update({"account_move_id": svl_move.id})
-                            svl_move._post()
-
-                    # Add separate svl for each quantity out
-                    for svl_out in svl.l10n_ro_svl_dest_ids.filtered(
-                        lambda s: s.quantity != 0
-                    ):
-                        out_cost_to_add = (
-                            svl_out.quantity / svl.quantity
-                        ) * cost_to_add
-                        valuation_layer_out = cost.l10n_ro_create_valuation_layer(
-                            self.env["stock.valuation.adjustment.lines"],
-                            svl_out,
-                            out_cost_to_add,
-                        )
-                        svl.remaining_value += out_cost_to_add
-                        valuation_layer_ids.append(valuation_layer_out.id)
-
-                        if product.cost_method == "average":
-                            cost_to_add_byproduct[product] += out_cost_to_add
-                        # Create separate account move for each put svl
-                        if product.valuation == "real_time":
-                            move_vals.update(date=svl_out.create_date)
-                            svl_move_vals = move_vals
-                            amls = line._l10n_ro_prepare_accounting_entries(
-                                valuation_layer_out,
-                                svl_move_vals,
-                                out_cost_to_add,
-                                svl_type="out",
-                            )
-                            if amls:
-                                svl_move_vals["line_ids"] = amls
-                                svl_move = move.create(svl_move_vals)
-                                valuation_layer_out.update(
-                                    {"account_move_id": svl_move.id}
-                                )
-                                svl_move._post()
-
-                # Products with manual inventory valuation are ignored because
-                # they do not need to create journal entries.
-                if product.valuation != "real_time":
-                    continue
             # batch standard price computation avoid recompute quantity_svl at each iteration
             products = self.env["product.product"].browse(
                 p.id for p in cost_to_add_byproduct.keys()
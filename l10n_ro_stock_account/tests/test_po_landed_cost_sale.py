@@ -95,3 +95,23 @@ class TestStockLandedCostSale(TestStockCommon):
         self.assertEqual(svls_out_p2.value, p2_out_final)
         svls_out_p2._compute_l10n_ro_svl_tracking()
         self.assertEqual(svls_out_p2.l10n_ro_svl_src_ids, svls_in_p2)
+
+    def test_lc_one_move_per_cost_line(self):
+        po = self.create_po()
+        income_ship = po.picking_ids
+        landed_cost = self.create_lc(income_ship, 10, 10)
+
+        layers = landed_cost.stock_valuation_layer_ids
+        self.assertEqual(len(layers), 2)
+        self.assertEqual(sum(layers.mapped("value")), 20)
+        self.assertEqual(layers.stock_move_id, income_ship.move_lines)
+        moves = layers.account_move_id
+        self.assertEqual(len(moves), 1)
+        self.assertEqual(moves.state, "posted")
+        self.assertEqual(moves.date, landed_cost.date)
+        self.assertEqual(sum(moves.line_ids.mapped("debit")), 20)
+        for move_line in income_ship.move_lines:
+            svl_in = move_line.stock_valuation_layer_ids.filtered("quantity")
+            self.assertEqual(
+                svl_in.remaining_value, svl_in.quantity * svl_in.unit_cost + 10
+            )
@@ -11,7 +11,7 @@
     ],
     "depends": ["l10n_ro_config"],
     "license": "AGPL-3",
-    "version": "14.0.4.9.0",
+    "version": "14.0.4.10.0",
     "author": "NextERP Romania,"
     "Forest and Biomass Romania,"
     "Odoo Community Association (OCA)",
@@ -15,19 +15,26 @@ class ResPartner(models.Model):
 
     @api.depends("l10n_ro_vat_number")
     def _compute_l10n_ro_anaf_history(self):
+        vat_numbers = {p.l10n_ro_vat_number for p in self if p.l10n_ro_vat_number}
+        history_by_vat = {}
+        if vat_numbers:
+            history = self.env["l10n.ro.res.partner.anaf"].search(
+                [("vat", "in", list(vat_numbers))]
+            )
+            for line in history:
+                history_by_vat.setdefault(line.vat, []).append(line.id)
         for partner in self:
-            if partner.l10n_ro_vat_number:
-                history = self.env["l10n.ro.res.partner.anaf"].search(
-                    [("vat", "=", partner.l10n_ro_vat_number)]
-                )
-                partner.l10n_ro_anaf_history = [(6, 0, [line.id for line in history])]
-            else:
-                partner.l10n_ro_anaf_history = [(6, 0, [])]
+            line_ids = history_by_vat.get(partner.l10n_ro_vat_number, [])
+            partner.l10n_ro_anaf_history = [(6, 0, line_ids)]
 
     l10n_ro_vat_on_payment = fields.Boolean(string="Romania - VAT on Payment")
-    l10n_ro_anaf_history = fields.One2many(
+    l10n_ro_anaf_history = fields.Many2many(
         "l10n.ro.res.partner.anaf",
+        "l10n_ro_res_partner_anaf_history_rel",
+        "partner_id",
+        "anaf_id",
         compute="_compute_l10n_ro_anaf_history",
+        store=True,
         string="Romania - ANAF History",
         readonly=True,
     )
@@ -77,12 +84,11 @@ class ResPartner(models.Model):
         ctx = dict(self._context)
         vat_on_payment = False
         self._insert_relevant_anaf_data()
-        self._compute_l10n_ro_anaf_history()
         if self.l10n_ro_anaf_history:
             if ctx.get("check_date", False):
                 line = self.env["l10n.ro.res.partner.anaf"].search(
                     [
-                        ("id", "in", [rec.id for rec in self.l10n_ro_anaf_history]),
+                        ("vat", "=", self.l10n_ro_vat_number),
                         ("start_date", "<=", ctx["check_date"]),
                     ],
                     limit=1,
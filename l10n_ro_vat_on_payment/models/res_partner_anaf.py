@@ -11,6 +11,8 @@ import requests
 
 from odoo import api, fields, models, tools
 
+from odoo.addons.l10n_ro_config.tools import http_client
+
 ANAF_URL = "http://static.anaf.ro/static/10/Anaf/TVA_incasare/ultim_%s.zip"
 
 
@@ -29,6 +31,48 @@ class ResPartnerAnaf(models.Model):
         [("I", "Register"), ("E", "Fix error"), ("D", "Removal")],
     )
 
+    def init(self):
+        """Composite index used by the date range lookups done on invoices"""
+        tools.create_index(
+            self._cr,
+            "l10n_ro_res_partner_anaf_vat_dates_index",
+            self._table,
+            ["vat", "start_date", "end_date"],
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._l10n_ro_recompute_partner_history()
+        return records
+
+    def write(self, vals):
+        if "vat" in vals:
+            self._l10n_ro_recompute_partner_history()
+        res = super().write(vals)
+        if "vat" in vals:
+            self._l10n_ro_recompute_partner_history()
+        return res
+
+    def unlink(self):
+        self._l10n_ro_recompute_partner_history()
+        return super().unlink()
+
+    def _l10n_ro_recompute_partner_history(self):
+        """Mark the partners with the same VAT number for the recompute
+        of the stored ANAF history relation."""
+        vat_numbers = list({rec.vat for rec in self if rec.vat})
+        if not vat_numbers:
+            return
+        partner_obj = self.env["res.partner"]
+        partners = partner_obj.with_context(active_test=False).search(
+            [("l10n_ro_vat_number", "in", vat_numbers)]
+        )
+        if partners:
+            self.env.add_to_compute(
+                partner_obj._fields["l10n_ro_anaf_history"], partners
+            )
+
     @api.model
     def download_anaf_data(self, file_date=None):
         """Download VAT on Payment data from ANAF if the file
@@ -43,7 +87,7 @@ class ResPartnerAnaf(models.Model):
         if not file_date:
             file_date = date.today()
         if bool(file_date - modify):
-            result = requests.get(ANAF_URL % file_date.strftime("%Y%m%d"))
+            result = http_client.get(ANAF_URL % file_date.strftime("%Y%m%d"))
             if result.status_code == requests.codes.ok:
                 files = ZipFile(BytesIO(result.content))
                 files.extractall(path=str(data_dir))
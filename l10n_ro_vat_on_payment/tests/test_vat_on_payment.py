@@ -143,6 +143,22 @@ class TestVATonpayment(AccountTestInvoicingCommon):
             _logger.warning("Server ANAF is down.")
             return True
 
+    def test_anaf_history_stored(self):
+        """Test the stored ANAF history relation follows the registry rows."""
+        self.assertFalse(self.lxt_partner.l10n_ro_anaf_history)
+        line = self.partner_anaf_model.create(
+            {
+                "anaf_id": "999999991",
+                "vat": self.lxt_partner.l10n_ro_vat_number,
+                "start_date": date(2013, 1, 1),
+                "operation_type": "I",
+            }
+        )
+        self.assertEqual(self.lxt_partner.l10n_ro_anaf_history, line)
+        self.assertFalse(self.fbr_partner.l10n_ro_anaf_history)
+        line.unlink()
+        self.assertFalse(self.lxt_partner.l10n_ro_anaf_history)
+
     def test_invoice_fp(self):
         """Test download file and partner link."""
         if not self.invoice.partner_id.l10n_ro_vat_on_payment: